@@ -0,0 +1,49 @@
+from django.contrib.auth import get_user_model
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+
+class AsyncJWTAuthentication(JWTAuthentication):
+    """
+    JWT-аутентификация для async-представлений: те же проверки, что у JWTAuthentication,
+    но пользователь читается через async ORM.
+    """
+
+    async def aauthenticate(self, request):
+        """
+        Returns:
+            User или None, если заголовка Authorization нет
+
+        Raises:
+            InvalidToken, AuthenticationFailed: как JWTAuthentication.authenticate
+        """
+        header = self.get_header(request)
+        if header is None:
+            return None
+        raw_token = self.get_raw_token(header)
+        if raw_token is None:
+            return None
+        return await self.aget_user(self.get_validated_token(raw_token))
+
+    async def aget_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_("Token contained no recognizable user identification"))
+
+        try:
+            user = await get_user_model().objects.aget(**{api_settings.USER_ID_FIELD: user_id})
+        except get_user_model().DoesNotExist:
+            raise AuthenticationFailed(_("User not found"), code="user_not_found")
+
+        if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+
+        if api_settings.CHECK_REVOKE_TOKEN and \
+                validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != get_md5_hash_password(user.password):
+            raise AuthenticationFailed(_("The user's password has been changed."), code="password_changed")
+
+        return user
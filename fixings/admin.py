@@ -1,6 +1,7 @@
 from django.contrib import admin
 
-from .models import Currency, Index, Fixing, CurrencyUSDFixing
+from .models import Currency, Index, Fixing, CurrencyUSDFixing, IndexPriceSnapshot, CurrencyPriceSnapshot, \
+    IngestionJob, MarketDataState, IndexBars
 
 
 @admin.register(Currency)
@@ -21,7 +22,36 @@ class FixingAdmin(admin.ModelAdmin):
     search_fields = ["indexId__indexName"]
 
 
+@admin.register(IndexBars)
+class IndexBarsAdmin(admin.ModelAdmin):
+    list_display = ["indexId", "month", "currencyId"]
+    search_fields = ["indexId__indexName"]
+
+
 @admin.register(CurrencyUSDFixing)
 class CurrencyUSDFixingAdmin(admin.ModelAdmin):
     list_display = ["currencyId", "currencyFixingDate", "valueUSD"]
     search_fields = ["currencyId__currency"]
+
+
+@admin.register(IndexPriceSnapshot)
+class IndexPriceSnapshotAdmin(admin.ModelAdmin):
+    list_display = ["indexId", "currencyId", "snapshotDate", "currentConvertedPrice", "monthlyDynamic"]
+    search_fields = ["indexId__indexName"]
+
+
+@admin.register(CurrencyPriceSnapshot)
+class CurrencyPriceSnapshotAdmin(admin.ModelAdmin):
+    list_display = ["currencyId", "quoteCurrencyId", "snapshotDate", "currentConvertedPrice", "monthlyDynamic"]
+    search_fields = ["currencyId__currency"]
+
+
+@admin.register(IngestionJob)
+class IngestionJobAdmin(admin.ModelAdmin):
+    list_display = ["id", "status", "createdAt", "finishedAt", "countIndexes", "countCurrencies"]
+    list_filter = ["status"]
+
+
+@admin.register(MarketDataState)
+class MarketDataStateAdmin(admin.ModelAdmin):
+    list_display = ["latestFixingDate", "latestCurrencyFixingDate", "fixingsCount", "lastIngestionAt"]
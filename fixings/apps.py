@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class FixingsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'fixings'
+
+    def ready(self):
+        from . import signals  # noqa: F401
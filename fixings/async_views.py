@@ -0,0 +1,61 @@
+from asgiref.sync import sync_to_async
+from rest_framework.request import Request
+
+from market_vision_backend.async_views import AsyncAPIView, apaginate, json_response
+from .caching import acached_response
+from .registry import currency_registry
+from .serializers import CurrencySerializer
+from .snapshots import has_fresh_snapshot
+from .state import get_market_data_state
+from .views import GetCurrenciesListView, GetIndexesListView, LastUpdatePaginator
+
+
+class AsyncSnapshotListView(AsyncAPIView):
+    """
+    Async-вариант списка со снимками цен: тот же ответ, что у list_view, и общий с ним кэш ответов.
+
+    Справочник валют и состояние данных берутся из памяти процесса одним вызовом в потоке;
+    количество и строки страницы читаются через async ORM, а сериализация строк со снимком за сегодня
+    не обращается ни к базе, ни к движкам цен и выполняется прямо в цикле событий.
+    """
+
+    list_view = None
+
+    def prepare(self, request):
+        view = self.list_view()
+        view.request = Request(request)
+        view.format_kwarg = None
+        queryset = view.filter_queryset(view.get_queryset())
+
+        currency = request.GET.get("currency", "USD")
+        return view, queryset, {
+            "lastUpdate": get_market_data_state().latestFixingDate,
+            "pageSize": LastUpdatePaginator.page_size,
+            "currency": CurrencySerializer(currency_registry.get(currency)).data,
+        }
+
+    @acached_response
+    async def get(self, request):
+        view, queryset, extra = await sync_to_async(self.prepare)(request)
+        page = await apaginate(request, queryset, LastUpdatePaginator.page_size)
+
+        currency = request.GET.get("currency", "USD")
+        rows = page["results"]
+        if all(has_fresh_snapshot(item) for item in rows):
+            page["results"] = view.get_serializer(rows, many=True, context={"currency": currency}).data
+        else:
+            # Без снимка цены считают движки, которым может понадобиться база; пересборка снимков — в фоне
+            page["results"] = await sync_to_async(
+                lambda: view.get_serializer(rows, many=True, context=view.page_context(rows, currency)).data
+            )()
+
+        page.update(extra)
+        return json_response(page)
+
+
+class AsyncCurrenciesListView(AsyncSnapshotListView):
+    list_view = GetCurrenciesListView
+
+
+class AsyncIndexesListView(AsyncSnapshotListView):
+    list_view = GetIndexesListView
@@ -0,0 +1,142 @@
+import datetime
+
+import numpy as np
+
+from .models import IndexBars
+
+
+class Bars:
+    """Дневные OHLCV бумаги: даты datetime64[D] и колонки float64 одной длины"""
+
+    __slots__ = ("dates",) + IndexBars.FIELDS
+
+    def __init__(self, dates, values):
+        self.dates = dates
+        for field, column in zip(IndexBars.FIELDS, values):
+            setattr(self, field, column)
+
+    def __len__(self):
+        return len(self.dates)
+
+    @property
+    def values(self):
+        """Массив (5 × дней) в порядке IndexBars.FIELDS"""
+        return np.vstack([getattr(self, field) for field in IndexBars.FIELDS])
+
+
+def _empty():
+    return Bars(np.empty(0, dtype="datetime64[D]"), np.empty((len(IndexBars.FIELDS), 0)))
+
+
+def _month(date):
+    return np.datetime64(date, "M").astype("datetime64[D]").item()
+
+
+def get_bars(index_ids, start_date=None, end_date=None):
+    """
+    OHLCV набора бумаг за [start_date, end_date] одним запросом.
+
+    Returns:
+        dict: {id бумаги: Bars}; бумаги без данных получают пустые Bars
+    """
+    index_ids = list(index_ids)
+    queryset = IndexBars.objects.filter(indexId__in=index_ids)
+    if start_date is not None:
+        queryset = queryset.filter(month__gte=_month(start_date))
+    if end_date is not None:
+        queryset = queryset.filter(month__lte=_month(end_date))
+
+    parts = {index_id: [] for index_id in index_ids}
+    for index_id, month, days, values in queryset.order_by("indexId", "month").values_list(
+        "indexId", "month", "days", "values"
+    ):
+        parts[index_id].append((month, days, values))
+
+    result = {}
+    for index_id, months in parts.items():
+        if not months:
+            result[index_id] = _empty()
+            continue
+        dates, values = IndexBars.unpack_many(months)
+        mask = np.ones(len(dates), dtype=bool)
+        if start_date is not None:
+            mask &= dates >= np.datetime64(start_date, "D")
+        if end_date is not None:
+            mask &= dates <= np.datetime64(end_date, "D")
+        result[index_id] = Bars(dates[mask], values[:, mask])
+    return result
+
+
+def get_index_bars(index_id, start_date=None, end_date=None):
+    """OHLCV одной бумаги за [start_date, end_date], см. get_bars"""
+    return get_bars([index_id], start_date, end_date)[index_id]
+
+
+def save_bars(series, since=None, end_date=None, batch_size=500):
+    """
+    Записывает дневные OHLCV бумаг, пересобирая затронутые месяцы.
+
+    Дни из series заменяют сохранённые, остальные дни месяцев сохраняются. Если задан период
+    [since, end_date], сохранённые дни бумаги в нём, которых нет в series, удаляются (перезагрузка).
+
+    Args:
+        series: {id бумаги: (id валюты, даты datetime64[D], массив 5 × дней в порядке IndexBars.FIELDS)}
+        batch_size: Размер пакета upsert
+
+    Returns:
+        int: количество записанных дней
+    """
+    series = {index_id: item for index_id, item in series.items() if len(item[1])}
+    if not series:
+        return 0
+    if since is not None and end_date is None:
+        end_date = datetime.date.today()
+
+    first = min(dates.min() for _, dates, _ in series.values())
+    last = max(dates.max() for _, dates, _ in series.values())
+    if since is not None:
+        first = min(first, np.datetime64(since, "D"))
+        last = max(last, np.datetime64(end_date, "D"))
+    stored = IndexBars.objects.filter(
+        indexId__in=list(series), month__gte=_month(first), month__lte=_month(last)
+    ).order_by("indexId", "month").values_list("id", "indexId", "month", "days", "values")
+
+    existing = {}
+    for row_id, index_id, month, days, values in stored:
+        existing.setdefault(index_id, []).append((row_id, month, days, values))
+
+    rows, removed, written = [], [], 0
+    for index_id, (currency_id, dates, values) in series.items():
+        values = np.asarray(values, dtype=np.float64)
+        old = existing.get(index_id, [])
+        old_dates, old_values = IndexBars.unpack_many(row[1:] for row in old)
+
+        keep = ~np.isin(old_dates, dates)
+        if since is not None:
+            keep &= (old_dates < np.datetime64(since, "D")) | (old_dates > np.datetime64(end_date, "D"))
+        merged_dates = np.concatenate([old_dates[keep], dates])
+        merged_values = np.concatenate([old_values[:, keep], values], axis=1)
+        order = np.argsort(merged_dates, kind="stable")
+        merged_dates, merged_values = merged_dates[order], merged_values[:, order]
+        written += len(dates)
+
+        months = merged_dates.astype("datetime64[M]")
+        boundaries = np.flatnonzero(np.diff(months.astype(np.int64))) + 1
+        packed = set()
+        for chunk in np.split(np.arange(len(merged_dates)), boundaries):
+            month, days, packed_values = IndexBars.pack(merged_dates[chunk], merged_values[:, chunk])
+            packed.add(month)
+            rows.append(IndexBars(indexId_id=index_id, currencyId_id=currency_id, month=month, days=days,
+                                  values=packed_values))
+        removed += [row_id for row_id, month, _, _ in old if month not in packed]
+
+    if removed:
+        IndexBars.objects.filter(id__in=removed).delete()
+    IndexBars.objects.bulk_create(
+        rows,
+        batch_size=batch_size,
+        update_conflicts=True,
+        unique_fields=["indexId", "month"],
+        update_fields=["currencyId", "days", "values"],
+    )
+    return written
@@ -0,0 +1,165 @@
+import datetime
+import functools
+import hashlib
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils import timezone
+from django.utils.http import parse_etags, quote_etag
+
+_VERSION_KEY = "fixings:data-version"
+
+# Отметка изменения данных из MarketDataState: процессы с собственным кэшем (LocMemCache под gunicorn)
+# узнают о смене версии в другом процессе не позже, чем через RATE_ENGINE_REFRESH_SECONDS
+_marker_lock = threading.Lock()
+_marker = None
+_marker_checked_at = 0.0
+
+
+def _marker_expired():
+    return _marker is None or time.monotonic() - _marker_checked_at >= getattr(settings, "RATE_ENGINE_REFRESH_SECONDS", 60)
+
+
+def _set_marker(updated_at):
+    global _marker, _marker_checked_at
+
+    with _marker_lock:
+        _marker = 0 if updated_at is None else int(updated_at.timestamp() * 1_000_000)
+        _marker_checked_at = time.monotonic()
+        return _marker
+
+
+def _marker_queryset():
+    from .models import MarketDataState
+    from .state import STATE_ID
+
+    return MarketDataState.objects.filter(id=STATE_ID).values_list("updatedAt", flat=True)
+
+
+def get_data_marker():
+    """
+    Отметка изменения рыночных данных, общая для всех процессов: MarketDataState.updatedAt в микросекундах,
+    0 до первой загрузки. Перечитывается из базы не чаще раза в RATE_ENGINE_REFRESH_SECONDS.
+    """
+    return _set_marker(_marker_queryset().first()) if _marker_expired() else _marker
+
+
+async def aget_data_marker():
+    """get_data_marker для async-кода"""
+    return _set_marker(await _marker_queryset().afirst()) if _marker_expired() else _marker
+
+
+def get_data_version():
+    """
+    Текущая версия рыночных данных; меняется после каждой загрузки фиксингов и правок справочников.
+    Состоит из версии в кэше и отметки изменения MarketDataState (см. get_data_marker).
+    """
+    version = cache.get(_VERSION_KEY)
+    if version is None:
+        cache.add(_VERSION_KEY, uuid.uuid4().hex, timeout=None)
+        version = cache.get(_VERSION_KEY)
+    return f"{version}-{get_data_marker()}"
+
+
+async def aget_data_version():
+    """get_data_version для async-кода"""
+    version = await cache.aget(_VERSION_KEY)
+    if version is None:
+        await cache.aadd(_VERSION_KEY, uuid.uuid4().hex, timeout=None)
+        version = await cache.aget(_VERSION_KEY)
+    return f"{version}-{await aget_data_marker()}"
+
+
+def bump_data_version():
+    """Делает недействительными все закэшированные ответы по фиксингам, в том числе в других процессах"""
+    from .models import MarketDataState
+    from .state import STATE_ID
+
+    cache.set(_VERSION_KEY, uuid.uuid4().hex, timeout=None)
+    now = timezone.now()
+    # Строки состояния нет до первой загрузки: тогда версии других процессов сменятся вместе с ней
+    if MarketDataState.objects.filter(id=STATE_ID).update(updatedAt=now):
+        _set_marker(now)
+
+
+def _cache_key(request, version):
+    # async-представления отдают только JSON и работают с HttpRequest: ключи совпадают с DRF-представлениями
+    query = getattr(request, "query_params", request.GET)
+    params = sorted((key, value) for key in query for value in query.getlist(key))
+    renderer = getattr(request, "accepted_renderer", None)
+    raw = repr((request.path, params, getattr(renderer, "format", "json"), datetime.date.today().isoformat()))
+    return f"fixings:response:{version}:{hashlib.md5(raw.encode()).hexdigest()}"
+
+
+def _matches(request, etag):
+    etags = parse_etags(request.headers.get("If-None-Match", ""))
+    return "*" in etags or etag in etags
+
+
+def cached_response(handler):
+    """
+    Кэширует ответ обработчика DRF-представления по (путь, параметры запроса, формат, день, версия данных).
+
+    Повторный запрос отдаёт готовые байты из кэша, а при совпадении If-None-Match — 304 без тела.
+    Обработчик вызывается после аутентификации и проверки прав, поэтому кэш их не обходит.
+    """
+    @functools.wraps(handler)
+    def wrapper(self, request, *args, **kwargs):
+        key = _cache_key(request, get_data_version())
+        entry = cache.get(key)
+
+        if entry is None:
+            response = self.finalize_response(request, handler(self, request, *args, **kwargs), *args, **kwargs)
+            if response.status_code != 200:
+                return response
+            response.render()
+            # Обработчик мог пересобрать снимки и сменить версию данных
+            key = _cache_key(request, get_data_version())
+            entry = _entry(response)
+            cache.set(key, entry, timeout=getattr(settings, "FIXINGS_CACHE_TIMEOUT", 3600))
+
+        return _cached(request, entry)
+
+    return wrapper
+
+
+def acached_response(handler):
+    """cached_response для async-обработчиков, возвращающих HttpResponse (см. market_vision_backend.async_views)"""
+    @functools.wraps(handler)
+    async def wrapper(self, request, *args, **kwargs):
+        key = _cache_key(request, await aget_data_version())
+        entry = await cache.aget(key)
+
+        if entry is None:
+            response = await handler(self, request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+            key = _cache_key(request, await aget_data_version())
+            entry = _entry(response)
+            await cache.aset(key, entry, timeout=getattr(settings, "FIXINGS_CACHE_TIMEOUT", 3600))
+
+        return _cached(request, entry)
+
+    return wrapper
+
+
+def _entry(response):
+    return {
+        "content": response.content,
+        "contentType": response["Content-Type"],
+        "etag": quote_etag(hashlib.md5(response.content).hexdigest()),
+    }
+
+
+def _cached(request, entry):
+    if _matches(request, entry["etag"]):
+        response = HttpResponseNotModified()
+    else:
+        response = HttpResponse(entry["content"], content_type=entry["contentType"])
+    response["ETag"] = entry["etag"]
+    response["Cache-Control"] = "private, no-cache"
+    return response
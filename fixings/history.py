@@ -0,0 +1,398 @@
+import datetime
+import json
+import os
+import shutil
+import threading
+import time
+from decimal import Decimal
+
+import numpy as np
+from django.conf import settings
+from django.db.models import Max
+
+from .rates import to_ordinal, to_ordinals
+
+_EPOCH_ORDINAL = datetime.date(1970, 1, 1).toordinal()
+_COLUMNS = ("index_ids", "dates", "values", "decimals", "currency_ids")
+# Ключ (бумага, день) в одном int64: id * _KEY_SPAN + порядковый номер дня. Порядковый номер любой даты
+# меньше 2**22, поэтому без переполнения упаковываются только id от 0 до MAX_INDEX_ID = 2**41 - 1
+_KEY_SPAN = 1 << 22
+MAX_INDEX_ID = (1 << 63) // _KEY_SPAN - 1
+
+
+def _pack_keys(index_ids, ordinals):
+    """Ключи (бумага, день); для id вне [0, MAX_INDEX_ID] ключ -1, который не совпадает ни с одним фиксингом"""
+    packable = (index_ids >= 0) & (index_ids <= MAX_INDEX_ID)
+    return np.where(packable, np.where(packable, index_ids, 0) * _KEY_SPAN + ordinals, -1)
+
+
+class PricePoint:
+    """Фиксинг бумаги из колоночного хранилища: дата, исходное Decimal значение и валюта"""
+
+    __slots__ = ("date", "value", "currency")
+
+    def __init__(self, date, value, currency):
+        self.date = date
+        self.value = value
+        self.currency = currency
+
+
+class PriceHistoryStore:
+    """
+    Колоночное хранилище истории цен Fixing.
+
+    Все фиксинги лежат в плоских массивах, отсортированных по (бумага, дата): id бумаги, день,
+    цена float64, исходное Decimal значение в виде байтовой строки и id валюты. Для каждой бумаги
+    известен срез [начало, конец), поэтому цена на дату, последняя цена и диапазон дат ищутся
+    бинарным поиском без обращения к Postgres.
+
+    Если задан PRICE_HISTORY_DIR, массивы сохраняются в каталог и открываются через mmap:
+    процесс, загрузивший свежие данные, публикует снимок, а остальные воркеры gunicorn
+    подключают его и делят одни и те же страницы памяти.
+    """
+
+    def __init__(self, path=None, refresh_interval=None):
+        self._path = path
+        self._refresh_interval = refresh_interval
+        self._lock = threading.RLock()
+        self._loaded = False
+        self._checked_at = 0.0
+        self._signature = (0, None, None)
+        self._currencies = {}
+        self._offsets = {}
+        self._set_columns(self._empty_columns())
+
+    @property
+    def path(self):
+        if self._path is not None:
+            return self._path
+        return getattr(settings, "PRICE_HISTORY_DIR", None)
+
+    @property
+    def refresh_interval(self):
+        if self._refresh_interval is not None:
+            return self._refresh_interval
+        return getattr(settings, "RATE_ENGINE_REFRESH_SECONDS", 60)
+
+    @staticmethod
+    def _empty_columns():
+        return {
+            "index_ids": np.empty(0, dtype=np.int64),
+            "dates": np.empty(0, dtype=np.int64),
+            "values": np.empty(0, dtype=np.float64),
+            "decimals": np.empty(0, dtype="S1"),
+            "currency_ids": np.empty(0, dtype=np.int64),
+        }
+
+    def _set_columns(self, columns):
+        self._index_ids = columns["index_ids"]
+        self._dates = columns["dates"]
+        self._values = columns["values"]
+        self._decimals = columns["decimals"]
+        self._currency_ids = columns["currency_ids"]
+        index_ids = np.asarray(self._index_ids)
+        if len(index_ids) and (index_ids.min() < 0 or index_ids.max() > MAX_INDEX_ID):
+            raise ValueError(f"Index ids must be between 0 and {MAX_INDEX_ID} to be packed into price history keys")
+        self._keys = index_ids * _KEY_SPAN + np.asarray(self._dates)
+
+        ids, starts = np.unique(self._index_ids, return_index=True)
+        ends = np.append(starts[1:], len(self._index_ids))
+        self._offsets = {int(index_id): (int(start), int(end)) for index_id, start, end in zip(ids, starts, ends)}
+
+    # Загрузка и обновление
+
+    def load(self):
+        """Подключает опубликованный снимок, если он актуален, иначе перечитывает Fixing из базы"""
+        with self._lock:
+            self._load_currencies()
+            signature = self._fetch_signature()
+            if not self._attach(signature):
+                rows = self._fetch_rows(last_id=None)
+                # Строки могли добавиться после чтения сигнатуры: дальше догружается всё после последнего id
+                signature = (signature[0], max((row[0] for row in rows), default=None), signature[2])
+                self._set_columns(self._build(rows))
+                self._publish(signature)
+            self._signature = signature
+            self._checked_at = time.monotonic()
+            self._loaded = True
+
+    def refresh(self):
+        """
+        Догружает новые фиксинги по id; при удалениях и расхождениях перечитывает всё.
+
+        Количество фиксингов берётся из MarketDataState: прирост числа строк с прошлой проверки
+        должен совпасть с числом догруженных строк.
+        """
+        with self._lock:
+            if not self._loaded:
+                return self.load()
+
+            signature = self._fetch_signature()
+            self._checked_at = time.monotonic()
+            if signature == self._signature:
+                return
+
+            self._load_currencies()
+            if self._attach(signature):
+                self._signature = signature
+                return
+
+            count, last_id, _ = signature
+            loaded_count, loaded_last_id, _ = self._signature
+            if count < loaded_count or (last_id or 0) < (loaded_last_id or 0):
+                return self.load()
+
+            rows = self._fetch_rows(last_id=loaded_last_id)
+            if loaded_count + len(rows) != count:
+                return self.load()
+
+            self._set_columns(self._merge(self._build(rows)))
+            self._signature = signature
+            self._publish(signature)
+
+    def invalidate(self):
+        """Помечает данные устаревшими: следующее обращение перечитает историю"""
+        with self._lock:
+            self._loaded = False
+
+    def ensure_fresh(self):
+        if not self._loaded:
+            self.load()
+        elif time.monotonic() - self._checked_at >= self.refresh_interval:
+            self.refresh()
+
+    def _load_currencies(self):
+        from .registry import currency_registry
+
+        self._currencies = {currency.id: currency.currency for currency in currency_registry.all()}
+
+    def _queryset(self):
+        from .models import Fixing
+
+        return Fixing.objects.filter(indexId__isnull=False, fixingDate__isnull=False)
+
+    def _fetch_signature(self):
+        """
+        Сигнатура данных без сканирования Fixing: количество фиксингов и отметка изменения
+        из MarketDataState (обновляются загрузкой и сигналами) и максимальный id по первичному ключу.
+        """
+        from .models import Fixing, MarketDataState
+        from .state import STATE_ID
+
+        state = MarketDataState.objects.filter(id=STATE_ID).values_list("fixingsCount", "updatedAt").first()
+        count, updated_at = state or (0, None)
+        last_id = Fixing.objects.aggregate(last=Max("id"))["last"]
+        return count, last_id, None if updated_at is None else int(updated_at.timestamp() * 1_000_000)
+
+    def _fetch_rows(self, last_id):
+        queryset = self._queryset()
+        if last_id is not None:
+            queryset = queryset.filter(id__gt=last_id)
+        return list(queryset.order_by("id").values_list("id", "indexId", "fixingDate", "value", "currencyId"))
+
+    @staticmethod
+    def _build(rows):
+        if not rows:
+            return PriceHistoryStore._empty_columns()
+
+        _, index_ids, dates, values, currency_ids = zip(*rows)
+        decimals = np.array([b"" if value is None else str(value).encode() for value in values])
+        columns = {
+            "index_ids": np.fromiter(index_ids, dtype=np.int64, count=len(rows)),
+            "dates": np.fromiter((date.toordinal() for date in dates), dtype=np.int64, count=len(rows)),
+            "values": np.array([np.nan if value is None else float(value) for value in values], dtype=np.float64),
+            "decimals": decimals,
+            "currency_ids": np.array([-1 if ccy is None else ccy for ccy in currency_ids], dtype=np.int64),
+        }
+        # Строки приходят в порядке id; устойчивая сортировка оставляет более поздний id последним
+        order = np.lexsort((columns["dates"], columns["index_ids"]))
+        return {name: column[order] for name, column in columns.items()}
+
+    def _merge(self, new):
+        current = {name: getattr(self, f"_{name}") for name in _COLUMNS}
+        merged = {name: np.concatenate([current[name], new[name]]) for name in _COLUMNS}
+        order = np.lexsort((merged["dates"], merged["index_ids"]))
+        return {name: column[order] for name, column in merged.items()}
+
+    # Снимки на диске
+
+    def _publish(self, signature):
+        path = self.path
+        if not path:
+            return
+
+        count, last_id, marker = signature
+        name = f"snapshot-{count}-{last_id}-{marker}"
+        target = os.path.join(path, name)
+        os.makedirs(path, exist_ok=True)
+
+        if not os.path.isdir(target):
+            staging = f"{target}.{os.getpid()}.tmp"
+            os.makedirs(staging, exist_ok=True)
+            for column in _COLUMNS:
+                np.save(os.path.join(staging, f"{column}.npy"), getattr(self, f"_{column}"))
+            try:
+                os.rename(staging, target)
+            except OSError:
+                shutil.rmtree(staging, ignore_errors=True)
+
+        manifest = os.path.join(path, "current.json")
+        staging_manifest = f"{manifest}.{os.getpid()}.tmp"
+        with open(staging_manifest, "w", encoding="utf-8") as file:
+            json.dump({"snapshot": name, "count": count, "lastId": last_id, "marker": marker}, file)
+        os.replace(staging_manifest, manifest)
+
+        for entry in os.listdir(path):
+            if entry.startswith("snapshot-") and entry != name and not entry.endswith(".tmp"):
+                shutil.rmtree(os.path.join(path, entry), ignore_errors=True)
+
+    def _attach(self, signature):
+        """Открывает через mmap опубликованный снимок с той же сигнатурой, что и в базе"""
+        path = self.path
+        if not path:
+            return False
+
+        try:
+            with open(os.path.join(path, "current.json"), encoding="utf-8") as file:
+                manifest = json.load(file)
+            if (manifest["count"], manifest["lastId"], manifest["marker"]) != tuple(signature):
+                return False
+            directory = os.path.join(path, manifest["snapshot"])
+            columns = {
+                column: np.load(os.path.join(directory, f"{column}.npy"), mmap_mode="r")
+                for column in _COLUMNS
+            }
+        except (OSError, ValueError, KeyError):
+            return False
+
+        self._set_columns(columns)
+        return True
+
+    # Поиск цен
+
+    def _slice(self, index_id):
+        return self._offsets.get(int(index_id), (0, 0))
+
+    def _point(self, position):
+        raw = bytes(self._decimals[position])
+        currency_id = int(self._currency_ids[position])
+        return PricePoint(
+            date=datetime.date.fromordinal(int(self._dates[position])),
+            value=Decimal(raw.decode()) if raw else None,
+            currency=self._currencies.get(currency_id),
+        )
+
+    def as_of(self, index_id, date=None):
+        """Последний фиксинг бумаги не позже даты или None"""
+        with self._lock:
+            self.ensure_fresh()
+            start, end = self._slice(index_id)
+            position = start + int(np.searchsorted(self._dates[start:end], to_ordinal(date), side="right")) - 1
+            if position < start:
+                return None
+            return self._point(position)
+
+    def as_of_many(self, index_ids, dates):
+        """
+        Последние фиксинги не позже каждой из дат для набора бумаг.
+
+        Returns:
+            dict: {(id бумаги, дата): PricePoint или None}
+        """
+        dates = list(dates)
+        ordinals = np.array([to_ordinal(date) for date in dates], dtype=np.int64)
+        result = {}
+        with self._lock:
+            self.ensure_fresh()
+            for index_id in set(index_ids):
+                start, end = self._slice(index_id)
+                positions = start + np.searchsorted(self._dates[start:end], ordinals, side="right") - 1
+                for date, position in zip(dates, positions):
+                    result[(index_id, date)] = self._point(int(position)) if position >= start else None
+        return result
+
+    def as_of_arrays(self, index_ids, dates):
+        """
+        Векторный as_of для массивов бумаг и дат одной длины: один бинарный поиск по ключам (бумага, день).
+
+        Returns:
+            tuple: (дни фиксингов int64, -1 если фиксинга нет; исходные Decimal значения или None;
+                    коды валют фиксингов или None)
+        """
+        index_ids = np.asarray(index_ids, dtype=np.int64)
+        keys = _pack_keys(index_ids, to_ordinals(dates))
+        with self._lock:
+            self.ensure_fresh()
+            positions = np.searchsorted(self._keys, keys, side="right") - 1
+            found = positions >= 0
+            found[found] = self._index_ids[positions[found]] == index_ids[found]
+
+            days = np.full(len(keys), -1, dtype=np.int64)
+            values = np.full(len(keys), None, dtype=object)
+            currencies = np.full(len(keys), None, dtype=object)
+            for i in np.flatnonzero(found):
+                point = self._point(int(positions[i]))
+                days[i] = point.date.toordinal()
+                values[i] = point.value
+                currencies[i] = point.currency
+            return days, values, currencies
+
+    def as_of_matrix(self, index_ids, dates):
+        """
+        Цены бумаг на каждую из дат с протяжкой последнего фиксинга вперёд.
+
+        Returns:
+            tuple: матрицы (даты × бумаги): дни фиксингов (-1, если фиксинга ещё нет),
+                   цены float64 (NaN) и коды валют фиксингов (None)
+        """
+        index_ids = np.asarray(index_ids, dtype=np.int64)
+        keys = _pack_keys(index_ids[None, :], to_ordinals(dates)[:, None])
+
+        days = np.full(keys.shape, -1, dtype=np.int64)
+        values = np.full(keys.shape, np.nan)
+        currencies = np.full(keys.shape, None, dtype=object)
+        with self._lock:
+            self.ensure_fresh()
+            if not len(self._keys):
+                return days, values, currencies
+
+            positions = np.searchsorted(self._keys, keys, side="right") - 1
+            safe = np.maximum(positions, 0)
+            found = (positions >= 0) & (self._index_ids[safe] == index_ids[None, :])
+
+            days[found] = self._dates[safe[found]]
+            values[found] = self._values[safe[found]]
+            currency_ids = np.where(found, self._currency_ids[safe], -1)
+            for currency_id in np.unique(currency_ids[found]):
+                currencies[currency_ids == currency_id] = self._currencies.get(int(currency_id))
+            return days, values, currencies
+
+    def latest(self, index_id):
+        """Самый свежий фиксинг бумаги или None"""
+        with self._lock:
+            self.ensure_fresh()
+            start, end = self._slice(index_id)
+            if start == end:
+                return None
+            return self._point(end - 1)
+
+    def range(self, index_id, start_date=None, end_date=None):
+        """
+        Фиксинги бумаги в диапазоне дат включительно.
+
+        Returns:
+            tuple: (даты datetime64[D], цены float64)
+        """
+        with self._lock:
+            self.ensure_fresh()
+            start, end = self._slice(index_id)
+            dates = self._dates[start:end]
+            lo = 0 if start_date is None else int(np.searchsorted(dates, to_ordinal(start_date), side="left"))
+            hi = len(dates) if end_date is None else int(np.searchsorted(dates, to_ordinal(end_date), side="right"))
+            return (
+                (np.asarray(dates[lo:hi]) - _EPOCH_ORDINAL).astype("datetime64[D]"),
+                np.array(self._values[start + lo:start + hi]),
+            )
+
+
+price_history = PriceHistoryStore()
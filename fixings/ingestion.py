@@ -0,0 +1,427 @@
+import csv
+import datetime
+import io
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+
+import numpy as np
+from django.db import connection, transaction
+from django.db.models import Max
+
+from .bars import save_bars
+from .history import price_history
+from .models import Currency, Index, Fixing, CurrencyUSDFixing, IndexBars
+from .providers import get_provider
+from .rates import rate_engine
+from .signals import fixings_loaded
+from .snapshots import rebuild_price_snapshots
+from .state import update_market_data_state
+
+# С этой даты загружается история тикеров, по которым ещё нет ни одного фиксинга
+DEFAULT_START_DATE = datetime.date(2020, 1, 1)
+
+
+class IngestionTarget:
+    """Тикер, который нужно догрузить: бумага или валюта, её id и первая недостающая дата"""
+
+    __slots__ = ("ticker", "kind", "object_id", "currency_id", "start_date")
+
+    def __init__(self, ticker, kind, object_id, currency_id, start_date):
+        self.ticker = ticker
+        self.kind = kind
+        self.object_id = object_id
+        self.currency_id = currency_id
+        self.start_date = start_date
+
+
+class IngestionReport:
+    """Итог загрузки: количество записанных фиксингов и дней OHLCV, неудачные тикеры и время этапов в секундах"""
+
+    def __init__(self):
+        self.start_date = None
+        self.end_date = None
+        self.tickers = 0
+        self.count_indexes = 0
+        self.count_currencies = 0
+        self.count_bars = 0
+        self.failed = {}
+        self.timings = {}
+
+    @contextmanager
+    def stage(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[name] = self.timings.get(name, 0.0) + time.perf_counter() - started
+
+    def as_dict(self):
+        return {
+            "countCurrencies": self.count_currencies,
+            "countIndexes": self.count_indexes,
+            "countBars": self.count_bars,
+            "startDate": self.start_date,
+            "endDate": self.end_date,
+            "failedTickers": self.failed,
+            "timings": {name: round(seconds, 3) for name, seconds in self.timings.items()},
+        }
+
+
+def get_ingestion_targets(tickers=None, default_start=DEFAULT_START_DATE):
+    """
+    Водяные знаки загрузки: последняя сохранённая дата по каждой бумаге и валюте, по одному
+    агрегирующему запросу на таблицу. Заодно строится соответствие тикер → id.
+
+    Returns:
+        dict: {тикер: IngestionTarget}
+    """
+    def start(last_date):
+        return default_start if last_date is None else last_date + datetime.timedelta(days=1)
+
+    targets = {}
+    indexes = Index.objects.annotate(lastDate=Max("fixing__fixingDate")).values_list(
+        "indexISIN", "id", "ccyId", "lastDate"
+    )
+    for ticker, index_id, currency_id, last_date in indexes:
+        if ticker:
+            targets[ticker] = IngestionTarget(ticker, "index", index_id, currency_id, start(last_date))
+
+    currencies = Currency.objects.annotate(lastDate=Max("currencyusdfixing__currencyFixingDate")).values_list(
+        "ticker", "id", "lastDate"
+    )
+    for ticker, currency_id, last_date in currencies:
+        if ticker:
+            targets[ticker] = IngestionTarget(ticker, "currency", currency_id, currency_id, start(last_date))
+
+    if tickers is not None:
+        tickers = set(tickers)
+        targets = {ticker: target for ticker, target in targets.items() if ticker in tickers}
+    return targets
+
+
+def _download_chunk(provider, chunk, end_date, retries, backoff):
+    """
+    Скачивает пачку тикеров; каждый тикер повторяется до retries раз с экспоненциальной паузой.
+    По бумагам кроме цен закрытия возвращаются дневные OHLCV (даты и массив 5 × дней).
+    """
+    results = {}
+    bars = {}
+    errors = {}
+    for target in chunk:
+        for attempt in range(retries + 1):
+            try:
+                if target.kind == "index":
+                    dates, values = provider.fetch_bars(target.ticker, target.start_date, end_date)
+                    closes = values[IndexBars.FIELDS.index("close")]
+                    bars[target.ticker] = (dates, values)
+                else:
+                    dates, closes = provider.fetch_closes(target.ticker, target.start_date, end_date)
+                results[target.ticker] = list(zip(dates.tolist(), closes.tolist()))
+                break
+            except Exception as e:
+                if attempt == retries:
+                    errors[target.ticker] = str(e)
+                else:
+                    time.sleep(backoff * 2 ** attempt)
+    return results, bars, errors
+
+
+def _bars_series(bars, targets, end_date):
+    """OHLCV скачанных бумаг в формате save_bars: дни от первой недостающей даты тикера до end_date"""
+    series = {}
+    for ticker, (dates, values) in bars.items():
+        target = targets[ticker]
+        mask = (dates >= np.datetime64(target.start_date, "D")) & (dates <= np.datetime64(end_date, "D"))
+        series[target.object_id] = (target.currency_id, dates[mask], values[:, mask])
+    return series
+
+
+def ingest_fixings(tickers=None, end_date=None, workers=4, chunk_size=20, retries=3, backoff=1.0,
+                   batch_size=1000, progress=None, provider=None):
+    """
+    Догружает недостающие фиксинги бумаг и валют.
+
+    Для каждого тикера запрашивается только диапазон после последней сохранённой даты; пачки
+    по chunk_size тикеров скачиваются параллельно в workers потоках. Записи пишутся пакетными
+    upsert по уникальным (бумага/валюта, дата), дневные OHLCV бумаг — помесячно (см. save_bars),
+    после чего обновляются движки цен и снимки.
+
+    Args:
+        tickers: Ограничить загрузку этими тикерами; None — все
+        end_date: Последняя загружаемая дата включительно; None — вчера
+        progress: Вызывается как progress(скачано тикеров, всего тикеров) после каждой пачки
+        provider: Источник цен (MarketDataProvider); None — из настроек
+
+    Returns:
+        IngestionReport
+    """
+    report = IngestionReport()
+    provider = provider or get_provider()
+    if end_date is None:
+        end_date = datetime.date.today() - datetime.timedelta(days=1)
+    report.end_date = end_date
+
+    with report.stage("watermarks"):
+        targets = [target for target in get_ingestion_targets(tickers).values() if target.start_date <= end_date]
+
+    report.tickers = len(targets)
+    if not targets:
+        return report
+    report.start_date = min(target.start_date for target in targets)
+    if progress:
+        progress(0, len(targets))
+
+    # Тикеры с одинаковой начальной датой идут соседними пачками
+    targets.sort(key=lambda target: (target.start_date, target.ticker))
+    chunks = [targets[i:i + chunk_size] for i in range(0, len(targets), chunk_size)]
+
+    closes = {}
+    bars = {}
+    fetch_end = end_date + datetime.timedelta(days=1)
+    with report.stage("download"):
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+            futures = [
+                executor.submit(_download_chunk, provider, chunk, fetch_end, retries, backoff)
+                for chunk in chunks
+            ]
+            for future in as_completed(futures):
+                results, chunk_bars, errors = future.result()
+                closes.update(results)
+                bars.update(chunk_bars)
+                report.failed.update(errors)
+                if progress:
+                    progress(len(closes) + len(report.failed), len(targets))
+
+    fixings = []
+    currency_fixings = []
+    with report.stage("transform"):
+        by_ticker = {target.ticker: target for target in targets}
+        index_bars = _bars_series(bars, by_ticker, end_date)
+        for ticker, series in closes.items():
+            target = by_ticker[ticker]
+            for date, close in series:
+                if date < target.start_date or date > end_date:
+                    continue
+                if target.kind == "index":
+                    fixings.append(Fixing(
+                        fixingDate=date,
+                        indexId_id=target.object_id,
+                        currencyId_id=target.currency_id,
+                        value=close,
+                    ))
+                else:
+                    currency_fixings.append(CurrencyUSDFixing(
+                        currencyFixingDate=date,
+                        currencyId_id=target.object_id,
+                        valueUSD=close,
+                    ))
+
+    with report.stage("write"):
+        CurrencyUSDFixing.objects.bulk_create(
+            currency_fixings,
+            batch_size=batch_size,
+            update_conflicts=True,
+            unique_fields=["currencyId", "currencyFixingDate"],
+            update_fields=["valueUSD"],
+        )
+        Fixing.objects.bulk_create(
+            fixings,
+            batch_size=batch_size,
+            update_conflicts=True,
+            unique_fields=["indexId", "fixingDate"],
+            update_fields=["value", "currencyId"],
+        )
+        report.count_bars = save_bars(index_bars)
+    report.count_indexes = len(fixings)
+    report.count_currencies = len(currency_fixings)
+
+    with report.stage("refresh"):
+        # Состояние обновляется первым: по нему движки цен сверяют количество фиксингов
+        update_market_data_state(ingested=True)
+        if currency_fixings:
+            rate_engine.refresh()
+        if fixings:
+            price_history.refresh()
+
+        # Новые курсы меняют конвертацию всех бумаг, новые цены — только снимки своих бумаг
+        if currency_fixings:
+            rebuild_price_snapshots()
+        elif fixings:
+            rebuild_price_snapshots(indexes={fixing.indexId_id for fixing in fixings})
+        if fixings or currency_fixings:
+            fixings_loaded.send(
+                sender=Fixing,
+                index_ids={fixing.indexId_id for fixing in fixings},
+                currency_ids={fixing.currencyId_id for fixing in currency_fixings},
+            )
+
+    return report
+
+
+class StagingTable:
+    """
+    Временная таблица для потоковой перезагрузки фиксингов.
+
+    Строки (вид, id бумаги или валюты, id валюты, дата, значение) дописываются пачками: в Postgres
+    через COPY, в остальных базах через executemany. merge затем одной транзакцией заменяет
+    фиксинги загруженных тикеров за период данными из таблицы.
+    """
+
+    name = "fixings_reload_staging"
+    columns = ("kind", "object_id", "currency_id", "fixing_date", "value")
+
+    def __init__(self):
+        self.rows = {"index": 0, "currency": 0}
+
+    def create(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f"DROP TABLE IF EXISTS {self.name}")
+            cursor.execute(
+                f"CREATE TEMPORARY TABLE {self.name} (kind varchar(10), object_id bigint, currency_id bigint, "
+                f"fixing_date date, value numeric(45, 20))"
+            )
+
+    def drop(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f"DROP TABLE IF EXISTS {self.name}")
+
+    def write(self, rows):
+        """Дописывает строки (вид, id, id валюты, дата, значение)"""
+        if not rows:
+            return
+        for row in rows:
+            self.rows[row[0]] += 1
+
+        with connection.cursor() as cursor:
+            if connection.vendor == "postgresql":
+                buffer = io.StringIO()
+                csv.writer(buffer).writerows(rows)
+                buffer.seek(0)
+                cursor.copy_expert(
+                    f"COPY {self.name} ({', '.join(self.columns)}) FROM STDIN WITH (FORMAT csv)", buffer
+                )
+            else:
+                cursor.executemany(
+                    f"INSERT INTO {self.name} ({', '.join(self.columns)}) VALUES (%s, %s, %s, %s, %s)", rows
+                )
+
+    def merge(self, since, end_date):
+        """Заменяет фиксинги загруженных бумаг и валют в диапазоне [since, end_date] строками таблицы"""
+        quote = connection.ops.quote_name
+        targets = [
+            ("index", Fixing, "indexId", "fixingDate", "value", "currencyId"),
+            ("currency", CurrencyUSDFixing, "currencyId", "currencyFixingDate", "valueUSD", None),
+        ]
+        with transaction.atomic(), connection.cursor() as cursor:
+            for kind, model, object_field, date_field, value_field, currency_field in targets:
+                table = quote(model._meta.db_table)
+                object_column = quote(model._meta.get_field(object_field).column)
+                date_column = quote(model._meta.get_field(date_field).column)
+                columns = [object_column, date_column, quote(model._meta.get_field(value_field).column)]
+                source = ["object_id", "fixing_date", "value"]
+                if currency_field:
+                    columns.append(quote(model._meta.get_field(currency_field).column))
+                    source.append("currency_id")
+
+                cursor.execute(
+                    f"DELETE FROM {table} WHERE {date_column} >= %s AND {date_column} <= %s AND {object_column} IN "
+                    f"(SELECT DISTINCT object_id FROM {self.name} WHERE kind = %s)",
+                    [since, end_date, kind],
+                )
+                cursor.execute(
+                    f"INSERT INTO {table} ({', '.join(columns)}) SELECT {', '.join(source)} FROM {self.name} "
+                    f"WHERE kind = %s ON CONFLICT DO NOTHING",
+                    [kind],
+                )
+
+
+def reload_fixings(tickers=None, since=DEFAULT_START_DATE, end_date=None, workers=4, chunk_size=10, retries=3,
+                   backoff=1.0, progress=None, provider=None):
+    """
+    Перезагружает историю фиксингов с даты since потоково.
+
+    Тикеры скачиваются пачками по chunk_size в workers потоках, и каждая пачка сразу уходит
+    во временную таблицу, так что в памяти процесса одновременно не больше workers пачек.
+    В конце фиксинги успешно скачанных тикеров за период заменяются одной транзакцией;
+    тикеры, которые не удалось скачать, сохраняют прежние данные. Дневные OHLCV бумаг за период
+    заменяются сразу после скачивания каждой пачки.
+
+    Args:
+        tickers: Перезагрузить только эти тикеры; None — все
+        since: Первая перезагружаемая дата
+        end_date: Последняя дата включительно; None — вчера
+        progress: Вызывается как progress(обработано тикеров, всего тикеров) после каждой пачки
+        provider: Источник цен (MarketDataProvider); None — из настроек
+
+    Returns:
+        IngestionReport
+    """
+    report = IngestionReport()
+    provider = provider or get_provider()
+    if end_date is None:
+        end_date = datetime.date.today() - datetime.timedelta(days=1)
+    report.start_date, report.end_date = since, end_date
+
+    with report.stage("watermarks"):
+        targets = sorted(get_ingestion_targets(tickers).values(), key=lambda target: target.ticker)
+    for target in targets:
+        target.start_date = since
+
+    report.tickers = len(targets)
+    if not targets or since > end_date:
+        return report
+
+    chunks = [targets[i:i + chunk_size] for i in range(0, len(targets), chunk_size)]
+    fetch_end = end_date + datetime.timedelta(days=1)
+    workers = max(1, workers)
+    staging = StagingTable()
+    loaded = {"index": set(), "currency": set()}
+    staging.create()
+    try:
+        done = 0
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for i in range(0, len(chunks), workers):
+                with report.stage("download"):
+                    results = list(executor.map(
+                        lambda chunk: _download_chunk(provider, chunk, fetch_end, retries, backoff),
+                        chunks[i:i + workers],
+                    ))
+
+                with report.stage("stage"):
+                    for chunk, (closes, bars, errors) in zip(chunks[i:i + workers], results):
+                        report.failed.update(errors)
+                        report.count_bars += save_bars(
+                            _bars_series(bars, {target.ticker: target for target in chunk}, end_date),
+                            since=since, end_date=end_date,
+                        )
+                        for target in chunk:
+                            if closes.get(target.ticker):
+                                loaded[target.kind].add(target.object_id)
+                        staging.write([
+                            (target.kind, target.object_id, target.currency_id, date, close)
+                            for target in chunk if closes.get(target.ticker)
+                            for date, close in closes[target.ticker]
+                            if since <= date <= end_date
+                        ])
+                        done += len(chunk)
+                del results
+                if progress:
+                    progress(done, len(targets))
+
+        with report.stage("merge"):
+            staging.merge(since, end_date)
+    finally:
+        staging.drop()
+
+    report.count_indexes = staging.rows["index"]
+    report.count_currencies = staging.rows["currency"]
+
+    with report.stage("refresh"):
+        update_market_data_state(ingested=True)
+        rate_engine.refresh()
+        price_history.refresh()
+        rebuild_price_snapshots()
+        fixings_loaded.send(sender=Fixing, index_ids=loaded["index"], currency_ids=loaded["currency"])
+
+    return report
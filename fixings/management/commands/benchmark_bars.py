@@ -0,0 +1,110 @@
+import datetime
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from fixings.bars import get_bars, save_bars
+from fixings.models import Currency, Index, Fixing, IndexBars
+
+
+class Command(BaseCommand):
+    help = (
+        "Сравнивает размер таблиц и время чтения истории цен в построчном Decimal-формате Fixing "
+        "и в помесячных OHLCV IndexBars на синтетических данных. Данные создаются в транзакции и откатываются."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--indexes", type=int, default=200, help="Количество синтетических бумаг")
+        parser.add_argument("--years", type=int, default=5, help="Лет истории по рабочим дням")
+        parser.add_argument("--repeat", type=int, default=5, help="Повторов каждого замера чтения")
+        parser.add_argument("--batch-size", type=int, default=5000, help="Размер пакета вставки")
+        parser.add_argument("--seed", type=int, default=42)
+
+    def handle(self, *args, **options):
+        rng = np.random.default_rng(options["seed"])
+        end = datetime.date.today() - datetime.timedelta(days=1)
+        days = np.arange(np.datetime64(end - datetime.timedelta(days=365 * options["years"])), np.datetime64(end))
+        dates = days[np.is_busday(days)]
+        range_start = (end - datetime.timedelta(days=365)).isoformat()
+
+        with transaction.atomic():
+            currency, _ = Currency.objects.get_or_create(currency="USD", defaults={"symbol": "$", "ticker": "USDUSD=X"})
+            Index.objects.bulk_create([
+                Index(indexName=f"__benchmark_bars_{i}", ccyId=currency, indexISIN=f"BENCHBARS{i}")
+                for i in range(options["indexes"])
+            ])
+            index_ids = list(Index.objects.filter(indexName__startswith="__benchmark_bars_").values_list("id", flat=True))
+            series = {index_id: (currency.id, dates, self._ohlcv(rng, len(dates))) for index_id in index_ids}
+            rows = len(index_ids) * len(dates)
+            self.stdout.write(f"Генерация {rows} дней ({len(index_ids)} бумаг × {len(dates)} дней)...")
+
+            fixings_before, bars_before = self._size(Fixing), self._size(IndexBars)
+            dates_list = dates.astype(datetime.date).tolist()
+            for index_id, (_, _, values) in series.items():
+                Fixing.objects.bulk_create([
+                    Fixing(indexId_id=index_id, currencyId=currency, fixingDate=date, value=close)
+                    for date, close in zip(dates_list, values[3].tolist())
+                ], batch_size=options["batch_size"])
+            save_bars(series)
+            fixings_size = self._size(Fixing) - fixings_before
+            bars_size = self._size(IndexBars) - bars_before
+
+            def read_fixings(start_date=None):
+                queryset = Fixing.objects.filter(indexId__in=index_ids)
+                if start_date:
+                    queryset = queryset.filter(fixingDate__gte=start_date)
+                values = list(queryset.order_by("indexId", "fixingDate").values_list("indexId", "fixingDate", "value"))
+                return np.array([float(value) for _, _, value in values])
+
+            def read_bars(start_date=None):
+                return get_bars(index_ids, start_date=start_date)
+
+            timings = {
+                "Вся история, Fixing": self._measure(read_fixings, options["repeat"]),
+                "Вся история, IndexBars": self._measure(read_bars, options["repeat"]),
+                "Последний год, Fixing": self._measure(lambda: read_fixings(range_start), options["repeat"]),
+                "Последний год, IndexBars": self._measure(lambda: read_bars(range_start), options["repeat"]),
+            }
+            transaction.set_rollback(True)
+
+        lines = [
+            f"Размер с индексами ({rows} дней, {connection.vendor}):",
+            f"- Fixing (только close): {fixings_size / 2 ** 20:.1f} МБ, {fixings_size / rows:.1f} Б/день",
+            f"- IndexBars (OHLCV): {bars_size / 2 ** 20:.1f} МБ, {bars_size / rows:.1f} Б/день",
+            "Чтение в массивы NumPy (медиана):",
+        ] + [f"- {name}: {seconds * 1000:.1f} мс" for name, seconds in timings.items()]
+        self.stdout.write(self.style.SUCCESS("\n".join(lines)))
+
+    @staticmethod
+    def _ohlcv(rng, days):
+        close = 100 * np.exp(np.cumsum(rng.normal(0.0002, 0.015, days)))
+        spread = np.abs(rng.normal(0, 0.01, (3, days))) * close
+        volume = rng.integers(10_000, 10_000_000, days).astype(np.float64)
+        return np.round(np.vstack([close + spread[0] - spread[1], close + spread[1], close - spread[2], close, volume]), 6)
+
+    @staticmethod
+    def _size(model):
+        """Размер таблицы модели вместе с индексами в байтах"""
+        table = model._meta.db_table
+        with connection.cursor() as cursor:
+            if connection.vendor == "postgresql":
+                cursor.execute("SELECT pg_total_relation_size(%s)", [table])
+            else:
+                cursor.execute(
+                    "SELECT COALESCE(SUM(pgsize), 0) FROM dbstat WHERE name = %s OR name IN "
+                    "(SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = %s)",
+                    [table, table],
+                )
+            return cursor.fetchone()[0]
+
+    @staticmethod
+    def _measure(function, repeat):
+        function()
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            function()
+            timings.append(time.perf_counter() - started)
+        return float(np.median(timings))
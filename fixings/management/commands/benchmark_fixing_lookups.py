@@ -0,0 +1,106 @@
+import datetime
+import random
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from fixings.models import Currency, Index, Fixing
+
+
+class Command(BaseCommand):
+    help = (
+        "Замеряет задержку поиска фиксинга на дату на синтетической таблице Fixing "
+        "(по умолчанию 10 млн строк). Все данные создаются в транзакции и откатываются."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=10_000_000, help="Количество синтетических фиксингов")
+        parser.add_argument("--indexes", type=int, default=4000, help="Количество синтетических бумаг")
+        parser.add_argument("--lookups", type=int, default=2000, help="Количество замеряемых запросов")
+        parser.add_argument("--batch-size", type=int, default=50_000, help="Размер пакета вставки вне Postgres")
+        parser.add_argument("--seed", type=int, default=42)
+
+    def handle(self, *args, **options):
+        rows = options["rows"]
+        index_count = max(1, min(options["indexes"], rows))
+        days = max(1, rows // index_count)
+        start_date = datetime.date.today() - datetime.timedelta(days=days)
+        rng = random.Random(options["seed"])
+
+        with transaction.atomic():
+            currency, _ = Currency.objects.get_or_create(currency="USD", defaults={"symbol": "$", "ticker": "USDUSD=X"})
+            indexes = Index.objects.bulk_create([
+                Index(indexName=f"__benchmark_{i}", ccyId=currency, indexISIN=f"BENCH{i}")
+                for i in range(index_count)
+            ])
+            index_ids = [index.id for index in indexes]
+            if None in index_ids:
+                index_ids = list(Index.objects.filter(indexName__startswith="__benchmark_").values_list("id", flat=True))
+
+            self.stdout.write(f"Генерация {index_count * days} фиксингов ({index_count} бумаг × {days} дней)...")
+            started = time.perf_counter()
+            self._generate(index_ids, currency, start_date, days, options["batch_size"])
+            self.stdout.write(f"Генерация заняла {time.perf_counter() - started:.1f} с")
+
+            if connection.vendor == "postgresql":
+                with connection.cursor() as cursor:
+                    cursor.execute(f"ANALYZE {Fixing._meta.db_table}")
+
+            def lookup():
+                index_id = rng.choice(index_ids)
+                date = start_date + datetime.timedelta(days=rng.randrange(days + 30))
+                return Fixing.objects.filter(fixingDate__lte=date, indexId=index_id).order_by("-fixingDate").first()
+
+            for _ in range(min(50, options["lookups"])):
+                lookup()
+
+            timings = []
+            for _ in range(options["lookups"]):
+                started = time.perf_counter()
+                lookup()
+                timings.append((time.perf_counter() - started) * 1000)
+
+            plan = Fixing.objects.filter(
+                fixingDate__lte=start_date + datetime.timedelta(days=days // 2), indexId=index_ids[0]
+            ).order_by("-fixingDate")[:1].explain()
+
+            transaction.set_rollback(True)
+
+        timings = np.array(timings)
+        self.stdout.write(f"План запроса:\n{plan}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Поиск фиксинга на дату ({len(timings)} запросов, {index_count * days} строк):\n"
+            f"- p50: {np.percentile(timings, 50):.3f} мс\n"
+            f"- p95: {np.percentile(timings, 95):.3f} мс\n"
+            f"- p99: {np.percentile(timings, 99):.3f} мс\n"
+            f"- max: {timings.max():.3f} мс"
+        ))
+
+    def _generate(self, index_ids, currency, start_date, days, batch_size):
+        if connection.vendor == "postgresql":
+            index_field = Fixing._meta.get_field("indexId").column
+            currency_field = Fixing._meta.get_field("currencyId").column
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f'INSERT INTO {Fixing._meta.db_table} ("{index_field}", "fixingDate", "{currency_field}", "value") '
+                    f"SELECT i, %s::date + d, %s, 100 + random() * 50 "
+                    f"FROM unnest(%s::bigint[]) AS i CROSS JOIN generate_series(0, %s) AS d",
+                    [start_date, currency.id, index_ids, days - 1],
+                )
+            return
+
+        batch = []
+        for index_id in index_ids:
+            for day in range(days):
+                batch.append(Fixing(
+                    indexId_id=index_id,
+                    currencyId=currency,
+                    fixingDate=start_date + datetime.timedelta(days=day),
+                    value=100 + random.random() * 50,
+                ))
+                if len(batch) >= batch_size:
+                    Fixing.objects.bulk_create(batch)
+                    batch = []
+        Fixing.objects.bulk_create(batch)
@@ -2,6 +2,7 @@ import json
 import os
 from django.core.management.base import BaseCommand
 from fixings.models import Currency
+from fixings.registry import currency_registry
 from django.db import IntegrityError
 
 
@@ -51,6 +52,7 @@ class Command(BaseCommand):
                     f"Ошибка при создании валюты {currency_data['currency']}: {e}"
                 ))
 
+        currency_registry.invalidate()
         self.stdout.write(self.style.SUCCESS(
             f"Добавлено {created_count} новых валют. {existing_count} валют уже существовало."
         ))
@@ -1,7 +1,8 @@
 import json
 import os
 from django.core.management.base import BaseCommand
-from fixings.models import Index, Currency
+from fixings.models import Index
+from fixings.registry import currency_registry
 from django.db import IntegrityError
 
 
@@ -33,7 +34,7 @@ class Command(BaseCommand):
         for index in indexes:
             try:
                 # Get the currency first
-                ccyId = Currency.objects.filter(currency=index["ccyId"]).first()
+                ccyId = currency_registry.find(index["ccyId"])
                 if not ccyId:
                     self.stdout.write(self.style.WARNING(
                         f"Валюта {index['ccyId']} не найдена для акции {index['indexName']}. Пропускаем."
@@ -0,0 +1,47 @@
+from django.core.management.base import BaseCommand
+
+from fixings.ingestion import ingest_fixings
+from fixings.providers import get_provider
+
+
+class Command(BaseCommand):
+    help = "Догружает недостающие фиксинги валют и акций с даты последнего сохранённого фиксинга до вчера."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--tickers", nargs="+", help="Загружать только эти тикеры")
+        parser.add_argument("--workers", type=int, default=4, help="Количество потоков загрузки")
+        parser.add_argument("--chunk-size", type=int, default=20, help="Количество тикеров в одной пачке")
+        parser.add_argument(
+            "--provider", choices=["yfinance", "file"], help="Источник цен; по умолчанию MARKET_DATA_PROVIDER"
+        )
+        parser.add_argument("--source", help="Каталог или файл снимков цен для --provider file")
+        parser.add_argument("--retries", type=int, default=3, help="Повторов загрузки тикера при ошибке")
+        parser.add_argument("--backoff", type=float, default=1.0, help="Начальная пауза между повторами, с")
+
+    def handle(self, *args, **options):
+        report = ingest_fixings(
+            tickers=options["tickers"],
+            workers=options["workers"],
+            chunk_size=options["chunk_size"],
+            retries=options["retries"],
+            provider=get_provider(options["provider"], options["source"]),
+            backoff=options["backoff"],
+        )
+
+        if not report.tickers:
+            self.stdout.write(self.style.WARNING("Данные уже обновлены"))
+            return
+
+        for ticker, error in report.failed.items():
+            self.stdout.write(self.style.WARNING(f"Не удалось загрузить данные для {ticker}: {error}"))
+
+        timings = "\n".join(f"  - {stage}: {seconds:.2f} с" for stage, seconds in report.timings.items())
+        self.stdout.write(self.style.SUCCESS(
+            f"Загрузка завершена ({report.start_date} — {report.end_date}):\n"
+            f"- Тикеров к загрузке: {report.tickers}\n"
+            f"- Не удалось загрузить тикеров: {len(report.failed)}\n"
+            f"- Записано фиксингов акций: {report.count_indexes}\n"
+            f"- Записано фиксингов валют: {report.count_currencies}\n"
+            f"- Записано дней OHLCV акций: {report.count_bars}\n"
+            f"- Время этапов:\n{timings}"
+        ))
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from fixings.snapshots import rebuild_price_snapshots
+
+
+class Command(BaseCommand):
+    help = (
+        "Пересчитывает снимки текущих цен и динамики акций и валют во всех валютах котировки. "
+        "Списки сами запускают пересборку в фоне при первом запросе за день; команда — для ручного запуска."
+    )
+
+    def handle(self, *args, **kwargs):
+        index_count, currency_count = rebuild_price_snapshots()
+        self.stdout.write(self.style.SUCCESS(
+            f"Обновлено {index_count} снимков акций и {currency_count} снимков валют."
+        ))
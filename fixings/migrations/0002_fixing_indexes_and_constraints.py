@@ -0,0 +1,47 @@
+# Generated by Django 5.2 on 2026-10-18 10:03
+
+from django.db import migrations, models
+from django.db.models import Count, Max
+
+
+def remove_duplicate_fixings(apps, schema_editor):
+    """Оставляет по одному (последнему) фиксингу на бумагу/валюту и дату перед созданием ограничений"""
+    for model_name, key, date_field in (
+        ("Fixing", "indexId", "fixingDate"),
+        ("CurrencyUSDFixing", "currencyId", "currencyFixingDate"),
+    ):
+        model = apps.get_model("fixings", model_name)
+        duplicates = (
+            model.objects.values(key, date_field)
+            .annotate(last_id=Max("id"), count=Count("id"))
+            .filter(count__gt=1)
+        )
+        for row in duplicates.iterator():
+            model.objects.filter(**{key: row[key], date_field: row[date_field]}).exclude(id=row["last_id"]).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fixings', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_fixings, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='currencyusdfixing',
+            index=models.Index(fields=['currencyId', '-currencyFixingDate'], name='ccy_fixing_ccy_date_desc_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='fixing',
+            index=models.Index(fields=['indexId', '-fixingDate'], name='fixing_index_date_desc_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='currencyusdfixing',
+            constraint=models.UniqueConstraint(fields=('currencyId', 'currencyFixingDate'), name='unique_currency_fixing_date'),
+        ),
+        migrations.AddConstraint(
+            model_name='fixing',
+            constraint=models.UniqueConstraint(fields=('indexId', 'fixingDate'), name='unique_fixing_index_date'),
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 5.2 on 2026-10-18 10:07
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fixings', '0002_fixing_indexes_and_constraints'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CurrencyPriceSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('snapshotDate', models.DateField(verbose_name='Дата снимка')),
+                ('currentConvertedPrice', models.DecimalField(blank=True, decimal_places=20, max_digits=45, null=True, verbose_name='Цена в валюте котировки')),
+                ('monthlyDynamic', models.DecimalField(blank=True, decimal_places=20, max_digits=45, null=True, verbose_name='Динамика за 30 дней, %')),
+                ('currencyId', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='priceSnapshots', to='fixings.currency', verbose_name='Валюта')),
+                ('quoteCurrencyId', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='fixings.currency', verbose_name='Валюта котировки')),
+            ],
+            options={
+                'verbose_name': 'Снимок курса валюты',
+                'verbose_name_plural': 'Снимки курсов валют',
+                'constraints': [models.UniqueConstraint(fields=('currencyId', 'quoteCurrencyId'), name='unique_currency_price_snapshot')],
+            },
+        ),
+        migrations.CreateModel(
+            name='IndexPriceSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('snapshotDate', models.DateField(verbose_name='Дата снимка')),
+                ('currentPrice', models.DecimalField(blank=True, decimal_places=20, max_digits=45, null=True, verbose_name='Цена в валюте акции')),
+                ('currentConvertedPrice', models.DecimalField(blank=True, decimal_places=20, max_digits=45, null=True, verbose_name='Цена в валюте котировки')),
+                ('monthlyDynamic', models.DecimalField(blank=True, decimal_places=20, max_digits=45, null=True, verbose_name='Динамика за 30 дней, %')),
+                ('currencyId', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='fixings.currency', verbose_name='Валюта котировки')),
+                ('indexId', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='priceSnapshots', to='fixings.index', verbose_name='Акция')),
+            ],
+            options={
+                'verbose_name': 'Снимок цены акции',
+                'verbose_name_plural': 'Снимки цен акций',
+                'constraints': [models.UniqueConstraint(fields=('indexId', 'currencyId'), name='unique_index_price_snapshot')],
+            },
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2 on 2026-10-18 10:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fixings', '0003_price_snapshots'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IngestionJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('pending', 'В очереди'), ('running', 'Выполняется'), ('success', 'Завершена'), ('failed', 'Ошибка')], default='pending', max_length=20, verbose_name='Статус')),
+                ('isActive', models.BooleanField(default=True, verbose_name='Ожидает или выполняется')),
+                ('createdAt', models.DateTimeField(auto_now_add=True, verbose_name='Поставлена в очередь')),
+                ('startedAt', models.DateTimeField(blank=True, null=True, verbose_name='Начало')),
+                ('finishedAt', models.DateTimeField(blank=True, null=True, verbose_name='Окончание')),
+                ('updatedAt', models.DateTimeField(auto_now=True, verbose_name='Последнее обновление')),
+                ('startDate', models.DateField(blank=True, null=True, verbose_name='Загружено с')),
+                ('endDate', models.DateField(blank=True, null=True, verbose_name='Загружено по')),
+                ('tickersTotal', models.IntegerField(default=0, verbose_name='Тикеров к загрузке')),
+                ('tickersDone', models.IntegerField(default=0, verbose_name='Тикеров обработано')),
+                ('countIndexes', models.IntegerField(default=0, verbose_name='Записано фиксингов акций')),
+                ('countCurrencies', models.IntegerField(default=0, verbose_name='Записано фиксингов валют')),
+                ('failedTickers', models.JSONField(blank=True, default=dict, verbose_name='Ошибки по тикерам')),
+                ('timings', models.JSONField(blank=True, default=dict, verbose_name='Время этапов, с')),
+                ('error', models.TextField(blank=True, verbose_name='Ошибка')),
+            ],
+            options={
+                'verbose_name': 'Загрузка фиксингов',
+                'verbose_name_plural': 'Загрузки фиксингов',
+                'constraints': [models.UniqueConstraint(condition=models.Q(('isActive', True)), fields=('isActive',), name='unique_active_ingestion_job')],
+            },
+        ),
+    ]
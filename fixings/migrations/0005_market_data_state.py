@@ -0,0 +1,29 @@
+# Generated by Django 5.2 on 2026-10-18 10:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fixings', '0004_ingestion_jobs'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MarketDataState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('latestFixingDate', models.DateField(blank=True, null=True, verbose_name='Последний фиксинг акций')),
+                ('latestCurrencyFixingDate', models.DateField(blank=True, null=True, verbose_name='Последний фиксинг валют')),
+                ('fixingsCount', models.BigIntegerField(default=0, verbose_name='Фиксингов акций')),
+                ('currencyFixingsCount', models.BigIntegerField(default=0, verbose_name='Фиксингов валют')),
+                ('lastIngestionAt', models.DateTimeField(blank=True, null=True, verbose_name='Последняя загрузка')),
+                ('updatedAt', models.DateTimeField(auto_now=True, verbose_name='Пересчитано')),
+            ],
+            options={
+                'verbose_name': 'Состояние рыночных данных',
+                'verbose_name_plural': 'Состояние рыночных данных',
+            },
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2 on 2026-10-18 10:51
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fixings', '0005_market_data_state'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IndexBars',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField(verbose_name='Месяц (первое число)')),
+                ('days', models.BinaryField(verbose_name='Дни месяца, uint8')),
+                ('values', models.BinaryField(verbose_name='Open, high, low, close, volume по дням, float64')),
+                ('currencyId', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, to='fixings.currency', verbose_name='Валюта')),
+                ('indexId', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='bars', to='fixings.index', verbose_name='Акция')),
+            ],
+            options={
+                'verbose_name': 'OHLCV акции за месяц',
+                'verbose_name_plural': 'OHLCV акций по месяцам',
+                'constraints': [models.UniqueConstraint(fields=('indexId', 'month'), name='unique_index_bars_month')],
+            },
+        ),
+    ]
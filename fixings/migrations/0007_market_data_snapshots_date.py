@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2026-10-18 11:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fixings', '0006_index_bars'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='marketdatastate',
+            name='snapshotsDate',
+            field=models.DateField(blank=True, null=True, verbose_name='Снимки цен пересобраны за'),
+        ),
+    ]
@@ -1,7 +1,15 @@
 import datetime
 from decimal import Decimal
+
+import numpy as np
 from django.db import models
 
+from .history import price_history
+from .rates import rate_engine, truthy
+from .registry import currency_registry
+
+_EPOCH_ORDINAL = datetime.date(1970, 1, 1).toordinal()
+
 
 class Currency(models.Model):
     currency = models.CharField(verbose_name='ISO код валюты', max_length=50, default='RUB', unique=True)
@@ -22,33 +30,7 @@ class Currency(models.Model):
         if date is None:
             date = datetime.date.today()
 
-        # If converting to the same currency, return 1
-        if self.currency == request_currency:
-            return Decimal('1')
-
-        # If converting from USD to another currency
-        if self.currency == "USD":
-            target_currency = Currency.objects.get(currency=request_currency)
-            target_fixing = CurrencyUSDFixing.objects.filter(
-                currencyId=target_currency,
-                currencyFixingDate__lte=date
-            ).order_by("-currencyFixingDate").first()
-            
-            if not target_fixing or not target_fixing.valueUSD:
-                return Decimal('0.0')
-            
-            return Decimal('1') / target_fixing.valueUSD
-
-        # If converting to USD or any other currency
-        fixing = CurrencyUSDFixing.objects.filter(
-            currencyId=self,
-            currencyFixingDate__lte=date
-        ).order_by("-currencyFixingDate").first()
-
-        if not fixing:
-            return Decimal('0.0')
-
-        return fixing.get_value(request_currency)
+        return rate_engine.get_price(self.currency, request_currency=request_currency, date=date)
 
     def get_dynamic(self, days=30, currency=None):
         """Возвращает относительное изменение стоимости за days дней в указанной валюте"""
@@ -73,6 +55,12 @@ class CurrencyUSDFixing(models.Model):
     class Meta:
         verbose_name = "Фиксинг валюты в USD"
         verbose_name_plural = "Фиксинги валют в USD"
+        indexes = [
+            models.Index(fields=["currencyId", "-currencyFixingDate"], name="ccy_fixing_ccy_date_desc_idx"),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=["currencyId", "currencyFixingDate"], name="unique_currency_fixing_date"),
+        ]
 
     def __str__(self):
         return f"{self.currencyId}_{self.currencyFixingDate}"
@@ -81,8 +69,12 @@ class CurrencyUSDFixing(models.Model):
         if currency == "USD":
             return self.valueUSD
 
+        target_currency = currency_registry.find(currency)
+        if target_currency is None:
+            return Decimal('0.0')
+
         target_fixing = CurrencyUSDFixing.objects.filter(
-            currencyId__currency=currency,
+            currencyId=target_currency.id,
             currencyFixingDate=self.currencyFixingDate
         ).first()
 
@@ -107,19 +99,16 @@ class Index(models.Model):
     def get_price(self, request_currency=None, date=None):
         """Возвращает цену бумаги в заданной валюте на указанную дату"""
         if request_currency is None:
-            request_currency = self.ccyId.currency
+            request_currency = currency_registry.code(self.ccyId_id)
         if date is None:
             date = datetime.date.today()
 
-        fixing = Fixing.objects.filter(
-            fixingDate__lte=date,
-            indexId=self
-        ).order_by("-fixingDate").first()
+        point = price_history.as_of(self.id, date)
 
-        if not fixing:
+        if not point:
             return Decimal('0.0')
 
-        return fixing.get_value(currency=request_currency)
+        return Fixing.convert_value(point.value, point.currency, point.date, currency=request_currency)
 
     def get_dynamic(self, days=30, currency=None):
         """Возвращает изменение цены за указанный период в процентах"""
@@ -129,6 +118,11 @@ class Index(models.Model):
         current = self.get_price(request_currency=currency, date=today)
         previous = self.get_price(request_currency=currency, date=past)
 
+        return Index.calculate_dynamic(current, previous)
+
+    @staticmethod
+    def calculate_dynamic(current, previous):
+        """Изменение цены от previous к current в процентах"""
         if previous == 0:
             return None  # или Decimal('0.0') — в зависимости от желаемого поведения
 
@@ -146,26 +140,232 @@ class Fixing(models.Model):
     class Meta:
         verbose_name = "Фиксинг"
         verbose_name_plural = "Фиксинги"
+        indexes = [
+            models.Index(fields=["indexId", "-fixingDate"], name="fixing_index_date_desc_idx"),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=["indexId", "fixingDate"], name="unique_fixing_index_date"),
+        ]
 
     def __str__(self):
         return f"{self.indexId}_{self.fixingDate}"
 
     def get_value(self, currency=None):
-        if not self.value:
+        return Fixing.convert_value(
+            self.value,
+            currency_registry.code(self.currencyId_id),
+            self.fixingDate,
+            currency=currency,
+        )
+
+    @staticmethod
+    def convert_value(value, value_currency, date, currency=None):
+        """Переводит цену фиксинга из валюты value_currency в currency по курсу на дату фиксинга"""
+        if not value:
             return Decimal('0.0')
 
         if currency is None:
-            return self.value
+            return value
 
-        if not self.currencyId:
+        if not value_currency:
             return Decimal('0.0')
 
-        rate = Currency.objects.get(currency=currency).get_price(
-            date=self.fixingDate,
-            request_currency=self.currencyId.currency
-        )
+        rate = rate_engine.get_price(currency, request_currency=value_currency, date=date)
 
         if rate == 0:
             return Decimal('0.0')
 
-        return self.value / rate
+        return value / rate
+
+    @staticmethod
+    def convert_values(values, value_currencies, dates, currencies):
+        """
+        Векторный convert_value для массивов одной длины: значения, их валюты, даты фиксингов
+        и целевые валюты. Возвращает массив Decimal (object).
+        """
+        values = np.array(list(values), dtype=object)
+        value_currencies = np.array(list(value_currencies), dtype=object)
+        dates = np.asarray(dates)
+        currencies = np.array(list(currencies), dtype=object)
+
+        result = np.full(len(values), Decimal('0.0'), dtype=object)
+        selected = np.flatnonzero(truthy(values) & truthy(value_currencies))
+        rates = rate_engine.get_prices(currencies[selected], value_currencies[selected], dates[selected])
+
+        ok = truthy(rates)
+        result[selected[ok]] = values[selected[ok]] / rates[ok]
+        return result
+
+
+class IndexBars(models.Model):
+    """
+    Дневные OHLCV бумаги за месяц одной строкой: дни месяца (uint8) и open, high, low, close, volume
+    (float64) упакованы в байтовые массивы, вместо строки с Decimal на каждый день.
+    """
+
+    FIELDS = ("open", "high", "low", "close", "volume")
+
+    indexId = models.ForeignKey(Index, related_name="bars", verbose_name="Акция", on_delete=models.CASCADE)
+    currencyId = models.ForeignKey(Currency, blank=True, null=True, verbose_name="Валюта", on_delete=models.PROTECT)
+    month = models.DateField(verbose_name="Месяц (первое число)")
+    days = models.BinaryField(verbose_name="Дни месяца, uint8")
+    values = models.BinaryField(verbose_name="Open, high, low, close, volume по дням, float64")
+
+    class Meta:
+        verbose_name = "OHLCV акции за месяц"
+        verbose_name_plural = "OHLCV акций по месяцам"
+        constraints = [
+            models.UniqueConstraint(fields=["indexId", "month"], name="unique_index_bars_month"),
+        ]
+
+    def __str__(self):
+        return f"{self.indexId}_{self.month:%Y-%m}"
+
+    @staticmethod
+    def pack(dates, values):
+        """
+        Упаковывает дни одного месяца.
+
+        Args:
+            dates: Даты datetime64[D] по возрастанию
+            values: Массив (5 × len(dates)) в порядке FIELDS
+
+        Returns:
+            tuple: (первое число месяца, байты дней, байты значений)
+        """
+        month = dates[0].astype("datetime64[M]")
+        days = (dates - month.astype("datetime64[D]")).astype(np.uint8) + 1
+        # Значения хранятся по дням, чтобы месяцы склеивались конкатенацией байтов
+        values = np.ascontiguousarray(np.asarray(values, dtype="<f8").T)
+        return month.astype("datetime64[D]").item(), days.tobytes(), values.tobytes()
+
+    @classmethod
+    def unpack_many(cls, rows):
+        """
+        Склеивает упакованные месяцы (месяц, байты дней, байты значений) в порядке rows.
+
+        Returns:
+            tuple: даты datetime64[D] и массив значений (5 × дней) в порядке FIELDS
+        """
+        rows = list(rows)
+        days = np.frombuffer(b"".join(days for _, days, _ in rows), dtype=np.uint8)
+        months = np.fromiter((month.toordinal() for month, _, _ in rows), dtype=np.int64, count=len(rows))
+        lengths = [len(days) for _, days, _ in rows]
+        ordinals = np.repeat(months - _EPOCH_ORDINAL, lengths) + days.astype(np.int64) - 1
+        dates = ordinals.astype("datetime64[D]")
+        values = np.frombuffer(b"".join(values for _, _, values in rows), dtype="<f8")
+        return dates, values.reshape(len(days), len(cls.FIELDS)).T
+
+    def unpack(self):
+        """Даты datetime64[D] и массив значений (5 × дней) в порядке FIELDS"""
+        return self.unpack_many([(self.month, self.days, self.values)])
+
+
+class IndexPriceSnapshot(models.Model):
+    indexId = models.ForeignKey(Index, related_name="priceSnapshots", verbose_name="Акция", on_delete=models.CASCADE)
+    currencyId = models.ForeignKey(Currency, related_name="+", verbose_name="Валюта котировки", on_delete=models.CASCADE)
+    snapshotDate = models.DateField(verbose_name="Дата снимка")
+    currentPrice = models.DecimalField(
+        blank=True, null=True, max_digits=45, decimal_places=20, verbose_name="Цена в валюте акции"
+    )
+    currentConvertedPrice = models.DecimalField(
+        blank=True, null=True, max_digits=45, decimal_places=20, verbose_name="Цена в валюте котировки"
+    )
+    monthlyDynamic = models.DecimalField(
+        blank=True, null=True, max_digits=45, decimal_places=20, verbose_name="Динамика за 30 дней, %"
+    )
+
+    class Meta:
+        verbose_name = "Снимок цены акции"
+        verbose_name_plural = "Снимки цен акций"
+        constraints = [
+            models.UniqueConstraint(fields=["indexId", "currencyId"], name="unique_index_price_snapshot"),
+        ]
+
+    def __str__(self):
+        return f"{self.indexId}_{self.currencyId}_{self.snapshotDate}"
+
+
+class CurrencyPriceSnapshot(models.Model):
+    currencyId = models.ForeignKey(
+        Currency, related_name="priceSnapshots", verbose_name="Валюта", on_delete=models.CASCADE
+    )
+    quoteCurrencyId = models.ForeignKey(
+        Currency, related_name="+", verbose_name="Валюта котировки", on_delete=models.CASCADE
+    )
+    snapshotDate = models.DateField(verbose_name="Дата снимка")
+    currentConvertedPrice = models.DecimalField(
+        blank=True, null=True, max_digits=45, decimal_places=20, verbose_name="Цена в валюте котировки"
+    )
+    monthlyDynamic = models.DecimalField(
+        blank=True, null=True, max_digits=45, decimal_places=20, verbose_name="Динамика за 30 дней, %"
+    )
+
+    class Meta:
+        verbose_name = "Снимок курса валюты"
+        verbose_name_plural = "Снимки курсов валют"
+        constraints = [
+            models.UniqueConstraint(fields=["currencyId", "quoteCurrencyId"], name="unique_currency_price_snapshot"),
+        ]
+
+    def __str__(self):
+        return f"{self.currencyId}_{self.quoteCurrencyId}_{self.snapshotDate}"
+
+
+class IngestionJob(models.Model):
+    PENDING = "pending"
+    RUNNING = "running"
+    SUCCESS = "success"
+    FAILED = "failed"
+    STATUSES = [
+        (PENDING, "В очереди"),
+        (RUNNING, "Выполняется"),
+        (SUCCESS, "Завершена"),
+        (FAILED, "Ошибка"),
+    ]
+
+    status = models.CharField(max_length=20, choices=STATUSES, default=PENDING, verbose_name="Статус")
+    isActive = models.BooleanField(default=True, verbose_name="Ожидает или выполняется")
+    createdAt = models.DateTimeField(auto_now_add=True, verbose_name="Поставлена в очередь")
+    startedAt = models.DateTimeField(blank=True, null=True, verbose_name="Начало")
+    finishedAt = models.DateTimeField(blank=True, null=True, verbose_name="Окончание")
+    updatedAt = models.DateTimeField(auto_now=True, verbose_name="Последнее обновление")
+    startDate = models.DateField(blank=True, null=True, verbose_name="Загружено с")
+    endDate = models.DateField(blank=True, null=True, verbose_name="Загружено по")
+    tickersTotal = models.IntegerField(default=0, verbose_name="Тикеров к загрузке")
+    tickersDone = models.IntegerField(default=0, verbose_name="Тикеров обработано")
+    countIndexes = models.IntegerField(default=0, verbose_name="Записано фиксингов акций")
+    countCurrencies = models.IntegerField(default=0, verbose_name="Записано фиксингов валют")
+    failedTickers = models.JSONField(default=dict, blank=True, verbose_name="Ошибки по тикерам")
+    timings = models.JSONField(default=dict, blank=True, verbose_name="Время этапов, с")
+    error = models.TextField(blank=True, verbose_name="Ошибка")
+
+    class Meta:
+        verbose_name = "Загрузка фиксингов"
+        verbose_name_plural = "Загрузки фиксингов"
+        constraints = [
+            # Одновременно может ждать или выполняться только одна загрузка
+            models.UniqueConstraint(
+                fields=["isActive"], condition=models.Q(isActive=True), name="unique_active_ingestion_job"
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.id}_{self.status}_{self.createdAt}"
+
+
+class MarketDataState(models.Model):
+    latestFixingDate = models.DateField(blank=True, null=True, verbose_name="Последний фиксинг акций")
+    latestCurrencyFixingDate = models.DateField(blank=True, null=True, verbose_name="Последний фиксинг валют")
+    fixingsCount = models.BigIntegerField(default=0, verbose_name="Фиксингов акций")
+    currencyFixingsCount = models.BigIntegerField(default=0, verbose_name="Фиксингов валют")
+    lastIngestionAt = models.DateTimeField(blank=True, null=True, verbose_name="Последняя загрузка")
+    snapshotsDate = models.DateField(blank=True, null=True, verbose_name="Снимки цен пересобраны за")
+    updatedAt = models.DateTimeField(auto_now=True, verbose_name="Пересчитано")
+
+    class Meta:
+        verbose_name = "Состояние рыночных данных"
+        verbose_name_plural = "Состояние рыночных данных"
+
+    def __str__(self):
+        return f"{self.latestFixingDate}_{self.fixingsCount}"
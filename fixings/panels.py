@@ -0,0 +1,176 @@
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from .caching import get_data_version
+from .history import price_history
+from .rates import rate_engine, to_ordinal
+from .registry import currency_registry
+
+# Сколько панелей вселенной (валюта, дата) держать в памяти процесса
+UNIVERSE_CACHE_SIZE = 8
+# Допустимые окна панели в днях: меньшие окна — срезы уже построенной панели той же валюты
+WINDOWS = (30, 90, 180, 365, 730, 1095, 1825, 3650)
+MAX_WINDOW = WINDOWS[-1]
+
+_lock = threading.Lock()
+_universes = OrderedDict()
+
+
+def price_matrix(index_ids, ordinals, currency="USD"):
+    """
+    Цены бумаг в валюте currency на каждую дату: последний фиксинг не позже даты, пересчитанный
+    по курсу на дату фиксинга (как Index.get_price). Нет фиксинга или курса — 0.
+
+    Returns:
+        np.ndarray: float64 формы (даты × бумаги)
+    """
+    if not len(index_ids):
+        return np.zeros((len(ordinals), 0))
+    fixing_days, prices, fixing_currencies = price_history.as_of_matrix(index_ids, ordinals)
+
+    converted = np.zeros(prices.shape)
+    for code in set(fixing_currencies[fixing_days >= 0].tolist()) - {None}:
+        selected = fixing_currencies == code
+        rates = rate_engine.cross_rates(currency, code, fixing_days[selected])
+        converted[selected] = np.divide(prices[selected], rates, out=np.zeros(len(rates)), where=rates != 0)
+    return np.nan_to_num(converted, nan=0.0)
+
+
+def currency_matrix(codes, ordinals, currency="USD"):
+    """Курсы валют codes в валюте currency на каждую дату (как Currency.get_price); нет курса — 0"""
+    result = np.zeros((len(ordinals), len(codes)))
+    for column, code in enumerate(codes):
+        result[:, column] = rate_engine.cross_rates(code, currency, ordinals)
+    return result
+
+
+def log_returns(prices):
+    """Дневные лог-доходности по строкам цен; дни без цены на любом из концов интервала дают 0"""
+    valid = (prices[1:] > 0) & (prices[:-1] > 0)
+    ratios = np.divide(prices[1:], prices[:-1], out=np.ones(valid.shape), where=valid)
+    return np.log(ratios)
+
+
+class UniversePanel:
+    """
+    Цены и дневные лог-доходности всех бумаг и валют в одной валюте на каждый календарный день окна.
+
+    Столбцы: сначала бумаги по возрастанию id, затем валюты по возрастанию id. Цены протянуты
+    вперёд с последнего фиксинга. Массивы общие для всех запросов и доступны только для чтения.
+    """
+
+    def __init__(self, index_ids, currency_ids, ordinals, prices, returns=None):
+        self.index_ids = index_ids
+        self.currency_ids = currency_ids
+        self.ordinals = ordinals
+        self.prices = prices
+        self.returns = log_returns(prices) if returns is None else returns
+        for array in (self.index_ids, self.currency_ids, self.ordinals, self.prices, self.returns):
+            array.flags.writeable = False
+
+    @property
+    def window(self):
+        return len(self.ordinals) - 1
+
+    def last(self, window):
+        """Панель последних window дней: срез массивов без копирования"""
+        if window == self.window:
+            return self
+        return UniversePanel(self.index_ids, self.currency_ids, self.ordinals[-window - 1:], self.prices[-window - 1:],
+                             self.returns[-window:])
+
+    def columns(self, index_ids=(), currency_ids=()):
+        """
+        Столбцы бумаг и валют в порядке запроса.
+
+        Raises:
+            KeyError: если каких-то id нет в панели
+        """
+        index_ids = np.asarray(index_ids, dtype=np.int64)
+        currency_ids = np.asarray(currency_ids, dtype=np.int64)
+        index_columns = np.searchsorted(self.index_ids, index_ids)
+        currency_columns = np.searchsorted(self.currency_ids, currency_ids)
+
+        missing = [
+            f"index {id_}" for id_, column in zip(index_ids.tolist(), index_columns.tolist())
+            if column >= len(self.index_ids) or self.index_ids[column] != id_
+        ] + [
+            f"currency {id_}" for id_, column in zip(currency_ids.tolist(), currency_columns.tolist())
+            if column >= len(self.currency_ids) or self.currency_ids[column] != id_
+        ]
+        if missing:
+            raise KeyError(", ".join(missing))
+        return np.concatenate([index_columns, currency_columns + len(self.index_ids)])
+
+    def trading_days(self, columns):
+        """Строки доходностей, где у какого-либо из столбцов был новый фиксинг (без выходных и праздников)"""
+        return np.any(self.returns[:, columns] != 0, axis=1)
+
+
+def get_universe_panel(currency="USD", window=365, date=None):
+    """
+    Панель всех бумаг и валют за window дней до даты date включительно в валюте currency.
+
+    Строится один раз на (валюта, дата, версия данных) для наибольшего запрошенного окна и дальше
+    переиспользуется всеми запросами: меньшее окно — срез строк, выборка любого набора инструментов —
+    срез столбцов без чтения истории.
+
+    Returns:
+        UniversePanel
+    """
+    from .models import Index
+
+    end = to_ordinal(date)
+    key = (currency, end, get_data_version())
+    with _lock:
+        panel = _universes.get(key)
+        if panel is not None and panel.window >= window:
+            _universes.move_to_end(key)
+            return panel.last(window)
+
+    index_ids = np.array(list(Index.objects.order_by("id").values_list("id", flat=True)), dtype=np.int64)
+    currencies = currency_registry.all()
+    ordinals = np.arange(end - window, end + 1, dtype=np.int64)
+    prices = np.hstack([
+        price_matrix(index_ids, ordinals, currency),
+        currency_matrix([item.currency for item in currencies], ordinals, currency),
+    ])
+    panel = UniversePanel(
+        index_ids, np.array([item.id for item in currencies], dtype=np.int64), ordinals, prices
+    )
+
+    with _lock:
+        cached = _universes.get(key)
+        if cached is None or cached.window < window:
+            _universes[key] = panel
+        _universes.move_to_end(key)
+        while len(_universes) > UNIVERSE_CACHE_SIZE:
+            _universes.popitem(last=False)
+    return panel
+
+
+def correlation_matrix(panel, columns):
+    """
+    Ковариация и корреляция дневных лог-доходностей столбцов панели по торговым дням.
+
+    Корреляция инструментов с нулевой дисперсией (например, валюты запроса к самой себе) — NaN.
+
+    Returns:
+        tuple: (ковариация, корреляция, количество наблюдений)
+    """
+    returns = panel.returns[panel.trading_days(columns)][:, columns]
+    observations = len(returns)
+    if observations < 2:
+        empty = np.full((len(columns), len(columns)), np.nan)
+        return empty, empty.copy(), observations
+
+    centered = returns - returns.mean(axis=0)
+    covariance = centered.T @ centered / (observations - 1)
+    deviations = np.sqrt(np.diag(covariance))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        correlation = covariance / np.outer(deviations, deviations)
+    correlation[~np.isfinite(correlation)] = np.nan
+    np.fill_diagonal(correlation, np.where(deviations > 0, 1.0, np.nan))
+    return covariance, np.clip(correlation, -1.0, 1.0), observations
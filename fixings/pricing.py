@@ -0,0 +1,120 @@
+import datetime
+from decimal import Decimal
+
+import numpy as np
+
+from .history import price_history
+from .models import Fixing, Index
+from .rates import rate_engine, to_ordinals
+from .registry import currency_registry
+
+INDEX = "index"
+CURRENCY = "currency"
+MAX_BATCH_SIZE = 10000
+
+
+def get_index_prices(indexes, dates, currency=None):
+    """
+    Пакетно рассчитывает цены бумаг на набор дат.
+
+    Повторяет Index.get_price для каждой пары (бумага, дата), но ищет фиксинги всех бумаг
+    одним проходом по колоночному хранилищу и не обращается к базе.
+
+    Args:
+        indexes: Бумаги
+        dates: Даты, на которые нужны цены
+        currency: Валюта цены; None — собственная валюта каждой бумаги
+
+    Returns:
+        dict: {(id бумаги, дата): Decimal}
+    """
+    dates = list(dates)
+    points = price_history.as_of_many([index.id for index in indexes], dates)
+
+    prices = {}
+    for index in indexes:
+        request_currency = currency if currency is not None else currency_registry.code(index.ccyId_id)
+        for date in dates:
+            point = points[(index.id, date)]
+            if not point:
+                prices[(index.id, date)] = Decimal('0.0')
+            else:
+                prices[(index.id, date)] = Fixing.convert_value(
+                    point.value, point.currency, point.date, currency=request_currency
+                )
+    return prices
+
+
+def get_index_quotes(indexes, currency="USD", days=30):
+    """
+    Предрасчитывает поля GetIndexesSerializer для списка бумаг.
+
+    Returns:
+        dict: {id бумаги: {"currentPrice", "currentConvertedPrice", "monthlyDynamic"}}
+    """
+    indexes = list(indexes)
+    today = datetime.date.today()
+    past = today - datetime.timedelta(days=days)
+
+    own_prices = get_index_prices(indexes, [today, past])
+    converted_prices = get_index_prices(indexes, [today], currency=currency)
+
+    return {
+        index.id: {
+            "currentPrice": own_prices[(index.id, today)],
+            "currentConvertedPrice": converted_prices[(index.id, today)],
+            "monthlyDynamic": Index.calculate_dynamic(own_prices[(index.id, today)], own_prices[(index.id, past)]),
+        }
+        for index in indexes
+    }
+
+
+def get_batch_prices(kinds, instruments, dates, currencies):
+    """
+    Цены произвольного набора (инструмент, дата, валюта цены) одним векторным as-of поиском.
+
+    Цены бумаг совпадают с Index.get_price, валют — с Currency.get_price: фиксинги всех бумаг ищутся
+    одним бинарным поиском по ключам (бумага, день) колоночного хранилища, курсы — по матрице курсов.
+    К базе обращается один раз, за валютами бумаг.
+
+    Args:
+        kinds: INDEX или CURRENCY для каждой строки
+        instruments: id бумаги или ISO код валюты
+        dates: даты (date, строка YYYY-MM-DD или порядковый номер дня)
+        currencies: ISO код валюты цены; None — собственная валюта бумаги, для валюты USD
+
+    Returns:
+        tuple: (валюты цен; цены Decimal, 0 если цены нет; дни фиксингов бумаг, -1 для валют
+                и бумаг без фиксинга на дату) — массивы длины запроса
+
+    Raises:
+        KeyError: если каких-то бумаг нет (в аргументе — их id)
+    """
+    kinds = np.array(list(kinds), dtype=object)
+    instruments = np.array(list(instruments), dtype=object)
+    ordinals = to_ordinals(dates)
+    currencies = np.array(list(currencies), dtype=object)
+
+    prices = np.full(len(ordinals), Decimal('0.0'), dtype=object)
+    days = np.full(len(ordinals), -1, dtype=np.int64)
+
+    indexes = np.flatnonzero(kinds == INDEX)
+    if len(indexes):
+        index_ids = instruments[indexes].astype(np.int64)
+        own = dict(Index.objects.filter(id__in=set(index_ids.tolist())).values_list("id", "ccyId_id"))
+        missing = sorted(set(index_ids.tolist()) - set(own))
+        if missing:
+            raise KeyError(missing)
+
+        for position, index_id in zip(indexes, index_ids.tolist()):
+            if currencies[position] is None:
+                currencies[position] = currency_registry.code(own[index_id])
+        days[indexes], values, value_currencies = price_history.as_of_arrays(index_ids, ordinals[indexes])
+        prices[indexes] = Fixing.convert_values(values, value_currencies, days[indexes], currencies[indexes])
+
+    rates = np.flatnonzero(kinds == CURRENCY)
+    if len(rates):
+        currencies[rates] = ["USD" if code is None else code for code in currencies[rates]]
+        prices[rates] = rate_engine.get_prices(instruments[rates], currencies[rates], ordinals[rates])
+
+    return currencies, prices, days
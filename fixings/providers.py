@@ -0,0 +1,155 @@
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+import yfinance as yf
+from django.conf import settings
+
+
+def _empty():
+    return np.empty(0, dtype="datetime64[D]"), np.empty(0, dtype=np.float64)
+
+
+def _bars(closes, opens=None, highs=None, lows=None, volumes=None):
+    """Массив OHLCV (5 × дней); отсутствующие колонки цен заменяются ценой закрытия, объёма — NaN"""
+    closes = np.asarray(closes, dtype=np.float64)
+    columns = [closes if column is None else np.asarray(column, dtype=np.float64) for column in (opens, highs, lows)]
+    volumes = np.full(len(closes), np.nan) if volumes is None else np.asarray(volumes, dtype=np.float64)
+    return np.vstack(columns + [closes, volumes])
+
+
+class MarketDataProvider:
+    """
+    Источник цен закрытия для загрузки фиксингов.
+
+    fetch_closes возвращает даты (datetime64[D]) и цены (float64) тикера за [start_date, end_date)
+    и выбрасывает исключение при ошибке источника: загрузчик повторит запрос. fetch_bars возвращает
+    те же даты и дневные OHLCV; источники без них отдают цены закрытия как open, high, low и close.
+    """
+
+    name = None
+
+    def fetch_closes(self, ticker, start_date, end_date):
+        raise NotImplementedError
+
+    def fetch_bars(self, ticker, start_date, end_date):
+        """Даты (datetime64[D]) и массив (5 × дней) float64: open, high, low, close, volume (NaN, если нет)"""
+        dates, closes = self.fetch_closes(ticker, start_date, end_date)
+        return dates, _bars(closes)
+
+
+class YFinanceProvider(MarketDataProvider):
+    """Yahoo Finance через yfinance; каждый тикер запрашивается отдельным Ticker, это безопасно для потоков"""
+
+    name = "yfinance"
+
+    @staticmethod
+    def _history(ticker, start_date, end_date):
+        data = yf.Ticker(ticker).history(
+            start=start_date.isoformat(),
+            end=end_date.isoformat(),
+            interval="1d",
+            auto_adjust=True,
+            raise_errors=True,
+        )
+        if data.empty or "Close" not in data.columns:
+            return None
+
+        data = data[data["Close"].notna()]
+        # Даты берутся в часовом поясе биржи, как их показывает Yahoo
+        dates = np.array([timestamp.date() for timestamp in data.index], dtype="datetime64[D]")
+        return dates, data
+
+    def fetch_closes(self, ticker, start_date, end_date):
+        history = self._history(ticker, start_date, end_date)
+        if history is None:
+            return _empty()
+        dates, data = history
+        return dates, data["Close"].to_numpy(dtype=np.float64)
+
+    def fetch_bars(self, ticker, start_date, end_date):
+        # Цены скорректированы на сплиты и дивиденды (auto_adjust), как и цены закрытия в Fixing
+        history = self._history(ticker, start_date, end_date)
+        if history is None:
+            dates, closes = _empty()
+            return dates, _bars(closes)
+        dates, data = history
+        return dates, _bars(*(data[column] if column in data.columns else None
+                              for column in ("Close", "Open", "High", "Low", "Volume")))
+
+
+class FileProvider(MarketDataProvider):
+    """
+    Локальные снимки цен в Parquet или CSV.
+
+    path — каталог с файлами {тикер}.parquet / {тикер}.csv (колонки date и close) или один файл
+    с колонками ticker, date и close. Необязательные колонки open, high, low и volume читает fetch_bars.
+    Для Parquet нужен pyarrow или fastparquet.
+    """
+
+    name = "file"
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._table = None
+
+    @staticmethod
+    def _read(path):
+        if path.endswith(".parquet"):
+            return pd.read_parquet(path)
+        return pd.read_csv(path)
+
+    @staticmethod
+    def _arrays(frame, start_date, end_date, columns=("close",)):
+        dates = pd.to_datetime(frame["date"]).to_numpy(dtype="datetime64[D]")
+        values = [frame[column].to_numpy(dtype=np.float64) if column in frame.columns else None for column in columns]
+        mask = (dates >= np.datetime64(start_date, "D")) & (dates < np.datetime64(end_date, "D")) & ~np.isnan(values[0])
+        order = np.argsort(dates[mask], kind="stable")
+        return (dates[mask][order], *(None if column is None else column[mask][order] for column in values))
+
+    def _single_file(self):
+        with self._lock:
+            if self._table is None:
+                table = self._read(self.path)
+                self._table = {ticker: frame for ticker, frame in table.groupby("ticker", sort=False)}
+            return self._table
+
+    def _frame(self, ticker):
+        if not os.path.isdir(self.path):
+            return self._single_file().get(ticker)
+
+        for extension in (".parquet", ".csv"):
+            file_path = os.path.join(self.path, f"{ticker}{extension}")
+            if os.path.exists(file_path):
+                return self._read(file_path)
+        return None
+
+    def fetch_closes(self, ticker, start_date, end_date):
+        frame = self._frame(ticker)
+        return _empty() if frame is None else self._arrays(frame, start_date, end_date)
+
+    def fetch_bars(self, ticker, start_date, end_date):
+        frame = self._frame(ticker)
+        if frame is None:
+            dates, closes = _empty()
+            return dates, _bars(closes)
+        dates, *columns = self._arrays(frame, start_date, end_date, ("close", "open", "high", "low", "volume"))
+        return dates, _bars(*columns)
+
+
+def get_provider(name=None, path=None):
+    """
+    Провайдер по имени: "yfinance" или "file". По умолчанию — MARKET_DATA_PROVIDER из настроек,
+    каталог файлового провайдера — MARKET_DATA_DIR.
+    """
+    name = name or getattr(settings, "MARKET_DATA_PROVIDER", None) or YFinanceProvider.name
+    if name == YFinanceProvider.name:
+        return YFinanceProvider()
+    if name == FileProvider.name:
+        path = path or getattr(settings, "MARKET_DATA_DIR", None)
+        if not path:
+            raise ValueError("Для файлового провайдера нужен путь к снимкам (MARKET_DATA_DIR)")
+        return FileProvider(path)
+    raise ValueError(f"Unknown market data provider {name}")
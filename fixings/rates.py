@@ -0,0 +1,385 @@
+import datetime
+import threading
+import time
+from decimal import Decimal
+
+import numpy as np
+from django.conf import settings
+from django.db.models import Count, Max
+
+def to_ordinal(date):
+    """Переводит дату (date, datetime или строку YYYY-MM-DD) в порядковый номер дня"""
+    if date is None:
+        date = datetime.date.today()
+    if isinstance(date, str):
+        date = datetime.date.fromisoformat(date[:10])
+    if isinstance(date, datetime.datetime):
+        date = date.date()
+    return date.toordinal()
+
+
+def to_ordinals(dates):
+    """Переводит последовательность дат (или порядковых номеров) в массив int64"""
+    return np.fromiter(
+        (date if isinstance(date, (int, np.integer)) else to_ordinal(date) for date in dates), dtype=np.int64
+    )
+
+
+def truthy(values):
+    """Поэлементная истинность массива object: None и нули дают False"""
+    return np.fromiter((bool(value) for value in values), dtype=bool, count=len(values))
+
+
+class RateEngine:
+    """
+    Матрица курсов валют к USD в памяти процесса.
+
+    История CurrencyUSDFixing загружается один раз в плотные массивы NumPy (дни × валюты):
+    значения фиксингов на дату (исходные Decimal и float64 для векторных расчётов) и индекс
+    последнего фиксинга не позже каждого дня. Поиск курса
+    на дату сводится к чтению ячейки по номеру дня, без запросов к базе. Новые фиксинги
+    догружаются инкрементально по id; проверка наличия новых данных выполняется не чаще,
+    чем раз в RATE_ENGINE_REFRESH_SECONDS.
+    """
+
+    def __init__(self, refresh_interval=None):
+        self._refresh_interval = refresh_interval
+        self._lock = threading.RLock()
+        self._loaded = False
+        self._checked_at = 0.0
+        self._signature = (0, None)
+        self._columns = {}
+        self._start = 0
+        self._values = np.empty((0, 0))
+        self._decimals = np.empty((0, 0), dtype=object)
+        self._present = np.empty((0, 0), dtype=bool)
+        self._asof = np.empty((0, 0), dtype=np.int64)
+        self._filled = np.empty((0, 0))
+
+    @property
+    def refresh_interval(self):
+        if self._refresh_interval is not None:
+            return self._refresh_interval
+        return getattr(settings, "RATE_ENGINE_REFRESH_SECONDS", 60)
+
+    # Загрузка и обновление
+
+    def load(self):
+        """Полностью перечитывает валюты и историю курсов из базы"""
+        with self._lock:
+            self._columns = {}
+            self._start = 0
+            self._values = np.empty((0, 0))
+            self._decimals = np.empty((0, 0), dtype=object)
+            self._present = np.empty((0, 0), dtype=bool)
+            self._load_currencies()
+            rows = self._fetch_rows(last_id=None)
+            self._apply(rows)
+            self._signature = (len(rows), max((row[0] for row in rows), default=None))
+            self._checked_at = time.monotonic()
+            self._loaded = True
+
+    def refresh(self):
+        """Догружает фиксинги, появившиеся после последней загрузки; при удалениях перечитывает всё"""
+        with self._lock:
+            if not self._loaded:
+                return self.load()
+
+            count, last_id = self._fetch_signature()
+            loaded_count, loaded_last_id = self._signature
+            self._checked_at = time.monotonic()
+
+            if (count, last_id) == self._signature:
+                return
+
+            if count < loaded_count or (last_id or 0) < (loaded_last_id or 0):
+                return self.load()
+
+            self._load_currencies()
+            rows = self._fetch_rows(last_id=loaded_last_id)
+            if loaded_count + len(rows) != count or (rows and min(row[2] for row in rows) < self._start):
+                return self.load()
+
+            self._apply(rows)
+            self._signature = (count, max(row[0] for row in rows))
+
+    def invalidate(self):
+        """Помечает данные устаревшими: следующее обращение перечитает историю"""
+        with self._lock:
+            self._loaded = False
+
+    def ensure_fresh(self):
+        if not self._loaded:
+            self.load()
+        elif time.monotonic() - self._checked_at >= self.refresh_interval:
+            self.refresh()
+
+    def _load_currencies(self):
+        from .models import Currency
+
+        for code in Currency.objects.order_by("id").values_list("currency", flat=True):
+            if code not in self._columns:
+                self._columns[code] = len(self._columns)
+
+    def _fetch_signature(self):
+        from .models import CurrencyUSDFixing
+
+        stats = CurrencyUSDFixing.objects.filter(
+            currencyId__isnull=False, currencyFixingDate__isnull=False
+        ).aggregate(count=Count("id"), last=Max("id"))
+        return stats["count"], stats["last"]
+
+    def _fetch_rows(self, last_id):
+        from .models import CurrencyUSDFixing
+
+        queryset = CurrencyUSDFixing.objects.filter(currencyId__isnull=False, currencyFixingDate__isnull=False)
+        if last_id is not None:
+            queryset = queryset.filter(id__gt=last_id)
+
+        return [
+            (fixing_id, self._columns[code], date.toordinal(), value)
+            for fixing_id, code, date, value in queryset.order_by("id").values_list(
+                "id", "currencyId__currency", "currencyFixingDate", "valueUSD"
+            )
+        ]
+
+    def _apply(self, rows):
+        """Вписывает строки (id, столбец, день, значение) в матрицу и пересчитывает производные массивы"""
+        width = len(self._columns)
+        if rows:
+            first = min(row[2] for row in rows)
+            last = max(row[2] for row in rows)
+            if self._values.shape[0]:
+                first = min(first, self._start)
+                last = max(last, self._start + self._values.shape[0] - 1)
+        elif self._values.shape[0]:
+            first, last = self._start, self._start + self._values.shape[0] - 1
+        else:
+            first, last = 0, -1
+
+        values = np.full((last - first + 1, width), np.nan)
+        decimals = np.full((last - first + 1, width), None, dtype=object)
+        present = np.zeros((last - first + 1, width), dtype=bool)
+        if self._values.size:
+            offset = self._start - first
+            height, old_width = self._values.shape
+            values[offset:offset + height, :old_width] = self._values
+            decimals[offset:offset + height, :old_width] = self._decimals
+            present[offset:offset + height, :old_width] = self._present
+
+        if rows:
+            _, columns, days, raw = zip(*rows)
+            rows_idx = np.fromiter(days, dtype=np.int64, count=len(days)) - first
+            cols_idx = np.fromiter(columns, dtype=np.int64, count=len(columns))
+            values[rows_idx, cols_idx] = [np.nan if value is None else float(value) for value in raw]
+            decimals[rows_idx, cols_idx] = raw
+            present[rows_idx, cols_idx] = True
+
+        self._start = first
+        self._values = values
+        self._decimals = decimals
+        self._present = present
+
+        positions = np.arange(values.shape[0], dtype=np.int64)[:, None]
+        self._asof = np.maximum.accumulate(np.where(present, positions, -1), axis=0) if values.size else \
+            np.full(values.shape, -1, dtype=np.int64)
+        self._filled = np.where(
+            self._asof >= 0,
+            np.take_along_axis(values, np.maximum(self._asof, 0), axis=0),
+            np.nan,
+        ) if values.size else values.copy()
+
+    # Поиск курсов
+
+    def _column(self, currency):
+        from .models import Currency
+        from .registry import currency_registry
+
+        column = self._columns.get(currency)
+        if column is None:
+            if currency_registry.find(currency) is None:
+                raise Currency.DoesNotExist(f"Currency {currency} does not exist")
+            self.load()
+            column = self._columns[currency]
+        return column
+
+    def _row(self, ordinal):
+        """Номер строки матрицы для дня; даты позже последнего фиксинга берут последнюю строку"""
+        row = ordinal - self._start
+        if row < 0 or not self._values.shape[0]:
+            return None
+        return min(row, self._values.shape[0] - 1)
+
+    def _asof_row(self, column, ordinal):
+        row = self._row(ordinal)
+        if row is None or column >= self._asof.shape[1]:
+            return None
+        found = self._asof[row, column]
+        return None if found < 0 else int(found)
+
+    def _value(self, column, row):
+        if row is None or column >= self._values.shape[1] or not self._present[row, column]:
+            return None
+        return self._decimals[row, column]
+
+    def usd_value(self, currency, date=None):
+        """Курс валюты к USD по последнему фиксингу не позже даты (valueUSD) или None"""
+        with self._lock:
+            self.ensure_fresh()
+            column = self._column(currency)
+            return self._value(column, self._asof_row(column, to_ordinal(date)))
+
+    def get_price(self, currency, request_currency=None, date=None):
+        """
+        Цена валюты currency в валюте request_currency на дату.
+
+        Повторяет семантику Currency.get_price / CurrencyUSDFixing.get_value: кросс-курс берётся
+        по последнему фиксингу валюты не позже даты и фиксингу целевой валюты ровно на ту же дату.
+        """
+        if request_currency is None:
+            request_currency = "USD"
+
+        if currency == request_currency:
+            return Decimal('1')
+
+        with self._lock:
+            self.ensure_fresh()
+            ordinal = to_ordinal(date)
+
+            if currency == "USD":
+                column = self._column(request_currency)
+                target = self._value(column, self._asof_row(column, ordinal))
+                if not target:
+                    return Decimal('0.0')
+                return Decimal('1') / target
+
+            column = self._column(currency)
+            row = self._asof_row(column, ordinal)
+            if row is None:
+                return Decimal('0.0')
+
+            value = self._value(column, row)
+            if request_currency == "USD":
+                return value
+
+            target_column = self._columns.get(request_currency)
+            target = None if target_column is None else self._value(target_column, row)
+            if not target or value is None:
+                return Decimal('0.0')
+
+            return value / target
+
+    def cross_rates(self, currency, request_currency, dates):
+        """
+        Векторный вариант get_price во float64 для массива дат (date или порядковых номеров).
+        Отсутствующие курсы возвращаются как 0.
+        """
+        ordinals = to_ordinals(dates)
+        if request_currency is None:
+            request_currency = "USD"
+        if currency == request_currency:
+            return np.ones(len(ordinals))
+
+        with self._lock:
+            self.ensure_fresh()
+            result = np.zeros(len(ordinals))
+            if not self._values.shape[0]:
+                return result
+
+            rows = ordinals - self._start
+            valid = rows >= 0
+            rows = np.clip(rows, 0, self._values.shape[0] - 1)
+
+            if currency == "USD":
+                target = self._filled[rows, self._column(request_currency)]
+                ok = valid & ~np.isnan(target) & (target != 0)
+                result[ok] = 1 / target[ok]
+                return result
+
+            column = self._column(currency)
+            source_rows = self._asof[rows, column]
+            ok = valid & (source_rows >= 0)
+            source_rows = np.maximum(source_rows, 0)
+            value = self._values[source_rows, column]
+
+            if request_currency == "USD":
+                ok &= ~np.isnan(value)
+                result[ok] = value[ok]
+                return result
+
+            target_column = self._columns.get(request_currency)
+            if target_column is None:
+                return result
+            target = np.where(self._present[source_rows, target_column], self._values[source_rows, target_column],
+                              np.nan)
+            ok &= ~np.isnan(value) & ~np.isnan(target) & (target != 0)
+            result[ok] = value[ok] / target[ok]
+            return result
+
+    def get_prices(self, currencies, request_currencies, dates):
+        """
+        Векторный get_price с точными Decimal для массивов одной длины: валюты, валюты запроса
+        и даты (date или порядковые номера). Возвращает массив object.
+        """
+        currencies = np.array(list(currencies), dtype=object)
+        requests = np.array(["USD" if code is None else code for code in request_currencies], dtype=object)
+        ordinals = to_ordinals(dates)
+
+        result = np.full(len(ordinals), Decimal('0.0'), dtype=object)
+        same = currencies == requests
+        result[same] = Decimal('1')
+
+        with self._lock:
+            self.ensure_fresh()
+            for currency in set(currencies[~same].tolist()):
+                selected = np.flatnonzero((currencies == currency) & ~same)
+                result[selected] = self._prices(currency, requests[selected], ordinals[selected])
+        return result
+
+    def _prices(self, currency, requests, ordinals):
+        result = np.full(len(ordinals), Decimal('0.0'), dtype=object)
+
+        # Неизвестные валюты разрешаются до чтения массивов: _column может перезагрузить матрицу
+        if currency == "USD":
+            columns = {code: self._column(code) for code in set(requests.tolist())}
+        else:
+            column = self._column(currency)
+            columns = {code: self._columns.get(code, -1) for code in set(requests.tolist())}
+        request_columns = np.fromiter((columns[code] for code in requests), dtype=np.int64, count=len(requests))
+
+        height, width = self._asof.shape
+        if not height:
+            return result
+
+        rows = ordinals - self._start
+        valid = rows >= 0
+        rows = np.clip(rows, 0, height - 1)
+
+        if currency == "USD":
+            safe = np.clip(request_columns, 0, width - 1)
+            source = self._asof[rows, safe]
+            target = self._decimals[np.maximum(source, 0), safe]
+            ok = valid & (request_columns < width) & (source >= 0) & truthy(target)
+            result[ok] = Decimal('1') / target[ok]
+            return result
+
+        if column >= width:
+            return result
+
+        source = self._asof[rows, column]
+        ok = valid & (source >= 0)
+        source = np.maximum(source, 0)
+        value = self._decimals[source, column]
+
+        usd = ok & (requests == "USD")
+        result[usd] = value[usd]
+
+        safe = np.clip(request_columns, 0, width - 1)
+        target = np.where(self._present[source, safe], self._decimals[source, safe], None)
+        cross = ok & (requests != "USD") & (request_columns >= 0) & (request_columns < width)
+        cross &= truthy(target) & np.fromiter((item is not None for item in value), dtype=bool, count=len(value))
+        result[cross] = value[cross] / target[cross]
+        return result
+
+
+rate_engine = RateEngine()
@@ -0,0 +1,87 @@
+import threading
+import time
+
+from django.conf import settings
+
+from .caching import get_data_version
+
+
+class CurrencyRegistry:
+    """
+    Справочник валют в памяти процесса: поиск по ISO коду, тикеру и id без запросов к базе.
+
+    Таблица валют маленькая и меняется редко, поэтому загружается целиком. Сбрасывается сигналами
+    сохранения и удаления Currency и командой create_currencies; в остальных процессах — по смене
+    версии данных (см. fixings.caching), которая проверяется не чаще, чем раз в RATE_ENGINE_REFRESH_SECONDS.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._version = None
+        self._checked_at = 0.0
+        self._snapshot = None
+
+    def invalidate(self):
+        with self._lock:
+            self._snapshot = None
+
+    def _ensure_loaded(self):
+        """
+        Текущий снимок справочника: (по коду, по тикеру, по id). Снимок не меняется после загрузки,
+        поэтому параллельный invalidate не затрагивает уже полученную ссылку.
+        """
+        from .models import Currency
+
+        snapshot = self._snapshot
+        if snapshot is not None and time.monotonic() - self._checked_at < getattr(settings, "RATE_ENGINE_REFRESH_SECONDS", 60):
+            return snapshot
+        version = get_data_version()
+        with self._lock:
+            self._checked_at = time.monotonic()
+            if self._snapshot is not None and self._version == version:
+                return self._snapshot
+            currencies = list(Currency.objects.order_by("id"))
+            self._snapshot = (
+                {currency.currency: currency for currency in currencies},
+                {currency.ticker: currency for currency in currencies if currency.ticker},
+                {currency.id: currency for currency in currencies},
+            )
+            self._version = version
+            return self._snapshot
+
+    def all(self):
+        """Все валюты в порядке id"""
+        _, _, by_id = self._ensure_loaded()
+        return list(by_id.values())
+
+    def find(self, code):
+        """Валюта по ISO коду или None"""
+        by_code, _, _ = self._ensure_loaded()
+        return by_code.get(code)
+
+    def get(self, code):
+        """Валюта по ISO коду; как Currency.objects.get, выбрасывает Currency.DoesNotExist"""
+        from .models import Currency
+
+        currency = self.find(code)
+        if currency is None:
+            raise Currency.DoesNotExist(f"Currency {code} does not exist")
+        return currency
+
+    def by_ticker(self, ticker):
+        """Валюта по тикеру вида {ISO}USD=X или None"""
+        _, by_ticker, _ = self._ensure_loaded()
+        return by_ticker.get(ticker)
+
+    def by_id(self, currency_id):
+        """Валюта по id или None"""
+        _, _, by_id = self._ensure_loaded()
+        return by_id.get(currency_id)
+
+    def code(self, currency_id):
+        """ISO код валюты по id или None"""
+        currency = self.by_id(currency_id)
+        return currency.currency if currency else None
+
+
+currency_registry = CurrencyRegistry()
@@ -1,7 +1,9 @@
 from rest_framework import serializers
 from decimal import Decimal, ROUND_HALF_UP
 
-from .models import Currency, Fixing, CurrencyUSDFixing, Index
+from market_vision_backend.metrics import profiled_fields
+from .models import Currency, Fixing, CurrencyUSDFixing, Index, IngestionJob, MarketDataState
+from .snapshots import has_fresh_snapshot
 
 
 def round_decimal(value):
@@ -21,10 +23,14 @@ class GetCurrenciesListSerializer(serializers.ModelSerializer):
         fields = "__all__"
 
     def get_currentConvertedPrice(self, instance):
+        if has_fresh_snapshot(instance):
+            return round_decimal(instance.currentConvertedPrice)
         currency = self.context.get("currency", "USD")
         return round_decimal(instance.get_price(request_currency=currency))
 
     def get_monthlyDynamic(self, instance):
+        if has_fresh_snapshot(instance):
+            return round_decimal(instance.monthlyDynamic)
         currency = self.context.get("currency", "USD")
         return round_decimal((instance.get_dynamic(currency=currency) - 1) * 100)
 
@@ -35,6 +41,7 @@ class CurrencySerializer(serializers.ModelSerializer):
         fields = "__all__"
 
 
+@profiled_fields
 class GetIndexesSerializer(serializers.ModelSerializer):
     currentPrice = serializers.SerializerMethodField()
     currentConvertedPrice = serializers.SerializerMethodField()
@@ -47,11 +54,45 @@ class GetIndexesSerializer(serializers.ModelSerializer):
         # fields = "__all__"
         # depth = 1
 
+    def _get_quote(self, instance):
+        """Предрасчитанные значения: из снимка цен, подтянутого в queryset, или get_index_quotes из контекста"""
+        if has_fresh_snapshot(instance):
+            return {
+                "currentPrice": instance.currentPrice,
+                "currentConvertedPrice": instance.currentConvertedPrice,
+                "monthlyDynamic": instance.monthlyDynamic,
+            }
+        quotes = self.context.get("quotes")
+        if quotes is None:
+            return None
+        return quotes.get(instance.id)
+
     def get_currentPrice(self, instance):
+        quote = self._get_quote(instance)
+        if quote is not None:
+            return round_decimal(quote["currentPrice"])
         return round_decimal(instance.get_price())
 
     def get_currentConvertedPrice(self, instance):
+        quote = self._get_quote(instance)
+        if quote is not None:
+            return round_decimal(quote["currentConvertedPrice"])
         return round_decimal(instance.get_price(request_currency=self.context.get("currency", "USD")))
 
     def get_monthlyDynamic(self, instance):
+        quote = self._get_quote(instance)
+        if quote is not None:
+            return round_decimal(quote["monthlyDynamic"])
         return round_decimal(instance.get_dynamic())
+
+
+class IngestionJobSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = IngestionJob
+        exclude = ["isActive"]
+
+
+class MarketDataStateSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = MarketDataState
+        exclude = ["id"]
@@ -0,0 +1,53 @@
+from django.db.models import F
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import Signal, receiver
+from django.utils import timezone
+
+from .caching import bump_data_version
+from .history import price_history
+from .models import Currency, CurrencyUSDFixing, Fixing, Index, MarketDataState
+from .rates import rate_engine
+from .registry import currency_registry
+from .state import STATE_ID
+
+# Пакетная загрузка фиксингов (bulk_create и merge не вызывают post_save).
+# Аргументы: index_ids и currency_ids — бумаги и валюты, по которым записаны фиксинги
+fixings_loaded = Signal()
+
+
+@receiver([post_save, post_delete], sender=Currency)
+@receiver([post_save, post_delete], sender=CurrencyUSDFixing)
+def invalidate_rate_engine(sender, **kwargs):
+    """Правки валют и курсов через админку или ORM сбрасывают матрицу курсов"""
+    rate_engine.invalidate()
+
+
+@receiver([post_save, post_delete], sender=Currency)
+def invalidate_currency_registry(sender, **kwargs):
+    """Справочник валют в памяти процесса перечитывается после правок валют"""
+    currency_registry.invalidate()
+
+
+@receiver([post_save, post_delete], sender=Fixing)
+def invalidate_price_history(sender, **kwargs):
+    """Правки отдельных фиксингов бумаг сбрасывают колоночное хранилище цен"""
+    price_history.invalidate()
+
+
+@receiver([post_save, post_delete], sender=Fixing)
+def touch_market_data_state(sender, created=False, **kwargs):
+    """
+    Правки отдельных фиксингов отмечаются в MarketDataState без пересчёта: другие процессы
+    сверяют с ним хранилище цен (см. PriceHistoryStore._fetch_signature)
+    """
+    delta = -1 if kwargs["signal"] is post_delete else int(created)
+    MarketDataState.objects.filter(id=STATE_ID).update(fixingsCount=F("fixingsCount") + delta, updatedAt=timezone.now())
+
+
+@receiver([post_save, post_delete], sender=Currency)
+@receiver([post_save, post_delete], sender=Index)
+@receiver([post_save, post_delete], sender=CurrencyUSDFixing)
+@receiver([post_save, post_delete], sender=Fixing)
+def invalidate_cached_responses(sender, **kwargs):
+    """Любая правка справочников и фиксингов меняет версию данных закэшированных списков"""
+    bump_data_version()
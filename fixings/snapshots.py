@@ -0,0 +1,121 @@
+import datetime
+from decimal import Decimal
+
+from django.db.models import F, FilteredRelation, Q, Value
+from django.db.models.functions import Coalesce
+
+from .caching import bump_data_version
+from .models import Index, IndexPriceSnapshot, CurrencyPriceSnapshot
+from .pricing import get_index_quotes
+from .registry import currency_registry
+
+_INDEX_FIELDS = ["snapshotDate", "currentPrice", "currentConvertedPrice", "monthlyDynamic"]
+_CURRENCY_FIELDS = ["snapshotDate", "currentConvertedPrice", "monthlyDynamic"]
+
+def rebuild_price_snapshots(indexes=None, currencies=None, days=30):
+    """
+    Пересчитывает снимки текущих цен и динамики за days дней во всех валютах котировки.
+
+    Запускается загрузкой фиксингов, командой rebuild_price_snapshots и раз в день в фоновом потоке
+    по первому запросу списка с устаревшим снимком (см. tasks.schedule_snapshot_rebuild): динамика
+    считается от текущей даты. Сами запросы списков снимки не пересобирают.
+
+    Args:
+        indexes: Бумаги, чьи снимки нужно обновить; None — все, если не переданы currencies
+        currencies: Валюты, чьи снимки нужно обновить; None — все, если не переданы indexes
+
+    Returns:
+        tuple: (количество снимков бумаг, количество снимков валют)
+    """
+    today = datetime.date.today()
+    full = indexes is None and currencies is None
+    quote_currencies = currency_registry.all()
+
+    index_queryset = Index.objects.select_related("ccyId").filter(ccyId__isnull=False)
+    if not full:
+        index_queryset = index_queryset.filter(id__in=[getattr(index, "id", index) for index in indexes or []])
+    index_list = list(index_queryset)
+
+    currency_list = quote_currencies
+    if not full:
+        currency_ids = {getattr(currency, "id", currency) for currency in currencies or []}
+        currency_list = [currency for currency in quote_currencies if currency.id in currency_ids]
+
+    index_snapshots = []
+    currency_snapshots = []
+    for quote in quote_currencies:
+        quotes = get_index_quotes(index_list, currency=quote.currency, days=days)
+        for index in index_list:
+            index_snapshots.append(IndexPriceSnapshot(
+                indexId=index,
+                currencyId=quote,
+                snapshotDate=today,
+                **quotes[index.id]
+            ))
+
+        for currency in currency_list:
+            currency_snapshots.append(CurrencyPriceSnapshot(
+                currencyId=currency,
+                quoteCurrencyId=quote,
+                snapshotDate=today,
+                currentConvertedPrice=currency.get_price(request_currency=quote.currency),
+                monthlyDynamic=(currency.get_dynamic(days=days, currency=quote.currency) - 1) * 100,
+            ))
+
+    IndexPriceSnapshot.objects.bulk_create(
+        index_snapshots,
+        batch_size=1000,
+        update_conflicts=True,
+        unique_fields=["indexId", "currencyId"],
+        update_fields=_INDEX_FIELDS,
+    )
+    CurrencyPriceSnapshot.objects.bulk_create(
+        currency_snapshots,
+        batch_size=1000,
+        update_conflicts=True,
+        unique_fields=["currencyId", "quoteCurrencyId"],
+        update_fields=_CURRENCY_FIELDS,
+    )
+
+    bump_data_version()
+
+    return len(index_snapshots), len(currency_snapshots)
+
+
+def has_fresh_snapshot(instance):
+    """
+    Подтянут ли к объекту снимок за сегодня. Пока фоновая пересборка не закончилась, список ещё
+    сортируется по вчерашнему снимку, а значения устаревших строк считаются на лету одним пакетом.
+    """
+    return getattr(instance, "snapshotDate", None) == datetime.date.today()
+
+
+def annotate_index_snapshots(queryset, currency="USD"):
+    """
+    Подтягивает к queryset бумаг поля снимка в валюте currency: currentPrice,
+    currentConvertedPrice и monthlyDynamic. Сортировка и пагинация по ним выполняются в базе.
+    """
+    quote = currency_registry.find(currency)
+    quote_id = quote.id if quote else None
+    return queryset.annotate(
+        snapshot=FilteredRelation("priceSnapshots", condition=Q(priceSnapshots__currencyId=quote_id)),
+    ).annotate(
+        snapshotDate=F("snapshot__snapshotDate"),
+        currentPrice=F("snapshot__currentPrice"),
+        currentConvertedPrice=F("snapshot__currentConvertedPrice"),
+        # Index.get_dynamic возвращает None при нулевой базе, в списке это 0
+        monthlyDynamic=Coalesce(F("snapshot__monthlyDynamic"), Value(Decimal('0'))),
+    )
+
+
+def annotate_currency_snapshots(queryset, currency="USD"):
+    """Подтягивает к queryset валют поля снимка в валюте currency: currentConvertedPrice и monthlyDynamic"""
+    quote = currency_registry.find(currency)
+    quote_id = quote.id if quote else None
+    return queryset.annotate(
+        snapshot=FilteredRelation("priceSnapshots", condition=Q(priceSnapshots__quoteCurrencyId=quote_id)),
+    ).annotate(
+        snapshotDate=F("snapshot__snapshotDate"),
+        currentConvertedPrice=F("snapshot__currentConvertedPrice"),
+        monthlyDynamic=F("snapshot__monthlyDynamic"),
+    )
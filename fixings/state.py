@@ -0,0 +1,67 @@
+import threading
+import time
+
+from django.conf import settings
+from django.db.models import Count, Max
+from django.utils import timezone
+
+from .caching import get_data_version
+from .models import MarketDataState, Fixing, CurrencyUSDFixing
+
+# Состояние хранится одной строкой
+STATE_ID = 1
+
+_lock = threading.Lock()
+_cached = None
+_cached_version = None
+_cached_at = 0.0
+
+
+def update_market_data_state(ingested=False):
+    """
+    Пересчитывает состояние рыночных данных: последние даты и количество фиксингов по таблицам.
+
+    Args:
+        ingested: Отметить время загрузки фиксингов
+    """
+    fixings = Fixing.objects.aggregate(latest=Max("fixingDate"), count=Count("id"))
+    currency_fixings = CurrencyUSDFixing.objects.aggregate(latest=Max("currencyFixingDate"), count=Count("id"))
+
+    defaults = {
+        "latestFixingDate": fixings["latest"],
+        "fixingsCount": fixings["count"],
+        "latestCurrencyFixingDate": currency_fixings["latest"],
+        "currencyFixingsCount": currency_fixings["count"],
+    }
+    if ingested:
+        defaults["lastIngestionAt"] = timezone.now()
+
+    state, _ = MarketDataState.objects.update_or_create(id=STATE_ID, defaults=defaults)
+    invalidate_market_data_state()
+    return state
+
+
+def invalidate_market_data_state():
+    global _cached
+
+    with _lock:
+        _cached = None
+
+
+def get_market_data_state():
+    """
+    Состояние рыночных данных из памяти процесса. Перечитывается из базы при смене версии данных
+    и не реже, чем раз в RATE_ENGINE_REFRESH_SECONDS; если строки ещё нет, она пересчитывается.
+    """
+    global _cached, _cached_version, _cached_at
+
+    version = get_data_version()
+    interval = getattr(settings, "RATE_ENGINE_REFRESH_SECONDS", 60)
+    with _lock:
+        if _cached is not None and _cached_version == version and time.monotonic() - _cached_at < interval:
+            return _cached
+
+    state = MarketDataState.objects.filter(id=STATE_ID).first() or update_market_data_state()
+    with _lock:
+        _cached, _cached_version, _cached_at = state, version, time.monotonic()
+    return state
@@ -0,0 +1,173 @@
+import datetime
+import threading
+import time
+
+from django.conf import settings
+from django.db import IntegrityError, close_old_connections, connection, transaction
+from django.utils import timezone
+
+from .ingestion import ingest_fixings
+from .models import IngestionJob, MarketDataState
+from .snapshots import rebuild_price_snapshots
+from .state import STATE_ID, get_market_data_state
+
+# Выполняющаяся загрузка отмечается раз в HEARTBEAT_INTERVAL секунд на всех этапах; активная загрузка,
+# не обновлявшаяся дольше STALE_AFTER, считается оборванной (процесс упал)
+HEARTBEAT_INTERVAL = 60
+STALE_AFTER = datetime.timedelta(minutes=15)
+
+_worker = None
+_worker_lock = threading.Lock()
+
+_snapshots_checked_at = None
+
+
+def enqueue_ingestion():
+    """
+    Ставит загрузку фиксингов в очередь и запускает фоновый поток процесса.
+    Если загрузка уже ждёт или выполняется, возвращает её, а не создаёт новую.
+
+    Returns:
+        IngestionJob
+    """
+    _fail_stale_jobs()
+    job = None
+    while job is None:
+        try:
+            with transaction.atomic():
+                job = IngestionJob.objects.create()
+        except IntegrityError:
+            # Активная загрузка могла завершиться между попыткой создать задачу и этим запросом
+            job = IngestionJob.objects.filter(isActive=True).first()
+
+    _start_worker()
+    return job
+
+
+def _fail_stale_jobs():
+    IngestionJob.objects.filter(isActive=True, updatedAt__lt=timezone.now() - STALE_AFTER).update(
+        status=IngestionJob.FAILED,
+        isActive=False,
+        finishedAt=timezone.now(),
+        error="Загрузка прервана",
+    )
+
+
+def _start_worker():
+    global _worker
+
+    with _worker_lock:
+        if _worker is not None and _worker.is_alive():
+            return
+        _worker = threading.Thread(target=run_pending_jobs, name="fixings-ingestion", daemon=True)
+        _worker.start()
+
+
+def run_pending_jobs():
+    """Выполняет ожидающие загрузки по одной, пока очередь не опустеет"""
+    try:
+        while True:
+            job = IngestionJob.objects.filter(status=IngestionJob.PENDING).order_by("id").first()
+            if job is None:
+                return
+
+            # Захват условным UPDATE: из нескольких процессов загрузку получит только один
+            claimed = IngestionJob.objects.filter(id=job.id, status=IngestionJob.PENDING).update(
+                status=IngestionJob.RUNNING, startedAt=timezone.now(), updatedAt=timezone.now()
+            )
+            if claimed:
+                run_ingestion_job(job.id)
+    finally:
+        connection.close()
+
+
+def _heartbeat(job_id, stop):
+    """Отмечает задачу живой, пока идёт загрузка: этапы записи и пересчёта снимков не сообщают прогресс"""
+    try:
+        while not stop.wait(HEARTBEAT_INTERVAL):
+            IngestionJob.objects.filter(id=job_id, isActive=True).update(updatedAt=timezone.now())
+    finally:
+        connection.close()
+
+
+def run_ingestion_job(job_id):
+    """Выполняет загрузку и записывает в задачу прогресс и итог"""
+    jobs = IngestionJob.objects.filter(id=job_id)
+
+    def progress(done, total):
+        jobs.update(tickersDone=done, tickersTotal=total, updatedAt=timezone.now())
+
+    stop = threading.Event()
+    heartbeat = threading.Thread(target=_heartbeat, args=(job_id, stop), name="fixings-ingestion-heartbeat", daemon=True)
+    heartbeat.start()
+    try:
+        close_old_connections()
+        report = ingest_fixings(progress=progress)
+    except Exception as e:
+        jobs.update(
+            status=IngestionJob.FAILED,
+            isActive=False,
+            finishedAt=timezone.now(),
+            updatedAt=timezone.now(),
+            error=str(e),
+        )
+        return
+    finally:
+        stop.set()
+
+    jobs.update(
+        status=IngestionJob.SUCCESS,
+        isActive=False,
+        finishedAt=timezone.now(),
+        updatedAt=timezone.now(),
+        startDate=report.start_date,
+        endDate=report.end_date,
+        tickersTotal=report.tickers,
+        tickersDone=report.tickers,
+        countIndexes=report.count_indexes,
+        countCurrencies=report.count_currencies,
+        failedTickers=report.failed,
+        timings={name: round(seconds, 3) for name, seconds in report.timings.items()},
+    )
+
+
+def schedule_snapshot_rebuild():
+    """
+    Запускает в фоновом потоке ежедневную пересборку снимков цен. Вызывается списками, на странице
+    которых есть снимок не за сегодня; процесс проверяет это не чаще раза в RATE_ENGINE_REFRESH_SECONDS.
+
+    Из всех процессов пересборку за день захватывает один — условным UPDATE MarketDataState.snapshotsDate.
+
+    Returns:
+        bool: пересборка запущена этим вызовом
+    """
+    global _snapshots_checked_at
+
+    interval = getattr(settings, "RATE_ENGINE_REFRESH_SECONDS", 60)
+    with _worker_lock:
+        if _snapshots_checked_at is not None and time.monotonic() - _snapshots_checked_at < interval:
+            return False
+        _snapshots_checked_at = time.monotonic()
+
+    get_market_data_state()
+    today = datetime.date.today()
+    claimed = MarketDataState.objects.filter(id=STATE_ID).exclude(snapshotsDate=today).update(snapshotsDate=today)
+    if claimed:
+        _start_snapshot_rebuild()
+    return bool(claimed)
+
+
+def _start_snapshot_rebuild():
+    threading.Thread(target=run_snapshot_rebuild, name="fixings-snapshots", daemon=True).start()
+
+
+def run_snapshot_rebuild():
+    """Пересобирает снимки цен; при ошибке снимает отметку дня, чтобы пересборку повторил следующий запрос"""
+    try:
+        close_old_connections()
+        rebuild_price_snapshots()
+    except Exception:
+        MarketDataState.objects.filter(id=STATE_ID).update(snapshotsDate=None)
+        raise
+    finally:
+        connection.close()
@@ -1,3 +1,506 @@
-from django.test import TestCase
+import datetime
+import time
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+from asgiref.sync import async_to_sync
+from django.core.cache import cache
+from django.db import IntegrityError, connection
+from django.test import RequestFactory, TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from market_vision_backend.benchmarks import generate_dataset, get_endpoints, load_baseline, run_benchmark
+from .async_views import AsyncCurrenciesListView, AsyncIndexesListView
+from .bars import get_bars, get_index_bars, save_bars
+from .caching import get_data_version
+from .history import MAX_INDEX_ID, PriceHistoryStore, price_history
+from .ingestion import ingest_fixings, reload_fixings
+from .panels import WINDOWS, get_universe_panel
+from . import tasks
+from .ingestion import IngestionReport
+from .models import Currency, CurrencyPriceSnapshot, Fixing, Index, IndexBars, IndexPriceSnapshot, IngestionJob, MarketDataState
+from .providers import MarketDataProvider
+from .registry import CurrencyRegistry
+from .snapshots import rebuild_price_snapshots
+from .state import STATE_ID, update_market_data_state
+
+
+class FixingsEndpointsBenchmarkTests(TestCase):
+    def test_query_counts_match_baseline(self):
+        # Базовый замер снят на данных в несколько раз больше: совпадение числа запросов означает, что оно
+        # не растёт с количеством валют, бумаг и фиксингов. Обновление: manage.py benchmark_api --update-baseline
+        dataset = generate_dataset(currencies=4, indexes=8, years=1, users=1, portfolios=2, packets=4)
+        endpoints = [endpoint for endpoint in get_endpoints() if endpoint.name.startswith("fixings:")]
+        baseline = load_baseline()["endpoints"]
+
+        for name, result in run_benchmark(dataset, endpoints, repeat=2).items():
+            with self.subTest(endpoint=name):
+                self.assertLess(result["status"], 400)
+                self.assertEqual(result["queries"], baseline[name]["queries"])
+
+
+class AsyncListViewsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.dataset = generate_dataset(currencies=4, indexes=20, years=1, users=1, portfolios=1, packets=2)
+        self.client = APIClient()
+        self.client.force_authenticate(self.dataset.user)
+        self.authorization = f"Bearer {AccessToken.for_user(self.dataset.user)}"
+
+    def _async_get(self, view, path, params, **headers):
+        request = RequestFactory().get(path, params, **headers)
+        return async_to_sync(view.as_view())(request)
+
+    def test_responses_match_sync_views(self):
+        cases = [
+            (AsyncIndexesListView, "/api/fixings/indexes/", {"currency": "EUR", "ordering": "-monthlyDynamic", "page": 2}),
+            (AsyncIndexesListView, "/api/fixings/indexes/", {"currency": "USD"}),
+            (AsyncCurrenciesListView, "/api/fixings/currencies/", {"currency": "EUR", "ordering": "currentConvertedPrice"}),
+        ]
+        for view, path, params in cases:
+            with self.subTest(path=path, params=params):
+                cache.clear()
+                response = self._async_get(view, path, params, HTTP_AUTHORIZATION=self.authorization)
+                self.assertEqual(response.status_code, 200)
+
+                # Ответ async-представления попал в общий кэш ответов
+                cached = self.client.get(path, params)
+                self.assertEqual(cached.content, response.content)
+
+                cache.clear()
+                self.assertEqual(self.client.get(path, params).content, response.content)
+
+    def test_errors_match_sync_views(self):
+        response = self._async_get(AsyncIndexesListView, "/api/fixings/indexes/", {})
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response.content, APIClient().get("/api/fixings/indexes/").content)
+
+        response = self._async_get(AsyncIndexesListView, "/api/fixings/indexes/", {}, HTTP_AUTHORIZATION="Bearer x")
+        self.assertEqual(response.status_code, 401)
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION="Bearer x")
+        self.assertEqual(response.content, client.get("/api/fixings/indexes/").content)
+        self.assertEqual(response["WWW-Authenticate"], 'Bearer realm="api"')
+
+        response = self._async_get(AsyncIndexesListView, "/api/fixings/indexes/", {"page": 100},
+                                   HTTP_AUTHORIZATION=self.authorization)
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.content, self.client.get("/api/fixings/indexes/", {"page": 100}).content)
+
+
+class BatchPricesTests(TestCase):
+    def setUp(self):
+        self.dataset = generate_dataset(currencies=4, indexes=6, years=1, users=1, portfolios=1, packets=1)
+        self.client = APIClient()
+        self.client.force_authenticate(self.dataset.user)
+
+    def test_prices_match_get_price(self):
+        today = datetime.date.today()
+        dates = [today, today - datetime.timedelta(days=40), datetime.date(2000, 1, 3)]
+        # Выходной: цена берётся по последнему фиксингу до него
+        dates.append(next(today - datetime.timedelta(days=days) for days in range(7, 14)
+                          if (today - datetime.timedelta(days=days)).weekday() == 6))
+        codes = list(Currency.objects.values_list("currency", flat=True))
+        indexes = list(Index.objects.select_related("ccyId"))
+
+        queries, expected = [], []
+        for date in dates:
+            for currency in codes + [None]:
+                for index in indexes:
+                    queries.append(["index", index.id, date.isoformat(), currency])
+                    expected.append(index.get_price(request_currency=currency, date=date))
+                for code in codes:
+                    queries.append(["currency", code, date.isoformat()] + ([currency] if currency else []))
+                    expected.append(Currency.objects.get(currency=code).get_price(request_currency=currency, date=date))
+
+        with self.assertNumQueries(1):
+            response = self.client.post("/api/fixings/prices/batch", {"queries": queries}, format="json")
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data["count"], len(queries))
+        self.assertEqual(data["prices"], [float(price) for price in expected])
+
+        own = {index.id: index.ccyId.currency for index in indexes}
+        for query, currency, fixing_date in zip(queries, data["currencies"], data["fixingDates"]):
+            if query[0] == "index":
+                self.assertEqual(currency, query[3] or own[query[1]])
+                self.assertTrue(fixing_date is None or fixing_date <= query[2])
+            else:
+                self.assertEqual(currency, query[3] if len(query) > 3 else "USD")
+                self.assertIsNone(fixing_date)
+        self.assertIsNone(data["fixingDates"][queries.index(["index", indexes[0].id, "2000-01-03", None])])
+
+    def test_invalid_queries(self):
+        index_id = Index.objects.first().id
+        for body in [
+            {},
+            {"queries": []},
+            {"queries": [["index", index_id]]},
+            {"queries": [["bond", index_id, "2024-01-05"]]},
+            {"queries": [["index", "abc", "2024-01-05"]]},
+            {"queries": [["index", index_id, "05.01.2024"]]},
+            {"queries": [["index", index_id, "2024-01-05", "XXX"]]},
+            {"queries": [["currency", "XXX", "2024-01-05"]]},
+            {"queries": [["index", 10 ** 6, "2024-01-05"]]},
+            {"queries": [["index", index_id, "2024-01-05"]] * 10001},
+        ]:
+            with self.subTest(body=str(body)[:80]):
+                response = self.client.post("/api/fixings/prices/batch", body, format="json")
+                self.assertEqual(response.status_code, 400)
+                self.assertIn("error", response.json())
+
+        for instrument in (10 ** 20, 2 ** 63, MAX_INDEX_ID + 1, 0, -1):
+            with self.subTest(instrument=instrument):
+                body = {"queries": [["index", index_id, "2024-01-05"], ["index", instrument, "2024-01-05"]]}
+                response = self.client.post("/api/fixings/prices/batch", body, format="json")
+                self.assertEqual(response.status_code, 400)
+                self.assertTrue(response.json()["error"].startswith("Invalid query #1:"))
+
+        # Граница упаковки ключей: такой id допустим, но бумаги с ним нет
+        body = {"queries": [["index", MAX_INDEX_ID, "2024-01-05"]]}
+        response = self.client.post("/api/fixings/prices/batch", body, format="json")
+        self.assertEqual(response.status_code, 400)
+        self.assertTrue(response.json()["error"].startswith("Unknown instruments"))
+
+
+class OHLCVProvider(MarketDataProvider):
+    """Рабочие дни [start_date, end_date): open = close - 1, high = close + 2, low = close - 2, объём 1000 + день"""
+
+    def fetch_closes(self, ticker, start_date, end_date):
+        dates, values = self.fetch_bars(ticker, start_date, end_date)
+        return dates, values[3]
+
+    def fetch_bars(self, ticker, start_date, end_date):
+        days = np.arange(np.datetime64(start_date, "D"), np.datetime64(end_date, "D"))
+        dates = days[np.is_busday(days)]
+        close = 100 + (dates - np.datetime64("2024-01-01")).astype(np.float64) / 4
+        volume = 1000 + (dates - np.datetime64("2024-01-01")).astype(np.float64)
+        return dates, np.vstack([close - 1, close + 2, close - 2, close, volume])
+
+
+class ClosesOnlyProvider(MarketDataProvider):
+    def fetch_closes(self, ticker, start_date, end_date):
+        return OHLCVProvider().fetch_closes(ticker, start_date, end_date)
+
+
+class CorrelationMatrixTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.dataset = generate_dataset(currencies=3, indexes=4, years=1, users=1, portfolios=1, packets=1)
+        usd = Currency.objects.get(currency="USD")
+        # Бумага с неизменной ценой: нулевая дисперсия доходностей
+        self.flat = Index.objects.create(indexName="Flat", ccyId=usd, indexISIN="FLAT")
+        today = datetime.date.today()
+        Fixing.objects.bulk_create([
+            Fixing(indexId=self.flat, currencyId=usd, fixingDate=today - datetime.timedelta(days=day), value=50)
+            for day in range(120)
+        ])
+        price_history.invalidate()
+        self.index_ids = [index.id for index in self.dataset.indexes]
+        self.client = APIClient()
+        self.client.force_authenticate(self.dataset.user)
+
+    def _get(self, **params):
+        return self.client.get("/api/fixings/correlation", params)
+
+    def test_matrix_matches_corrcoef(self):
+        ids = self.index_ids + [self.flat.id]
+        response = self._get(indexes=",".join(map(str, ids)), currencies="EUR", currency="USD", window=90)
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        correlation = np.array(data["correlation"], dtype=float)
+        size = len(ids) + 1
+        self.assertEqual(correlation.shape, (size, size))
+
+        flat = len(self.index_ids)
+        self.assertTrue(all(value is None for value in data["correlation"][flat]))
+        self.assertTrue(all(row[flat] is None for row in data["correlation"]))
+        others = [column for column in range(size) if column != flat]
+        np.testing.assert_allclose(np.diag(correlation)[others], 1.0)
+
+        panel = get_universe_panel(currency="USD", window=90)
+        columns = panel.columns(ids, [Currency.objects.get(currency="EUR").id])
+        returns = panel.returns[panel.trading_days(columns)][:, columns]
+        self.assertEqual(data["observations"], len(returns))
+        expected = np.corrcoef(returns[:, others], rowvar=False)
+        np.testing.assert_allclose(correlation[np.ix_(others, others)], expected, atol=1e-12)
+
+    def test_smaller_window_is_slice_of_cached_panel(self):
+        wide = get_universe_panel(currency="EUR", window=365)
+        narrow = get_universe_panel(currency="EUR", window=30)
+        self.assertEqual(narrow.window, 30)
+        self.assertEqual(narrow.ordinals[-1], wide.ordinals[-1])
+        self.assertTrue(np.shares_memory(narrow.returns, wide.returns))
+
+        cache.clear()
+        rebuilt = get_universe_panel(currency="EUR", window=30)
+        np.testing.assert_array_equal(rebuilt.prices, narrow.prices)
+        np.testing.assert_array_equal(rebuilt.returns, narrow.returns)
+
+    def test_invalid_parameters(self):
+        indexes = str(self.index_ids[0])
+        for params in (
+            {"indexes": indexes, "window": 100},
+            {"indexes": indexes, "window": "year"},
+            {"indexes": "1,x"},
+            {},
+            {"indexes": str(max(self.index_ids) + 100)},
+            {"indexes": indexes, "currencies": "XXX"},
+            {"indexes": indexes, "currency": "XXX"},
+        ):
+            with self.subTest(params=params):
+                self.assertEqual(self._get(**params).status_code, 400)
+        self.assertEqual(self._get(indexes=indexes, window=WINDOWS[0]).status_code, 200)
+
+
+class IndexBarsTests(TestCase):
+    def setUp(self):
+        self.currency = Currency.objects.create(currency="USD", symbol="$", ticker="")
+        self.index = Index.objects.create(indexName="Bars", ccyId=self.currency, indexISIN="BARS")
+
+    def _series(self, start, end, shift=0.0):
+        dates, values = OHLCVProvider().fetch_bars("BARS", start, end)
+        return {self.index.id: (self.currency.id, dates, values + shift)}
+
+    def test_round_trip_and_ranges(self):
+        series = self._series(datetime.date(2024, 1, 10), datetime.date(2024, 4, 5))
+        _, dates, values = series[self.index.id]
+        self.assertEqual(save_bars(series), len(dates))
+        self.assertEqual(IndexBars.objects.filter(indexId=self.index).count(), 4)
+
+        bars = get_index_bars(self.index.id)
+        np.testing.assert_array_equal(bars.dates, dates)
+        np.testing.assert_array_equal(bars.values, values)
+        np.testing.assert_array_equal(bars.volume, values[4])
+
+        bars = get_bars([self.index.id, 10 ** 6], start_date="2024-02-03", end_date=datetime.date(2024, 3, 1))
+        self.assertEqual(len(bars[10 ** 6]), 0)
+        self.assertEqual(bars[self.index.id].dates[0], np.datetime64("2024-02-05"))
+        self.assertEqual(bars[self.index.id].dates[-1], np.datetime64("2024-03-01"))
+        np.testing.assert_array_equal(bars[self.index.id].close, values[3][
+            (dates >= np.datetime64("2024-02-03")) & (dates <= np.datetime64("2024-03-01"))
+        ])
+
+    def test_merge_and_replace(self):
+        save_bars(self._series(datetime.date(2024, 1, 1), datetime.date(2024, 3, 1)))
+        # Догрузка дописывает дни в месяц и перезаписывает совпавшие
+        save_bars(self._series(datetime.date(2024, 2, 26), datetime.date(2024, 3, 9), shift=1000))
+        bars = get_index_bars(self.index.id)
+        self.assertEqual(bars.dates[-1], np.datetime64("2024-03-08"))
+        self.assertEqual(len(bars.dates), len(np.unique(bars.dates)))
+        self.assertTrue((bars.close[bars.dates >= np.datetime64("2024-02-26")] > 1000).all())
+        self.assertTrue((bars.close[bars.dates < np.datetime64("2024-02-26")] < 1000).all())
+
+        # Перезагрузка периода удаляет дни без новых данных и опустевшие месяцы
+        save_bars(self._series(datetime.date(2024, 1, 1), datetime.date(2024, 1, 6)),
+                  since=datetime.date(2024, 1, 1), end_date=datetime.date(2024, 2, 29))
+        bars = get_index_bars(self.index.id)
+        self.assertEqual(bars.dates[:5].tolist(), np.arange(np.datetime64("2024-01-01"), np.datetime64("2024-01-06")).tolist())
+        self.assertEqual(bars.dates[5], np.datetime64("2024-03-01"))
+        self.assertEqual(list(IndexBars.objects.filter(indexId=self.index).values_list("month", flat=True).order_by("month")),
+                         [datetime.date(2024, 1, 1), datetime.date(2024, 3, 1)])
+
+    def test_ingestion_writes_bars(self):
+        end_date = datetime.date.today() - datetime.timedelta(days=1)
+        report = reload_fixings(since=end_date - datetime.timedelta(days=60), end_date=end_date, provider=OHLCVProvider())
+        bars = get_index_bars(self.index.id)
+        self.assertEqual(report.count_bars, len(bars))
+        self.assertEqual(report.count_indexes, len(bars))
+
+        fixings = list(Fixing.objects.filter(indexId=self.index).order_by("fixingDate").values_list("fixingDate", "value"))
+        self.assertEqual([date for date, _ in fixings], bars.dates.astype(datetime.date).tolist())
+        np.testing.assert_array_equal([float(value) for _, value in fixings], bars.close)
+        np.testing.assert_array_equal(bars.open, bars.close - 1)
+
+        # Источник без OHLCV: open, high и low равны цене закрытия, объём неизвестен
+        Fixing.objects.filter(indexId=self.index, fixingDate__gte=end_date - datetime.timedelta(days=10)).delete()
+        report = ingest_fixings(end_date=end_date, provider=ClosesOnlyProvider())
+        self.assertGreater(report.count_bars, 0)
+        recent = get_index_bars(self.index.id, start_date=end_date - datetime.timedelta(days=10))
+        self.assertEqual(len(recent), report.count_bars)
+        np.testing.assert_array_equal(recent.high, recent.close)
+        self.assertTrue(np.isnan(recent.volume).all())
+        self.assertEqual(len(get_index_bars(self.index.id)), len(bars))
+
+
+class PriceHistoryRefreshTests(TestCase):
+    def test_refresh_sees_changes_of_other_processes(self):
+        currency = Currency.objects.create(currency="USD", symbol="$", ticker="")
+        index = Index.objects.create(indexName="History", ccyId=currency, indexISIN="HIST")
+        start = datetime.date(2024, 1, 1)
+        Fixing.objects.bulk_create([
+            Fixing(indexId=index, currencyId=currency, fixingDate=start + datetime.timedelta(days=day), value=100 + day)
+            for day in range(5)
+        ])
+        update_market_data_state(ingested=True)
+
+        # Хранилище другого процесса: сигналы этого процесса его не сбрасывают
+        store = PriceHistoryStore(refresh_interval=0)
+        store.load()
+        self.assertEqual(store.latest(index.id).value, 104)
+
+        new = Fixing.objects.create(indexId=index, currencyId=currency, fixingDate=start + datetime.timedelta(days=9),
+                                    value=200)
+        with CaptureQueriesContext(connection) as queries:
+            store.refresh()
+        self.assertEqual(store.latest(index.id).value, 200)
+        self.assertFalse(any("COUNT(" in query["sql"].upper() for query in queries.captured_queries))
+
+        new.delete()
+        store.refresh()
+        self.assertEqual(store.latest(index.id).value, 104)
+
+        Fixing.objects.filter(id=Fixing.objects.get(indexId=index, fixingDate=start).id).delete()
+        store.refresh()
+        self.assertIsNone(store.as_of(index.id, start))
+
+
+    def test_ids_outside_key_range_are_not_wrapped(self):
+        currency = Currency.objects.create(currency="USD", symbol="$", ticker="")
+        index = Index.objects.create(indexName="Keys", ccyId=currency, indexISIN="KEYS")
+        date = datetime.date(2024, 1, 2)
+        Fixing.objects.create(indexId=index, currencyId=currency, fixingDate=date, value=10)
+        store = PriceHistoryStore(refresh_interval=3600)
+        store.load()
+
+        # index.id + 2**42 без проверки переполнился бы в тот же ключ (бумага, день)
+        ids = [index.id, index.id + (1 << 42), MAX_INDEX_ID + 1, -1]
+        days, values, _ = store.as_of_arrays(ids, [date] * len(ids))
+        self.assertEqual(days.tolist(), [date.toordinal(), -1, -1, -1])
+        self.assertEqual(values.tolist(), [10, None, None, None])
+        matrix_days, _, _ = store.as_of_matrix(ids, [date])
+        self.assertEqual(matrix_days.tolist(), [days.tolist()])
+
+        columns = {name: np.array([value]) for name, value in (
+            ("index_ids", MAX_INDEX_ID + 1), ("dates", date.toordinal()), ("values", 1.0), ("decimals", b"1"),
+            ("currency_ids", currency.id),
+        )}
+        with self.assertRaises(ValueError):
+            store._set_columns(columns)
+        columns["index_ids"] = np.array([MAX_INDEX_ID])
+        store._set_columns(columns)
+        self.assertEqual(store.as_of_arrays([MAX_INDEX_ID], [date])[0].tolist(), [date.toordinal()])
+
+
+class DataVersionTests(TestCase):
+    def test_version_follows_state_changed_by_other_process(self):
+        update_market_data_state()
+        with self.settings(RATE_ENGINE_REFRESH_SECONDS=3600):
+            version = get_data_version()
+            # Загрузка в другом процессе: его локальный кэш версии отсюда не виден, меняется только строка состояния
+            MarketDataState.objects.filter(id=STATE_ID).update(
+                updatedAt=MarketDataState.objects.get(id=STATE_ID).updatedAt + datetime.timedelta(seconds=1)
+            )
+            with self.assertNumQueries(0):
+                self.assertEqual(get_data_version(), version)
+        with self.settings(RATE_ENGINE_REFRESH_SECONDS=0):
+            self.assertNotEqual(get_data_version(), version)
+
+
+    def test_registry_checks_version_once_per_interval(self):
+        Currency.objects.create(currency="USD", symbol="$", ticker="")
+        registry = CurrencyRegistry()
+        with mock.patch("fixings.registry.get_data_version", return_value="v1") as version:
+            with self.settings(RATE_ENGINE_REFRESH_SECONDS=3600):
+                for _ in range(5):
+                    self.assertEqual(registry.find("USD").currency, "USD")
+                self.assertEqual(version.call_count, 1)
+            with self.settings(RATE_ENGINE_REFRESH_SECONDS=0):
+                registry.code(registry.find("USD").id)
+                self.assertEqual(version.call_count, 3)
+
+
+    def test_registry_lookup_survives_concurrent_invalidate(self):
+        usd = Currency.objects.create(currency="USD", symbol="$", ticker="USDUSD=X")
+
+        class InvalidatedRegistry(CurrencyRegistry):
+            def _ensure_loaded(self):
+                snapshot = super()._ensure_loaded()
+                # Сигнал сохранения валюты из другого потока сразу после проверки
+                self.invalidate()
+                return snapshot
+
+        registry = InvalidatedRegistry()
+        self.assertEqual(registry.find("USD"), usd)
+        self.assertEqual(registry.by_ticker("USDUSD=X"), usd)
+        self.assertEqual(registry.code(usd.id), "USD")
+        self.assertEqual(registry.all(), [usd])
+
+
+class StaleSnapshotsTests(TestCase):
+    def test_stale_snapshots_are_computed_on_the_fly(self):
+        dataset = generate_dataset(currencies=3, indexes=6, years=1, users=1, portfolios=1, packets=1)
+        client = APIClient()
+        client.force_authenticate(dataset.user)
+        paths = ["/api/fixings/indexes/?currency=EUR", "/api/fixings/currencies/?currency=EUR"]
+        cache.clear()
+        fresh = [client.get(path).json()["results"] for path in paths]
+
+        # Вчерашние снимки с неверными значениями: список их не показывает, а пересборку ставит в фон
+        yesterday = datetime.date.today() - datetime.timedelta(days=1)
+        IndexPriceSnapshot.objects.update(snapshotDate=yesterday, currentConvertedPrice=0, monthlyDynamic=0)
+        CurrencyPriceSnapshot.objects.update(snapshotDate=yesterday, currentConvertedPrice=0, monthlyDynamic=0)
+        cache.clear()
+        with mock.patch("fixings.tasks._start_snapshot_rebuild") as start, \
+                mock.patch("fixings.tasks._snapshots_checked_at", None), \
+                mock.patch.object(Index, "get_price", side_effect=AssertionError("per-row price")), \
+                CaptureQueriesContext(connection) as queries:
+            stale = [client.get(path).json()["results"] for path in paths]
+
+        self.assertEqual(stale, fresh)
+        self.assertEqual(start.call_count, 1)
+        writes = [query["sql"] for query in queries.captured_queries
+                  if query["sql"].split()[0].upper() in ("INSERT", "UPDATE", "DELETE")]
+        self.assertEqual(len(writes), 1)
+        self.assertIn("snapshotsDate", writes[0])
+        self.assertFalse(IndexPriceSnapshot.objects.filter(snapshotDate__gt=yesterday).exists())
+
+        # Пересборку за день захватывает один процесс
+        with mock.patch("fixings.tasks._start_snapshot_rebuild") as start, \
+                mock.patch("fixings.tasks._snapshots_checked_at", None):
+            self.assertFalse(tasks.schedule_snapshot_rebuild())
+        start.assert_not_called()
+
+        rebuild_price_snapshots()
+        cache.clear()
+        self.assertEqual([client.get(path).json()["results"] for path in paths], fresh)
+
+
+class IngestionJobTests(TransactionTestCase):
+    def test_enqueue_retries_when_active_job_finished(self):
+        real_create = IngestionJob.objects.create
+        calls = []
+
+        def create(**kwargs):
+            # Вставка упёрлась в активную задачу, которая завершилась до чтения активной задачи
+            calls.append(kwargs)
+            if len(calls) == 1:
+                raise IntegrityError
+            return real_create(**kwargs)
+
+        with mock.patch.object(IngestionJob.objects, "create", side_effect=create), \
+                mock.patch("fixings.tasks._start_worker"):
+            job = tasks.enqueue_ingestion()
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(IngestionJob.objects.get(isActive=True).id, job.id)
+
+    def test_heartbeat_during_long_stages(self):
+        job = IngestionJob.objects.create(status=IngestionJob.RUNNING)
+        seen = []
+
+        def ingest(progress=None):
+            # Долгий этап без вызовов progress
+            seen.append(IngestionJob.objects.get(id=job.id).updatedAt)
+            time.sleep(0.3)
+            seen.append(IngestionJob.objects.get(id=job.id).updatedAt)
+            return IngestionReport()
+
+        with mock.patch.object(tasks, "HEARTBEAT_INTERVAL", 0.05), mock.patch.object(tasks, "ingest_fixings", ingest):
+            tasks.run_ingestion_job(job.id)
+
+        self.assertGreater(seen[1], seen[0])
+        job.refresh_from_db()
+        self.assertEqual(job.status, IngestionJob.SUCCESS)
+        self.assertFalse(job.isActive)
@@ -14,15 +14,28 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+from django.conf import settings
 from django.urls import path
 
+from .async_views import AsyncCurrenciesListView, AsyncIndexesListView
 from .views import GetCurrenciesListView, GetIndexesListView, UpdateFixingsInfoView, GetAllCurrenciesListView, \
-    GetAllIndexesListView
+    GetAllIndexesListView, UpdateFixingsStatusView, MarketDataStatusView, CorrelationMatrixView, \
+    BatchPricesView
+
+# Под ASGI (см. market_vision_backend.asgi) списки отдают async-представления
+if getattr(settings, "ASYNC_READ_VIEWS", False):
+    currencies_view, indexes_view = AsyncCurrenciesListView.as_view(), AsyncIndexesListView.as_view()
+else:
+    currencies_view, indexes_view = GetCurrenciesListView.as_view(), GetIndexesListView.as_view()
 
 urlpatterns = [
-    path('currencies/', GetCurrenciesListView.as_view()),
-    path('indexes/', GetIndexesListView.as_view()),
+    path('currencies/', currencies_view),
+    path('indexes/', indexes_view),
     path('update-info', UpdateFixingsInfoView.as_view()),
+    path('update-info/<int:pk>', UpdateFixingsStatusView.as_view()),
+    path('status', MarketDataStatusView.as_view()),
     path('all-currencies-names', GetAllCurrenciesListView.as_view()),
-    path('all-indexes', GetAllIndexesListView.as_view())
+    path('all-indexes', GetAllIndexesListView.as_view()),
+    path('correlation', CorrelationMatrixView.as_view()),
+    path('prices/batch', BatchPricesView.as_view()),
 ]
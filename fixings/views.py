@@ -1,14 +1,23 @@
 import datetime
 
+import numpy as np
 from django.http import JsonResponse
 from django.shortcuts import render
 from rest_framework import generics, status, filters
 from rest_framework.pagination import PageNumberPagination
 from rest_framework.response import Response
 
-from .serializers import GetCurrenciesListSerializer, GetIndexesSerializer, CurrencySerializer
-from .models import Currency, Fixing, Index, CurrencyUSDFixing
-import yfinance as yf
+from .serializers import GetCurrenciesListSerializer, GetIndexesSerializer, CurrencySerializer, \
+    IngestionJobSerializer, MarketDataStateSerializer
+from .models import Currency, Index, IngestionJob
+from .caching import cached_response
+from .history import MAX_INDEX_ID
+from .panels import WINDOWS, correlation_matrix, get_universe_panel
+from .pricing import CURRENCY, INDEX, MAX_BATCH_SIZE, get_batch_prices, get_index_quotes
+from .tasks import enqueue_ingestion, schedule_snapshot_rebuild
+from .snapshots import annotate_index_snapshots, annotate_currency_snapshots, has_fresh_snapshot
+from .registry import currency_registry
+from .state import get_market_data_state
 
 
 class LastUpdatePaginator(PageNumberPagination):
@@ -16,40 +25,40 @@ class LastUpdatePaginator(PageNumberPagination):
 
     def get_paginated_response(self, data):
         response = super().get_paginated_response(data)
-        response.data["lastUpdate"] = Fixing.objects.latest('fixingDate').fixingDate
+        response.data["lastUpdate"] = get_market_data_state().latestFixingDate
         response.data["pageSize"] = self.page_size
         return response
 
 
-class GetCurrenciesListView(generics.ListAPIView):
+class SnapshotListMixin:
+    """Списки со снимками цен: строки без снимка за сегодня запускают фоновую пересборку снимков"""
+
+    def page_context(self, rows, currency):
+        """Контекст сериализатора строк страницы"""
+        context = {"currency": currency}
+        stale = [row for row in rows if not has_fresh_snapshot(row)]
+        if stale:
+            schedule_snapshot_rebuild()
+            context.update(self.stale_context(stale, currency))
+        return context
+
+    def stale_context(self, rows, currency):
+        """Предрасчёт значений строк без свежего снимка"""
+        return {}
+
+
+class GetCurrenciesListView(SnapshotListMixin, generics.ListAPIView):
     serializer_class = GetCurrenciesListSerializer
     queryset = Currency.objects.all()
     filter_backends = [filters.OrderingFilter]
     ordering_fields = ['currency', 'ticker', 'currentConvertedPrice', 'monthlyDynamic']
     ordering = ['ticker']
 
-    def filter_queryset(self, queryset):
-        request = self.request
-        ordering = request.query_params.get("ordering")
-        reverse = False
-
-        if ordering:
-            if ordering.startswith("-"):
-                reverse = True
-                ordering = ordering[1:]
-
-            if ordering in ["currentConvertedPrice", "monthlyDynamic"]:
-                queryset = list(queryset)
-
-                def sort_key(obj):
-                    serializer = self.get_serializer(obj)
-                    return serializer.data.get(ordering)
-
-                queryset.sort(key=sort_key, reverse=reverse)
-                return queryset
-
-        return super().filter_queryset(queryset)
+    def get_queryset(self):
+        currency = self.request.query_params.get("currency", "USD")
+        return annotate_currency_snapshots(super().get_queryset(), currency=currency)
 
+    @cached_response
     def list(self, request, *args, **kwargs):
         currency = request.query_params.get("currency", "USD")
         queryset = self.filter_queryset(self.get_queryset())
@@ -58,27 +67,35 @@ class GetCurrenciesListView(generics.ListAPIView):
         page = paginator.paginate_queryset(queryset, request)
         
         if page is not None:
-            serializer = self.get_serializer(page, many=True, context={"currency": currency})
+            serializer = self.get_serializer(page, many=True, context=self.page_context(page, currency))
             response = paginator.get_paginated_response(serializer.data)
-            currency_instance = Currency.objects.get(currency=currency)
+            currency_instance = currency_registry.get(currency)
             response.data["currency"] = CurrencySerializer(currency_instance).data
             return response
 
-        serializer = self.get_serializer(queryset, many=True, context={"currency": currency})
+        serializer = self.get_serializer(queryset, many=True, context=self.page_context(queryset, currency))
         response_data = {
             "results": serializer.data,
-            "currency": CurrencySerializer(Currency.objects.get(currency=currency)).data
+            "currency": CurrencySerializer(currency_registry.get(currency)).data
         }
         return Response(response_data)
 
 
-class GetIndexesListView(generics.ListAPIView):
-    queryset = Index.objects.all()
+class GetIndexesListView(SnapshotListMixin, generics.ListAPIView):
+    queryset = Index.objects.select_related("ccyId")
     serializer_class = GetIndexesSerializer
     filter_backends = [filters.OrderingFilter]
     ordering_fields = ['indexName', 'indexISIN', 'currentPrice', 'currentConvertedPrice', 'monthlyDynamic']
     ordering = ['indexISIN']
 
+    def get_queryset(self):
+        currency = self.request.query_params.get("currency", "USD")
+        return annotate_index_snapshots(super().get_queryset(), currency=currency)
+
+    def stale_context(self, rows, currency):
+        return {"quotes": get_index_quotes(rows, currency=currency)}
+
+    @cached_response
     def list(self, request, *args, **kwargs):
         currency = request.query_params.get("currency", "USD")
         queryset = self.filter_queryset(self.get_queryset())
@@ -87,126 +104,154 @@ class GetIndexesListView(generics.ListAPIView):
         page = paginator.paginate_queryset(queryset, request)
         
         if page is not None:
-            serializer = self.get_serializer(page, many=True, context={"currency": currency})
+            serializer = self.get_serializer(page, many=True, context=self.page_context(page, currency))
             response = paginator.get_paginated_response(serializer.data)
-            currency_instance = Currency.objects.get(currency=currency)
+            currency_instance = currency_registry.get(currency)
             response.data["currency"] = CurrencySerializer(currency_instance).data
             return response
 
-        serializer = self.get_serializer(queryset, many=True, context={"currency": currency})
+        serializer = self.get_serializer(queryset, many=True, context=self.page_context(queryset, currency))
         response_data = {
             "results": serializer.data,
-            "currency": CurrencySerializer(Currency.objects.get(currency=currency)).data
+            "currency": CurrencySerializer(currency_registry.get(currency)).data
         }
         return Response(response_data)
 
-    def filter_queryset(self, queryset):
-        request = self.request
-        ordering = request.query_params.get("ordering")
-        reverse = False
-
-        if ordering:
-            if ordering.startswith("-"):
-                reverse = True
-                ordering = ordering[1:]
-
-            if ordering in ["currentPrice", 'currentUSDPrice', "monthlyDynamic"]:
-                queryset = list(queryset)
-
-                def sort_key(obj):
-                    serializer = self.get_serializer(obj)
-                    return serializer.data.get(ordering)
-
-                queryset.sort(key=sort_key, reverse=reverse)
-                return queryset
-
-        return super().filter_queryset(queryset)
-
 
 class UpdateFixingsInfoView(generics.RetrieveAPIView):
 
     def get(self, request, *args, **kwargs):
-        start = (Fixing.objects.latest("fixingDate").fixingDate + datetime.timedelta(days=1)).strftime("%Y-%m-%d")
-        yesterday = (datetime.date.today() - datetime.timedelta(days=1)).strftime("%Y-%m-%d")
-
-        if start > yesterday:
-            return Response({"warning": "Данные уже обновлены"}, 200)
+        job = enqueue_ingestion()
+        return Response({"jobId": job.id, "status": job.status}, status=202)
 
-        currencies = list(Currency.objects.all().values_list('ticker', flat=True))
-        index_list = list(Index.objects.all().values_list('indexISIN', flat=True))
 
-        tickers = currencies + index_list
+class UpdateFixingsStatusView(generics.RetrieveAPIView):
+    queryset = IngestionJob.objects.all()
+    serializer_class = IngestionJobSerializer
 
-        data = yf.download(
-            tickers=tickers,
-            start=start,
-            end=yesterday,
-            interval="1d",
-            group_by="ticker",
-            auto_adjust=True,
-            threads=True,
-        )
 
-        closing_prices = {}
-
-        for ticker in tickers:
-            try:
-                closing_prices[ticker] = data[ticker]['Close'].dropna()
-            except Exception as e:
-                Response({"error": f"Ошибка при обработке {ticker}: {e}"}, status=400)
-
-        fixings = []
-        currency_fixings = []
-        count_success_indexes = 0
-        count_success_currencies = 0
-
-        for ticker, series in closing_prices.items():
-            if ticker in index_list:
-                index_id = Index.objects.filter(indexISIN=ticker).first()
-                ccy_id = index_id.ccyId
-                for date, close in series.items():
-                    if not Fixing.objects.filter(fixingDate=date, indexId=index_id).exists():
-                        fixings.append(Fixing(
-                            fixingDate=date,
-                            indexId=index_id,
-                            currencyId=ccy_id,
-                            value=close
-                        ))
-                        count_success_indexes += 1
-            elif ticker in currencies:
-                ccy_id = Currency.objects.filter(ticker=ticker).first()
-                for date, close in series.items():
-                    if not CurrencyUSDFixing.objects.filter(currencyFixingDate=date, currencyId=ccy_id).exists():
-                        currency_fixings.append(CurrencyUSDFixing(
-                            currencyFixingDate=date,
-                            currencyId=ccy_id,
-                            valueUSD=close
-                        ))
-                        count_success_currencies += 1
-
-        CurrencyUSDFixing.objects.bulk_create(currency_fixings, batch_size=1000)
-        Fixing.objects.bulk_create(fixings, batch_size=1000)
-
-        if count_success_currencies + count_success_indexes == 0:
-            return Response({"warning": "Последние фиксинги уже загружены"})
+class MarketDataStatusView(generics.RetrieveAPIView):
+    serializer_class = MarketDataStateSerializer
 
-        return Response({
-            "countCurrencies": count_success_currencies,
-            "countIndexes": count_success_indexes,
-            "startDate": start,
-            "endDate": yesterday
-        }, status=200)
+    def get_object(self):
+        return get_market_data_state()
 
 
 class GetAllCurrenciesListView(generics.RetrieveAPIView):
+    @cached_response
     def get(self, request, *args, **kwargs):
         currencies_names = [GetCurrenciesListSerializer(currency).data["currency"] for currency in
-                            Currency.objects.all()]
+                            currency_registry.all()]
         return Response(currencies_names)
 
 
 class GetAllIndexesListView(generics.RetrieveAPIView):
+    @cached_response
     def get(self, request, *args, **kwargs):
         indexes = [GetIndexesSerializer(index).data for index in
-                   Index.objects.all()]
+                   annotate_index_snapshots(Index.objects.select_related("ccyId"))]
         return Response(indexes)
+
+
+class CorrelationMatrixView(generics.RetrieveAPIView):
+    """
+    Ковариация и корреляция дневных лог-доходностей бумаг (indexes — id через запятую) и валют
+    (currencies — ISO коды через запятую) в валюте currency за window дней (одно из panels.WINDOWS).
+    """
+
+    @cached_response
+    def get(self, request, *args, **kwargs):
+        currency = request.query_params.get("currency", "USD")
+        try:
+            window = int(request.query_params.get("window", 365))
+            index_ids = [int(item) for item in request.query_params.get("indexes", "").split(",") if item]
+        except ValueError:
+            return Response({"error": "Invalid window or indexes parameter"}, status=400)
+        codes = [item for item in request.query_params.get("currencies", "").split(",") if item]
+
+        if window not in WINDOWS:
+            return Response({"error": f"window must be one of {', '.join(map(str, WINDOWS))}"}, status=400)
+        if not index_ids and not codes:
+            return Response({"error": "indexes or currencies are required"}, status=400)
+        currency_instance = currency_registry.find(currency)
+        currencies = [currency_registry.find(code) for code in codes]
+        if currency_instance is None or None in currencies:
+            return Response({"error": "Invalid currency"}, status=400)
+
+        panel = get_universe_panel(currency=currency, window=window)
+        try:
+            columns = panel.columns(index_ids, [item.id for item in currencies])
+        except KeyError as e:
+            return Response({"error": f"Unknown instruments: {e.args[0]}"}, status=400)
+        covariance, correlation, observations = correlation_matrix(panel, columns)
+
+        names = dict(Index.objects.filter(id__in=index_ids).values_list("id", "indexName"))
+        instruments = [{"type": "index", "id": index_id, "name": names[index_id]} for index_id in index_ids] + [
+            {"type": "currency", "id": item.id, "name": item.currency} for item in currencies
+        ]
+
+        def rows(matrix):
+            # NaN (нулевая дисперсия) отдаётся как null
+            return np.where(np.isnan(matrix), None, matrix).tolist()
+
+        return Response({
+            "currency": CurrencySerializer(currency_instance).data,
+            "window": window,
+            "startDate": datetime.date.fromordinal(int(panel.ordinals[0])),
+            "endDate": datetime.date.fromordinal(int(panel.ordinals[-1])),
+            "observations": observations,
+            "instruments": instruments,
+            "covariance": rows(covariance),
+            "correlation": rows(correlation),
+        })
+
+
+class BatchPricesView(generics.GenericAPIView):
+    """
+    Цены произвольного набора инструментов на произвольные даты.
+
+    Тело запроса — {"queries": [[тип, инструмент, дата, валюта], ...]}: тип "index" (инструмент — id бумаги)
+    или "currency" (инструмент — ISO код), дата YYYY-MM-DD, валюта цены необязательна (см. get_batch_prices).
+    Ответ колоночный, в порядке запроса: валюты цен, цены и даты фиксингов бумаг (null для валют и без фиксинга).
+    """
+
+    def post(self, request, *args, **kwargs):
+        queries = request.data.get("queries") if isinstance(request.data, dict) else None
+        if not isinstance(queries, list) or not queries:
+            return Response({"error": "queries must be a non-empty list"}, status=400)
+        if len(queries) > MAX_BATCH_SIZE:
+            return Response({"error": f"At most {MAX_BATCH_SIZE} queries per request"}, status=400)
+
+        kinds, instruments, dates, currencies = [], [], [], []
+        for number, query in enumerate(queries):
+            try:
+                kind, instrument, date, *currency = query
+                if kind == INDEX:
+                    instrument = int(instrument)
+                    # Больший id не упаковывается в ключи хранилища цен (см. history.MAX_INDEX_ID)
+                    if not 0 < instrument <= MAX_INDEX_ID:
+                        raise ValueError
+                elif kind != CURRENCY or currency_registry.find(instrument) is None:
+                    raise ValueError
+                date = datetime.date.fromisoformat(date).toordinal()
+                currency = currency[0] if currency else None
+                if len(query) > 4 or currency is not None and currency_registry.find(currency) is None:
+                    raise ValueError
+            except (TypeError, ValueError):
+                return Response({"error": f"Invalid query #{number}: {query}"}, status=400)
+            kinds.append(kind)
+            instruments.append(instrument)
+            dates.append(date)
+            currencies.append(currency)
+
+        try:
+            currencies, prices, days = get_batch_prices(kinds, instruments, dates, currencies)
+        except KeyError as e:
+            return Response({"error": f"Unknown instruments: {e.args[0]}"}, status=400)
+
+        return Response({
+            "count": len(prices),
+            "currencies": currencies.tolist(),
+            "prices": prices.tolist(),
+            "fixingDates": [datetime.date.fromordinal(day) if day >= 0 else None for day in days.tolist()],
+        })
@@ -0,0 +1,13 @@
+from django.apps import AppConfig
+
+
+class MarketVisionBackendConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'market_vision_backend'
+
+    def ready(self):
+        from django.db.backends.signals import connection_created
+
+        from .metrics import install_query_recorder
+
+        connection_created.connect(install_query_recorder, dispatch_uid="request-metrics")
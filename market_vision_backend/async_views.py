@@ -0,0 +1,83 @@
+from django.core.paginator import InvalidPage, Paginator
+from django.http import Http404, HttpResponse
+from django.views import View
+from rest_framework import exceptions
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+from authentication.async_auth import AsyncJWTAuthentication
+
+_renderer = JSONRenderer()
+
+
+def json_response(data, status=200):
+    """Ответ в том же JSON, что отдаёт JSONRenderer в DRF-представлениях"""
+    return HttpResponse(_renderer.render(data), status=status, content_type=_renderer.media_type)
+
+
+class AsyncAPIView(View):
+    """
+    Основа async-представлений для чтения под ASGI.
+
+    Как APIView с настройками проекта: JWT-аутентификация, доступ только аутентифицированным,
+    ошибки DRF (APIException, Http404) отдаются тем же JSON. Обработчики — корутины, возвращающие
+    HttpResponse (см. json_response); синхронная работа с движками цен выполняется через sync_to_async.
+    """
+
+    authentication = AsyncJWTAuthentication()
+
+    async def dispatch(self, request, *args, **kwargs):
+        try:
+            user = await self.authentication.aauthenticate(request)
+            if user is None:
+                raise exceptions.NotAuthenticated()
+            request.user = user
+            return await super().dispatch(request, *args, **kwargs)
+        except (exceptions.APIException, Http404) as exc:
+            return self.handle_exception(request, exc)
+
+    def handle_exception(self, request, exc):
+        if isinstance(exc, Http404):
+            exc = exceptions.NotFound(*exc.args)
+        data = exc.detail if isinstance(exc.detail, (list, dict)) else {"detail": exc.detail}
+        response = json_response(data, status=exc.status_code)
+        if isinstance(exc, (exceptions.NotAuthenticated, exceptions.AuthenticationFailed)):
+            response["WWW-Authenticate"] = self.authentication.authenticate_header(request)
+        return response
+
+
+async def apaginate(request, queryset, page_size):
+    """
+    Страница queryset по параметру page, как PageNumberPagination: количество и строки страницы
+    читаются через async ORM.
+
+    Returns:
+        dict: count, next, previous и results (объекты модели страницы)
+
+    Raises:
+        NotFound: если номера страницы нет
+    """
+    count = await queryset.acount()
+    paginator = Paginator(range(count), page_size)
+    page_number = request.GET.get("page", 1)
+    if page_number == "last":
+        page_number = paginator.num_pages
+    try:
+        page = paginator.page(page_number)
+    except InvalidPage:
+        raise exceptions.NotFound("Invalid page.")
+
+    offset = (page.number - 1) * page_size
+    results = [item async for item in queryset[offset:offset + page_size]] if count else []
+
+    url = request.build_absolute_uri()
+    previous = None
+    if page.has_previous():
+        previous = page.previous_page_number()
+        previous = remove_query_param(url, "page") if previous == 1 else replace_query_param(url, "page", previous)
+    return {
+        "count": count,
+        "next": replace_query_param(url, "page", page.next_page_number()) if page.has_next() else None,
+        "previous": previous,
+        "results": results,
+    }
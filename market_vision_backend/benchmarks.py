@@ -0,0 +1,335 @@
+"""
+Бенчмарк API: синтетические данные, замер запросов к базе, задержки и пиковой памяти по каждому
+эндпоинту fixings и portfolio, сравнение с сохранённым базовым замером.
+
+Запускается командой benchmark_api на тестовой базе (Postgres или SQLite из настроек), а тесты
+приложений сверяют с базовым замером количество запросов: оно не должно зависеть от объёма данных.
+"""
+import datetime
+import json
+import os
+import time
+import tracemalloc
+from unittest import mock
+
+import numpy as np
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext, override_settings
+from rest_framework.test import APIClient
+
+from authentication.models import User
+from fixings.caching import bump_data_version
+from fixings.history import price_history
+from fixings.models import Currency, CurrencyUSDFixing, Fixing, Index, IngestionJob
+from fixings.rates import rate_engine
+from fixings.registry import currency_registry
+from fixings.snapshots import rebuild_price_snapshots
+from fixings.state import update_market_data_state
+from portfolio.models import IndexPacket, Portfolio, PortfolioValuationCache
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), "benchmark_baseline.json")
+
+# Допустимый рост задержки и памяти относительно базового замера; рост числа запросов недопустим
+DEFAULT_THRESHOLD = 0.25
+# Меньшие абсолютные отклонения считаются шумом
+NOISE_FLOORS = {"p50": 2.0, "p99": 5.0, "peakMemory": 512 * 1024}
+
+CURRENCY_CODES = ["USD", "EUR", "RUB", "GBP", "JPY", "CNY", "CHF", "CAD", "AUD", "HKD", "SEK", "INR"]
+
+
+class SyntheticDataset:
+    """Сгенерированные данные: пользователь, от имени которого идут запросы, и его портфели"""
+
+    def __init__(self, config, user, portfolios, indexes, currencies):
+        self.config = config
+        self.user = user
+        self.portfolios = portfolios
+        self.indexes = indexes
+        self.currencies = currencies
+
+
+def _random_walk(rng, days, start, volatility):
+    return start * np.exp(np.cumsum(rng.normal(0.0002, volatility, days)))
+
+
+def generate_dataset(currencies=8, indexes=50, years=2, users=3, portfolios=3, packets=10, seed=0):
+    """
+    Заполняет базу синтетическими данными: валюты с курсами к USD и бумаги с ценами закрытия
+    по рабочим дням за years лет до вчера, пользователи с портфелями и пакетами, завершённая
+    загрузка фиксингов, снимки цен и состояние рыночных данных.
+
+    Returns:
+        SyntheticDataset
+    """
+    config = {
+        "currencies": currencies, "indexes": indexes, "years": years,
+        "users": users, "portfolios": portfolios, "packets": packets, "seed": seed,
+    }
+    rng = np.random.default_rng(seed)
+    end = datetime.date.today() - datetime.timedelta(days=1)
+    days = np.arange(
+        np.datetime64(end - datetime.timedelta(days=365 * years)), np.datetime64(end + datetime.timedelta(days=1))
+    )
+    dates = days[np.is_busday(days)].astype(datetime.date).tolist()
+
+    codes = (CURRENCY_CODES + [f"X{i:02d}" for i in range(currencies)])[:currencies]
+    currency_objects = Currency.objects.bulk_create([
+        Currency(currency=code, symbol=code, ticker=f"{code}USD=X") for code in codes
+    ])
+    CurrencyUSDFixing.objects.bulk_create([
+        CurrencyUSDFixing(currencyId=currency, currencyFixingDate=date, valueUSD=round(float(value), 8))
+        for currency in currency_objects
+        for date, value in zip(dates, (
+            np.ones(len(dates)) if currency.currency == "USD"
+            else _random_walk(rng, len(dates), rng.uniform(0.01, 2.0), 0.005)
+        ))
+    ], batch_size=5000)
+
+    index_objects = Index.objects.bulk_create([
+        Index(indexName=f"Synthetic {i}", indexISIN=f"SYN{i:04d}",
+              ccyId=currency_objects[int(rng.integers(len(currency_objects)))])
+        for i in range(indexes)
+    ])
+    Fixing.objects.bulk_create([
+        Fixing(indexId=index, currencyId=index.ccyId, fixingDate=date, value=round(float(value), 6))
+        for index in index_objects
+        for date, value in zip(dates, _random_walk(rng, len(dates), rng.uniform(5, 500), 0.015))
+    ], batch_size=5000)
+
+    user_objects = [User.objects.create_user(email=f"benchmark{i}@example.com") for i in range(users)]
+    portfolio_objects = Portfolio.objects.bulk_create([
+        Portfolio(userId=user, name=f"Synthetic {i}") for user in user_objects for i in range(portfolios)
+    ])
+    IndexPacket.objects.bulk_create([
+        IndexPacket(
+            portfolioId=portfolio,
+            indexId=index_objects[int(rng.integers(len(index_objects)))],
+            quantity=int(rng.integers(1, 100)),
+            buyDate=dates[int(rng.integers(len(dates)))],
+        )
+        for portfolio in portfolio_objects for _ in range(packets)
+    ])
+    IngestionJob.objects.create(
+        status=IngestionJob.SUCCESS, isActive=False, startDate=dates[0], endDate=end,
+        tickersTotal=currencies + indexes, tickersDone=currencies + indexes,
+    )
+
+    # bulk_create не вызывает сигналы: сбрасываем движки цен и кэши вручную
+    rate_engine.invalidate()
+    price_history.invalidate()
+    currency_registry.invalidate()
+    bump_data_version()
+    rebuild_price_snapshots()
+    update_market_data_state(ingested=True)
+
+    user = user_objects[0]
+    return SyntheticDataset(
+        config=config,
+        user=user,
+        portfolios=[portfolio for portfolio in portfolio_objects if portfolio.userId_id == user.id],
+        indexes=index_objects,
+        currencies=currency_objects,
+    )
+
+
+class Endpoint:
+    """
+    Запрос к API. build(dataset) вызывается перед каждым повтором вне замера: готовит данные
+    (например, пакет для удаления) и возвращает путь и параметры запроса.
+    """
+
+    def __init__(self, name, method, build):
+        self.name = name
+        self.method = method
+        self.build = build
+
+
+def _finish_jobs():
+    # Иначе каждый повтор update-info возвращал бы уже активную загрузку
+    IngestionJob.objects.filter(isActive=True).update(isActive=False, status=IngestionJob.FAILED)
+
+
+def _update_info(dataset):
+    _finish_jobs()
+    return "/api/fixings/update-info", None
+
+
+def _delete_packet(dataset):
+    packet = IndexPacket.objects.create(
+        portfolioId=dataset.portfolios[-1], indexId=dataset.indexes[0], quantity=1,
+        buyDate=datetime.date.today() - datetime.timedelta(days=30),
+    )
+    return "/api/portfolio/portfolio-card/delete-packet", {"packet_id": packet.id}
+
+
+def _delete_portfolio(dataset):
+    portfolio = Portfolio.objects.create(userId=dataset.user, name="Benchmark delete")
+    IndexPacket.objects.bulk_create([
+        IndexPacket(portfolioId=portfolio, indexId=index, quantity=1,
+                    buyDate=datetime.date.today() - datetime.timedelta(days=30))
+        for index in dataset.indexes[:dataset.config["packets"]]
+    ])
+    return f"/api/portfolio/portfolio-card/{portfolio.id}", None
+
+
+def get_endpoints():
+    """Все эндпоинты fixings/urls.py и portfolio/urls.py в порядке замера: сначала чтение, затем изменения"""
+    def card(dataset):
+        return dataset.portfolios[0].id
+
+    return [
+        Endpoint("fixings:currencies", "get", lambda d: ("/api/fixings/currencies/", {"currency": "EUR"})),
+        Endpoint("fixings:indexes", "get", lambda d: (
+            "/api/fixings/indexes/", {"currency": "EUR", "ordering": "-monthlyDynamic"}
+        )),
+        Endpoint("fixings:update-info-status", "get", lambda d: (
+            f"/api/fixings/update-info/{IngestionJob.objects.order_by('id').first().id}", None
+        )),
+        Endpoint("fixings:status", "get", lambda d: ("/api/fixings/status", None)),
+        Endpoint("fixings:all-currencies-names", "get", lambda d: ("/api/fixings/all-currencies-names", None)),
+        Endpoint("fixings:all-indexes", "get", lambda d: ("/api/fixings/all-indexes", {"currency": "EUR"})),
+        Endpoint("fixings:correlation", "get", lambda d: ("/api/fixings/correlation", {
+            "indexes": ",".join(str(index.id) for index in d.indexes), "currencies": "EUR", "window": 365,
+        })),
+        Endpoint("fixings:update-info", "get", _update_info),
+        Endpoint("portfolio:list", "get", lambda d: ("/api/portfolio/list", {"currency": "EUR"})),
+        Endpoint("portfolio:card", "get", lambda d: (f"/api/portfolio/portfolio-card/{card(d)}", {"currency": "EUR"})),
+        Endpoint("portfolio:prediction", "get", lambda d: (
+            f"/api/portfolio/portfolio-card/{card(d)}/prediction", {"currency": "EUR"}
+        )),
+        Endpoint("portfolio:prediction-montecarlo", "get", lambda d: (
+            f"/api/portfolio/portfolio-card/{card(d)}/prediction",
+            {"currency": "EUR", "method": "montecarlo", "seed": 0},
+        )),
+        Endpoint("portfolio:history", "get", lambda d: (
+            f"/api/portfolio/portfolio-card/{card(d)}/history", {"currency": "EUR", "interval": "week"}
+        )),
+        Endpoint("portfolio:risk", "get", lambda d: (
+            f"/api/portfolio/portfolio-card/{card(d)}/risk", {"currency": "EUR", "benchmark": d.indexes[0].id}
+        )),
+        Endpoint("portfolio:create-portfolio", "post", lambda d: (
+            "/api/portfolio/create-portfolio", {"name": "Benchmark"}
+        )),
+        Endpoint("portfolio:update-portfolio", "patch", lambda d: (
+            f"/api/portfolio/portfolio-card/update/{d.portfolios[-1].id}", {"name": "Benchmark renamed"}
+        )),
+        Endpoint("portfolio:add-packet", "post", lambda d: ("/api/portfolio/portfolio-card/add-packet", {
+            "portfolio_id": d.portfolios[-1].id, "index_id": d.indexes[-1].id, "quantity": 1,
+            "buy_date": (datetime.date.today() - datetime.timedelta(days=30)).isoformat(),
+        })),
+        Endpoint("portfolio:delete-packet", "delete", _delete_packet),
+        Endpoint("portfolio:delete-portfolio", "delete", _delete_portfolio),
+    ]
+
+
+def _reset_caches():
+    # Каждый повтор меряет полный расчёт: без кэша ответов, версии данных и сохранённых оценок
+    cache.clear()
+    PortfolioValuationCache.objects.all().delete()
+
+
+def _send(client, endpoint, dataset):
+    path, data = endpoint.build(dataset)
+    _reset_caches()
+    if endpoint.method == "get":
+        return lambda: client.get(path, data)
+    return lambda: getattr(client, endpoint.method)(path, data, format="json")
+
+
+def measure(client, endpoint, dataset, repeat=20):
+    """
+    Замер эндпоинта: после прогревочного запроса repeat повторов с подсчётом запросов к базе
+    и задержки, затем отдельный повтор под tracemalloc для пиковой памяти.
+
+    Returns:
+        dict: status, queries (наибольшее за повторы), p50 и p99 в мс, peakMemory в байтах
+    """
+    _send(client, endpoint, dataset)()
+
+    timings = []
+    queries = 0
+    status = None
+    for _ in range(repeat):
+        send = _send(client, endpoint, dataset)
+        with CaptureQueriesContext(connection) as captured:
+            started = time.perf_counter()
+            response = send()
+            timings.append((time.perf_counter() - started) * 1000)
+        queries = max(queries, len(captured))
+        status = response.status_code
+
+    send = _send(client, endpoint, dataset)
+    tracemalloc.start()
+    try:
+        send()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "status": status,
+        "queries": queries,
+        "p50": round(float(np.percentile(timings, 50)), 3),
+        "p99": round(float(np.percentile(timings, 99)), 3),
+        "peakMemory": peak,
+    }
+
+
+def run_benchmark(dataset, endpoints=None, repeat=20):
+    """
+    Замеряет эндпоинты от имени dataset.user.
+
+    Движки цен не перечитывают базу по таймеру, чтобы это не попадало в замеры, а update-info
+    только ставит загрузку в очередь: фоновый поток загрузки не запускается.
+
+    Returns:
+        dict: {имя эндпоинта: результат measure}
+    """
+    client = APIClient()
+    client.force_authenticate(dataset.user)
+    endpoints = get_endpoints() if endpoints is None else endpoints
+
+    results = {}
+    with override_settings(RATE_ENGINE_REFRESH_SECONDS=24 * 3600, PRICE_HISTORY_DIR=None), \
+            mock.patch("fixings.tasks._start_worker"):
+        for endpoint in endpoints:
+            results[endpoint.name] = measure(client, endpoint, dataset, repeat=repeat)
+    return results
+
+
+def load_baseline(path=BASELINE_PATH):
+    """Базовый замер: {"config": параметры данных, "endpoints": {имя: результат}}; нет файла — пустой"""
+    if not os.path.exists(path):
+        return {"config": {}, "endpoints": {}}
+    with open(path, encoding="utf-8") as file:
+        return json.load(file)
+
+
+def save_baseline(results, config, path=BASELINE_PATH):
+    with open(path, "w", encoding="utf-8") as file:
+        json.dump({"config": config, "endpoints": results}, file, ensure_ascii=False, indent=2, sort_keys=True)
+        file.write("\n")
+
+
+def compare(results, baseline, threshold=DEFAULT_THRESHOLD):
+    """
+    Регрессии относительно базового замера: любой рост числа запросов, рост задержки или памяти
+    больше чем на threshold (и больше шумового порога) или ответ с ошибкой.
+
+    Returns:
+        list: описания регрессий
+    """
+    regressions = []
+    for name, result in results.items():
+        if result["status"] >= 400:
+            regressions.append(f"{name}: status {result['status']}")
+        base = baseline.get("endpoints", {}).get(name)
+        if base is None:
+            continue
+        if result["queries"] > base["queries"]:
+            regressions.append(f"{name}: queries {base['queries']} -> {result['queries']}")
+        for metric, floor in NOISE_FLOORS.items():
+            if result[metric] > base[metric] * (1 + threshold) and result[metric] - base[metric] > floor:
+                regressions.append(f"{name}: {metric} {base[metric]} -> {result[metric]}")
+    return regressions
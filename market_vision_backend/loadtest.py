@@ -0,0 +1,141 @@
+"""
+Нагрузочный тест запущенного сервера: одновременные соединения с keep-alive в течение заданного
+времени по кругу запрашивают эндпоинты дашборда — списки бумаг и валют, список и карточку портфеля.
+
+Клиент написан на asyncio без сторонних библиотек: один процесс держит сотни соединений и сам не
+ограничивает пропускную способность сервера. Команда load_test сравнивает несколько серверов на одной
+базе, например gunicorn (WSGI) и uvicorn (ASGI).
+"""
+import asyncio
+import time
+from collections import Counter
+from urllib.parse import urlsplit
+
+import numpy as np
+
+DEFAULT_CONCURRENCY = 64
+DEFAULT_DURATION = 10.0
+
+
+def dashboard_paths(portfolio_id, currency="USD"):
+    """Запросы, которые дашборд делает при открытии"""
+    return [
+        f"/api/fixings/indexes/?currency={currency}",
+        f"/api/fixings/currencies/?currency={currency}",
+        f"/api/portfolio/list?currency={currency}",
+        f"/api/portfolio/portfolio-card/{portfolio_id}?currency={currency}",
+    ]
+
+
+class LoadResult:
+    """Задержки успешных ответов в миллисекундах по путям и ошибки (статус >= 400 или сбой соединения)"""
+
+    def __init__(self, paths):
+        self.latencies = {path: [] for path in paths}
+        self.errors = Counter()
+        self.duration = 0.0
+
+    @property
+    def requests(self):
+        return sum(len(latencies) for latencies in self.latencies.values())
+
+    @property
+    def throughput(self):
+        """Успешных ответов в секунду"""
+        return self.requests / self.duration if self.duration else 0.0
+
+    def percentile(self, path, q):
+        latencies = self.latencies[path]
+        return float(np.percentile(latencies, q)) if latencies else float("nan")
+
+
+async def _read_response(reader):
+    """Читает ответ HTTP/1.1 целиком; возвращает статус и признак закрытия соединения сервером"""
+    status_line = await reader.readline()
+    if not status_line:
+        raise ConnectionError("Connection closed by server")
+    status = int(status_line.split()[1])
+
+    length, chunked, close = None, False, False
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        name, value = name.strip().lower(), value.strip().lower()
+        if name == "content-length":
+            length = int(value)
+        elif name == "transfer-encoding":
+            chunked = "chunked" in value
+        elif name == "connection":
+            close = value == "close"
+
+    if chunked:
+        while True:
+            size = int((await reader.readline()).split(b";")[0], 16)
+            await reader.readexactly(size + 2)
+            if size == 0:
+                break
+    elif length is not None:
+        await reader.readexactly(length)
+    else:
+        await reader.read()
+        close = True
+    return status, close
+
+
+async def _worker(host, port, requests, first, deadline, result):
+    reader = writer = None
+    position = first
+    while time.perf_counter() < deadline:
+        path, raw = requests[position % len(requests)]
+        position += 1
+        start = time.perf_counter()
+        try:
+            if writer is None:
+                reader, writer = await asyncio.open_connection(host, port)
+            writer.write(raw)
+            await writer.drain()
+            status, close = await _read_response(reader)
+        except (OSError, ValueError, asyncio.IncompleteReadError):
+            result.errors[path] += 1
+            status, close = None, True
+            await asyncio.sleep(0.01)
+
+        if status is not None and time.perf_counter() < deadline:
+            if status < 400:
+                result.latencies[path].append((time.perf_counter() - start) * 1000)
+            else:
+                result.errors[path] += 1
+        if close and writer is not None:
+            writer.close()
+            writer = None
+    if writer is not None:
+        writer.close()
+
+
+async def run_load(url, paths, token=None, concurrency=DEFAULT_CONCURRENCY, duration=DEFAULT_DURATION):
+    """
+    Нагружает сервер url в течение duration секунд concurrency соединениями.
+
+    Returns:
+        LoadResult
+    """
+    parts = urlsplit(url)
+    host, port = parts.hostname, parts.port or 80
+    headers = f"Host: {parts.netloc}\r\nAccept: application/json\r\n"
+    if token:
+        headers += f"Authorization: Bearer {token}\r\n"
+    requests = [(path, f"GET {path} HTTP/1.1\r\n{headers}\r\n".encode()) for path in paths]
+
+    result = LoadResult(paths)
+    deadline = time.perf_counter() + duration
+    await asyncio.gather(*(
+        _worker(host, port, requests, worker, deadline, result) for worker in range(concurrency)
+    ))
+    result.duration = duration
+    return result
+
+
+def load_test(url, paths, token=None, concurrency=DEFAULT_CONCURRENCY, duration=DEFAULT_DURATION):
+    return asyncio.run(run_load(url, paths, token=token, concurrency=concurrency, duration=duration))
@@ -0,0 +1,74 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.test.utils import setup_databases, teardown_databases
+
+from market_vision_backend.benchmarks import BASELINE_PATH, DEFAULT_THRESHOLD, compare, generate_dataset, \
+    get_endpoints, load_baseline, run_benchmark, save_baseline
+
+
+class Command(BaseCommand):
+    help = (
+        "Замеряет число запросов к базе, задержку p50/p99 и пиковую память каждого эндпоинта fixings и portfolio "
+        "на синтетических данных и сравнивает с базовым замером. Данные создаются в отдельной тестовой базе "
+        "(как у manage.py test) и удаляются вместе с ней."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--currencies", type=int, default=8, help="Количество валют")
+        parser.add_argument("--indexes", type=int, default=50, help="Количество бумаг")
+        parser.add_argument("--years", type=int, default=2, help="Лет ежедневных фиксингов")
+        parser.add_argument("--users", type=int, default=3, help="Количество пользователей")
+        parser.add_argument("--portfolios", type=int, default=3, help="Портфелей у пользователя")
+        parser.add_argument("--packets", type=int, default=10, help="Пакетов в портфеле")
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--repeat", type=int, default=20, help="Повторов каждого запроса")
+        parser.add_argument("--endpoints", nargs="+", help="Замерять только эндпоинты с этими префиксами имён")
+        parser.add_argument("--baseline", default=BASELINE_PATH, help="Файл базового замера")
+        parser.add_argument("--update-baseline", action="store_true", help="Записать результаты как базовый замер")
+        parser.add_argument(
+            "--threshold", type=float, default=DEFAULT_THRESHOLD,
+            help="Допустимый рост задержки и памяти относительно базового замера, доля"
+        )
+
+    def handle(self, *args, **options):
+        endpoints = get_endpoints()
+        if options["endpoints"]:
+            endpoints = [
+                endpoint for endpoint in endpoints
+                if any(endpoint.name.startswith(prefix) for prefix in options["endpoints"])
+            ]
+
+        old_config = setup_databases(verbosity=0, interactive=False, aliases={"default"})
+        try:
+            with transaction.atomic():
+                dataset = generate_dataset(
+                    currencies=options["currencies"], indexes=options["indexes"], years=options["years"],
+                    users=options["users"], portfolios=options["portfolios"], packets=options["packets"],
+                    seed=options["seed"],
+                )
+                results = run_benchmark(dataset, endpoints, repeat=options["repeat"])
+                transaction.set_rollback(True)
+        finally:
+            teardown_databases(old_config, verbosity=0)
+
+        self.stdout.write(f"{'эндпоинт':<36}{'статус':>7}{'запросов':>10}{'p50, мс':>10}{'p99, мс':>10}{'память, КБ':>12}")
+        for name, result in results.items():
+            self.stdout.write(
+                f"{name:<36}{result['status']:>7}{result['queries']:>10}{result['p50']:>10.1f}"
+                f"{result['p99']:>10.1f}{result['peakMemory'] / 1024:>12.0f}"
+            )
+
+        if options["update_baseline"]:
+            save_baseline(results, dataset.config, options["baseline"])
+            self.stdout.write(self.style.SUCCESS(f"Базовый замер записан в {options['baseline']}"))
+            return
+
+        baseline = load_baseline(options["baseline"])
+        if baseline["config"] and baseline["config"] != dataset.config:
+            self.stdout.write(self.style.WARNING(
+                f"Базовый замер снят на других данных ({baseline['config']}): сравнение задержек неточно"
+            ))
+        regressions = compare(results, baseline, threshold=options["threshold"])
+        if regressions:
+            raise CommandError("Регрессии относительно базового замера:\n  " + "\n  ".join(regressions))
+        self.stdout.write(self.style.SUCCESS("Регрессий относительно базового замера нет"))
@@ -0,0 +1,67 @@
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework_simplejwt.tokens import AccessToken
+
+from authentication.models import User
+from market_vision_backend.loadtest import DEFAULT_CONCURRENCY, DEFAULT_DURATION, dashboard_paths, load_test
+from portfolio.models import Portfolio
+
+
+class Command(BaseCommand):
+    help = (
+        "Нагрузочный тест запущенных серверов запросами дашборда: пропускная способность и задержки "
+        "p50/p99 по эндпоинтам. Серверы передаются как имя=URL, например "
+        "wsgi=http://127.0.0.1:8000 asgi=http://127.0.0.1:8001, и должны работать с той же базой, "
+        "что и команда: токен и портфель берутся у пользователя --email."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("targets", nargs="+", help="Серверы: имя=URL или URL")
+        parser.add_argument("--email", help="Пользователь, от имени которого идут запросы")
+        parser.add_argument("--token", help="Готовый access-токен вместо --email")
+        parser.add_argument("--portfolio", type=int, help="id портфеля для карточки; по умолчанию первый у пользователя")
+        parser.add_argument("--currency", default="USD")
+        parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY, help="Одновременных соединений")
+        parser.add_argument("--duration", type=float, default=DEFAULT_DURATION, help="Длительность замера, секунд")
+        parser.add_argument("--warmup", type=float, default=2.0, help="Прогрев перед замером, секунд")
+
+    def handle(self, *args, **options):
+        token, portfolio_id = options["token"], options["portfolio"]
+        if token is None:
+            if not options["email"]:
+                raise CommandError("Нужен --email или --token")
+            user = User.objects.filter(email=options["email"]).first()
+            if user is None:
+                raise CommandError(f"Пользователь {options['email']} не найден")
+            token = str(AccessToken.for_user(user))
+            if portfolio_id is None:
+                portfolio_id = Portfolio.objects.filter(userId=user).order_by("id").values_list("id", flat=True).first()
+        if portfolio_id is None:
+            raise CommandError("Нужен --portfolio: у пользователя нет портфелей")
+
+        paths = dashboard_paths(portfolio_id, options["currency"])
+        results = {}
+        for target in options["targets"]:
+            name, _, url = target.rpartition("=")
+            name = name or url
+            if options["warmup"] > 0:
+                load_test(url, paths, token=token, concurrency=options["concurrency"], duration=options["warmup"])
+            results[name] = load_test(
+                url, paths, token=token, concurrency=options["concurrency"], duration=options["duration"]
+            )
+
+        self.stdout.write(f"{'сервер':<12}{'эндпоинт':<56}{'ответов':>9}{'ошибок':>8}{'p50, мс':>10}{'p99, мс':>10}")
+        for name, result in results.items():
+            for path in paths:
+                self.stdout.write(
+                    f"{name:<12}{path:<56}{len(result.latencies[path]):>9}{result.errors[path]:>8}"
+                    f"{result.percentile(path, 50):>10.1f}{result.percentile(path, 99):>10.1f}"
+                )
+
+        first = next(iter(results.values()))
+        self.stdout.write("")
+        for name, result in results.items():
+            ratio = result.throughput / first.throughput if first.throughput else float("nan")
+            self.stdout.write(
+                f"{name:<12}{result.throughput:>10.1f} запросов/с, ошибок: {sum(result.errors.values())}, "
+                f"×{ratio:.2f} к {next(iter(results))}"
+            )
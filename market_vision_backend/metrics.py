@@ -0,0 +1,321 @@
+import atexit
+import functools
+import json
+import os
+import threading
+import time
+import uuid
+from collections import Counter
+from contextvars import ContextVar
+
+from django.conf import settings
+from rest_framework import serializers
+
+# Границы гистограмм: длительность запроса в секундах и количество SQL-запросов на HTTP-запрос
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+# Как часто процесс пишет свои метрики в METRICS_DIR, секунд
+FLUSH_INTERVAL = 5
+
+_current = ContextVar("request_profile", default=None)
+
+
+class RequestProfile:
+    """
+    SQL-запросы и время методов сериализаторов в рамках одного HTTP-запроса.
+
+    Запросы считаются одинаковыми, если совпадают и SQL, и параметры.
+    """
+
+    def __init__(self):
+        self.queries = Counter()
+        self.db_time = 0.0
+        self.fields = {}
+
+    @property
+    def query_count(self):
+        return sum(self.queries.values())
+
+    @property
+    def duplicate_count(self):
+        return self.query_count - len(self.queries)
+
+    def add_query(self, sql, params, duration):
+        self.queries[(sql, repr(params))] += 1
+        self.db_time += duration
+
+    def add_field(self, name, duration):
+        calls, total = self.fields.get(name, (0, 0.0))
+        self.fields[name] = (calls + 1, total + duration)
+
+
+def record_query(execute, sql, params, many, context):
+    """
+    Обёртка выполнения SQL (см. install_query_recorder): пишет запрос в профиль текущего запроса.
+
+    Профиль ищется в контекстной переменной, поэтому запросы async ORM, выполняемые в потоках
+    sync_to_async, попадают в профиль того же HTTP-запроса.
+    """
+    profile = _current.get()
+    if profile is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        profile.add_query(sql, params, time.perf_counter() - start)
+
+
+def install_query_recorder(connection, **kwargs):
+    """
+    Подключает record_query к соединению; вызывается по сигналу connection_created. Соединения
+    Django свои в каждом потоке, поэтому обёртка ставится на соединение, а не на время запроса.
+    """
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+def start_profile():
+    """Начинает профиль текущего запроса; возвращает профиль и токен для stop_profile"""
+    profile = RequestProfile()
+    return profile, _current.set(profile)
+
+
+def stop_profile(token):
+    _current.reset(token)
+
+
+def get_profile():
+    """Профиль текущего запроса или None, если запрос не профилируется"""
+    return _current.get()
+
+
+def profiled_fields(serializer_class):
+    """
+    Декоратор класса сериализатора: замеряет время каждого метода SerializerMethodField.
+
+    Время пишется в профиль текущего запроса под именем «Сериализатор.поле»; вне профилируемого
+    запроса методы вызываются как есть.
+    """
+    for name, field in serializer_class._declared_fields.items():
+        if not isinstance(field, serializers.SerializerMethodField):
+            continue
+        method_name = field.method_name or f"get_{name}"
+        method = getattr(serializer_class, method_name)
+        setattr(serializer_class, method_name, _timed(method, f"{serializer_class.__name__}.{name}"))
+    return serializer_class
+
+
+def _timed(method, label):
+    @functools.wraps(method)
+    def wrapper(self, obj):
+        profile = _current.get()
+        if profile is None:
+            return method(self, obj)
+        start = time.perf_counter()
+        try:
+            return method(self, obj)
+        finally:
+            profile.add_field(label, time.perf_counter() - start)
+    return wrapper
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0
+
+    def observe(self, value):
+        for position, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[position] += 1
+        self.count += 1
+        self.sum += value
+
+    def merge(self, counts, count, total):
+        self.counts = [own + other for own, other in zip(self.counts, counts)]
+        self.count += count
+        self.sum += total
+
+
+class _Values:
+    """Счётчики и гистограммы метрик; сериализуются в JSON и складываются между процессами"""
+
+    COUNTERS = ("requests", "db_seconds", "duplicates", "field_calls", "field_seconds")
+    HISTOGRAMS = {"durations": DURATION_BUCKETS, "queries": QUERY_BUCKETS}
+
+    def __init__(self):
+        for name in self.COUNTERS:
+            setattr(self, name, Counter())
+        for name in self.HISTOGRAMS:
+            setattr(self, name, {})
+
+    def histogram(self, name, key):
+        return getattr(self, name).setdefault(key, Histogram(self.HISTOGRAMS[name]))
+
+    def dump(self):
+        data = {name: [[list(key), value] for key, value in getattr(self, name).items()] for name in self.COUNTERS}
+        for name in self.HISTOGRAMS:
+            data[name] = [[list(key), item.counts, item.count, item.sum] for key, item in getattr(self, name).items()]
+        return data
+
+    def merge(self, data):
+        for name in self.COUNTERS:
+            for key, value in data.get(name, ()):
+                getattr(self, name)[tuple(key)] += value
+        for name in self.HISTOGRAMS:
+            for key, counts, count, total in data.get(name, ()):
+                self.histogram(name, tuple(key)).merge(counts, count, total)
+
+
+class MetricsRegistry:
+    """
+    Накопленные метрики запросов в формате Prometheus.
+
+    Метки — маршрут URL (шаблон, а не конкретный путь), метод и статус, поэтому число рядов
+    ограничено числом эндпоинтов. Каждый процесс копит свои метрики; если задан METRICS_DIR,
+    фоновый поток процесса раз в FLUSH_INTERVAL секунд пишет их в свой файл в этом каталоге,
+    а /api/metrics отдаёт сумму по всем файлам — так счётчики не скачут между воркерами gunicorn.
+    Запись в файл не попадает в обработку запросов. Каталог общий для воркеров одного сервера
+    и очищается при его запуске.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._pid = None
+        self._name = None
+        self._flusher_pid = None
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._values = _Values()
+            self._dirty = False
+            path = self._path()
+        if path is not None and os.path.exists(path):
+            os.remove(path)
+
+    def record(self, route, method, status, duration, profile):
+        with self._lock:
+            values = self._values
+            values.requests[(route, method, str(status))] += 1
+            key = (route, method)
+            values.histogram("durations", key).observe(duration)
+            values.histogram("queries", key).observe(profile.query_count)
+            values.db_seconds[key] += profile.db_time
+            values.duplicates[key] += profile.duplicate_count
+            for field, (calls, seconds) in profile.fields.items():
+                values.field_calls[(route, field)] += calls
+                values.field_seconds[(route, field)] += seconds
+            self._dirty = True
+        if self._flusher_pid != os.getpid():
+            self._start_flusher()
+
+    def _path(self):
+        directory = getattr(settings, "METRICS_DIR", None)
+        if not directory:
+            return None
+        # Имя файла уникально для процесса: воркер с переиспользованным pid не затрёт счётчики предыдущего
+        if self._pid != os.getpid():
+            self._pid, self._name = os.getpid(), f"{os.getpid()}-{uuid.uuid4().hex}.json"
+        return os.path.join(directory, self._name)
+
+    def _start_flusher(self):
+        if not getattr(settings, "METRICS_DIR", None):
+            return
+        with self._lock:
+            if self._flusher_pid == os.getpid():
+                return
+            self._flusher_pid = os.getpid()
+        threading.Thread(target=self._flush_loop, name="metrics-flush", daemon=True).start()
+        atexit.register(self.flush)
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(FLUSH_INTERVAL)
+            self.flush()
+
+    def flush(self):
+        """Пишет метрики процесса в его файл в METRICS_DIR, если они изменились с прошлой записи"""
+        with self._lock:
+            path = self._path()
+            if path is None or not self._dirty:
+                return
+            data = self._values.dump()
+            self._dirty = False
+        with self._write_lock:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            temporary = f"{path}.tmp"
+            with open(temporary, "w", encoding="utf-8") as file:
+                json.dump(data, file)
+            os.replace(temporary, path)
+
+    def _collect(self):
+        directory = getattr(settings, "METRICS_DIR", None)
+        if not directory:
+            return self._values
+        values = _Values()
+        if not os.path.isdir(directory):
+            return values
+        for name in os.listdir(directory):
+            if not name.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(directory, name), encoding="utf-8") as file:
+                    values.merge(json.load(file))
+            except (OSError, ValueError):
+                continue
+        return values
+
+    def render(self):
+        """Текстовый формат экспозиции Prometheus 0.0.4; свои метрики процесс записывает перед сбором"""
+        self.flush()
+        lines = []
+        with self._lock:
+            values = self._collect()
+            _counter(lines, "http_requests_total", "HTTP requests by route, method and status",
+                     ("route", "method", "status"), values.requests)
+            _histogram(lines, "http_request_duration_seconds", "HTTP request duration", values.durations)
+            _histogram(lines, "http_request_db_queries", "SQL queries per HTTP request", values.queries)
+            _counter(lines, "http_request_db_seconds_total", "Time spent in SQL queries",
+                     ("route", "method"), values.db_seconds)
+            _counter(lines, "http_request_db_duplicate_queries_total", "SQL queries repeated with the same parameters",
+                     ("route", "method"), values.duplicates)
+            _counter(lines, "serializer_method_field_calls_total", "SerializerMethodField calls",
+                     ("route", "field"), values.field_calls)
+            _counter(lines, "serializer_method_field_seconds_total", "Time spent in SerializerMethodField methods",
+                     ("route", "field"), values.field_seconds)
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names, values):
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + "}"
+
+
+def _counter(lines, name, help_text, label_names, values):
+    lines.append(f"# HELP {name} {help_text}")
+    lines.append(f"# TYPE {name} counter")
+    for key in sorted(values):
+        lines.append(f"{name}{_labels(label_names, key)} {values[key]}")
+
+
+def _histogram(lines, name, help_text, histograms):
+    lines.append(f"# HELP {name} {help_text}")
+    lines.append(f"# TYPE {name} histogram")
+    for (route, method) in sorted(histograms):
+        histogram = histograms[(route, method)]
+        for bound, count in zip(histogram.buckets, histogram.counts):
+            lines.append(f"{name}_bucket{_labels(('route', 'method', 'le'), (route, method, f'{bound:g}'))} {count}")
+        lines.append(f"{name}_bucket{_labels(('route', 'method', 'le'), (route, method, '+Inf'))} {histogram.count}")
+        lines.append(f"{name}_sum{_labels(('route', 'method'), (route, method))} {histogram.sum}")
+        lines.append(f"{name}_count{_labels(('route', 'method'), (route, method))} {histogram.count}")
+
+
+metrics = MetricsRegistry()
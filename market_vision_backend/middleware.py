@@ -0,0 +1,67 @@
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+from .metrics import metrics, start_profile, stop_profile
+
+
+class RequestMetricsMiddleware:
+    """
+    Профилирует каждый запрос: число и суммарное время SQL-запросов, повторы одного и того же
+    запроса с теми же параметрами и время методов SerializerMethodField (см. metrics.profiled_fields).
+    SQL записывается обёрткой, которую получает каждое новое соединение (см. MarketVisionBackendConfig).
+
+    Итог накапливается в metrics для /api/metrics и при SERVER_TIMING_ENABLED отдаётся клиенту в заголовке Server-Timing.
+    Работает и в WSGI, и в ASGI: под ASGI async-представления не переключаются в поток ради middleware.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.server_timing = getattr(settings, "SERVER_TIMING_ENABLED", False)
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        start = time.perf_counter()
+        profile, token = start_profile()
+        try:
+            response = self.get_response(request)
+        finally:
+            stop_profile(token)
+        return self._finish(request, response, profile, time.perf_counter() - start)
+
+    async def __acall__(self, request):
+        start = time.perf_counter()
+        profile, token = start_profile()
+        try:
+            response = await self.get_response(request)
+        finally:
+            stop_profile(token)
+        return self._finish(request, response, profile, time.perf_counter() - start)
+
+    def _finish(self, request, response, profile, duration):
+        match = getattr(request, "resolver_match", None)
+        route = match.route if match is not None else "unmatched"
+        metrics.record(route, request.method, response.status_code, duration, profile)
+
+        if self.server_timing:
+            response["Server-Timing"] = _server_timing(duration, profile)
+        return response
+
+
+def _server_timing(duration, profile):
+    entries = [
+        f"total;dur={duration * 1000:.2f}",
+        f'db;dur={profile.db_time * 1000:.2f};desc="{profile.query_count} queries, '
+        f'{profile.duplicate_count} duplicates"',
+    ]
+    for name, (calls, seconds) in sorted(profile.fields.items(), key=lambda item: -item[1][1]):
+        entries.append(f'{name};dur={seconds * 1000:.2f};desc="{calls} calls"')
+    return ", ".join(entries)
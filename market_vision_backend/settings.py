@@ -51,6 +51,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'market_vision_backend.middleware.RequestMetricsMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -81,6 +82,10 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'market_vision_backend.wsgi.application'
 
+# Async-представления для списков и карточки портфеля; включается в asgi.py для запуска под uvicorn
+
+ASYNC_READ_VIEWS = bool(int(os.getenv('ASYNC_READ_VIEWS', '0')))
+
 
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
@@ -132,7 +137,7 @@ CORS_ALLOW_HEADERS = [
     'x-csrftoken',
     'x-requested-with',
 ]
-CORS_EXPOSE_HEADERS = ['Content-Type', 'X-CSRFToken']
+CORS_EXPOSE_HEADERS = ['Content-Type', 'X-CSRFToken', 'Server-Timing']
 CORS_PREFLIGHT_MAX_AGE = 86400  # 24 hours
 
 SIMPLE_JWT = {
@@ -170,3 +175,43 @@ STATIC_URL = 'static/'
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+# Market data engines
+# Как часто процесс проверяет появление новых фиксингов в базе (секунды)
+
+RATE_ENGINE_REFRESH_SECONDS = int(os.getenv('RATE_ENGINE_REFRESH_SECONDS', '60'))
+
+# Каталог для снимков истории цен, которые воркеры открывают через mmap (пусто — только память процесса)
+
+PRICE_HISTORY_DIR = os.getenv('PRICE_HISTORY_DIR') or None
+
+# Источник цен для загрузки фиксингов: yfinance или file (снимки Parquet/CSV в MARKET_DATA_DIR)
+
+MARKET_DATA_PROVIDER = os.getenv('MARKET_DATA_PROVIDER', 'yfinance')
+
+MARKET_DATA_DIR = os.getenv('MARKET_DATA_DIR') or None
+
+# Кэш ответов списков фиксингов. С LocMemCache у каждого воркера свой кэш: версия данных в нём сверяется
+# с MarketDataState.updatedAt не реже раза в RATE_ENGINE_REFRESH_SECONDS, поэтому после загрузки в другом
+# процессе ответы устаревают не дольше этого интервала. Общий бэкенд (RedisCache, FileBasedCache) делит и сам кэш
+
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('CACHE_LOCATION', ''),
+    }
+}
+
+FIXINGS_CACHE_TIMEOUT = int(os.getenv('FIXINGS_CACHE_TIMEOUT', '3600'))
+
+# Метрики запросов: заголовок Server-Timing в ответах и /api/metrics в формате Prometheus.
+# Server-Timing раскрывает клиентам число SQL-запросов и время сериализаторов, поэтому по умолчанию выключен.
+# /api/metrics отдаётся с заголовком Authorization: Bearer <METRICS_TOKEN> или сотруднику (is_staff).
+# METRICS_DIR — общий каталог воркеров, через который /api/metrics суммирует метрики всех процессов;
+# без него каждый воркер отдаёт только свои
+
+SERVER_TIMING_ENABLED = bool(int(os.getenv('SERVER_TIMING_ENABLED', '0')))
+
+METRICS_TOKEN = os.getenv('METRICS_TOKEN') or None
+
+METRICS_DIR = os.getenv('METRICS_DIR') or None
@@ -14,17 +14,31 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+import hmac
+
+from django.conf import settings
 from django.contrib import admin
 from django.urls import path, include
-from django.http import JsonResponse
+from django.http import HttpResponse, JsonResponse
+
+from .metrics import metrics
 
 def health_check(request):
     return JsonResponse({"status": "healthy"})
 
+def metrics_endpoint(request):
+    # Метрики отдаются по METRICS_TOKEN (Prometheus) или сотруднику, вошедшему в админку
+    token = getattr(settings, "METRICS_TOKEN", None)
+    authorized = bool(token) and hmac.compare_digest(request.headers.get("Authorization", ""), f"Bearer {token}")
+    if not authorized and not request.user.is_staff:
+        return HttpResponse(status=401)
+    return HttpResponse(metrics.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
 urlpatterns = [
     path('api/auth/', include('authentication.urls')),
     path('admin/', admin.site.urls),
     path('api/fixings/', include('fixings.urls')),
     path('api/portfolio/', include('portfolio.urls')),
     path('api/health/', health_check, name='health_check'),
+    path('api/metrics', metrics_endpoint, name='metrics'),
 ]
@@ -0,0 +1,64 @@
+from asgiref.sync import sync_to_async
+from django.shortcuts import aget_object_or_404
+
+from fixings.registry import currency_registry
+from fixings.serializers import CurrencySerializer
+from market_vision_backend.async_views import AsyncAPIView, json_response
+from .caching import aget_portfolio_valuations
+from .models import Portfolio
+from .serializers import PortfolioListSerializer, PortfolioCardSerializer
+
+
+def _currency_data(currency):
+    return CurrencySerializer(currency_registry.get(currency)).data
+
+
+class AsyncPortfolioListView(AsyncAPIView):
+    """
+    Async-вариант PortfolioListView: портфели и кэш оценок читаются через async ORM, недостающие
+    оценки считаются в потоке. Сериализация берёт оценки из контекста и к базе не обращается.
+    """
+
+    async def get(self, request):
+        currency = request.GET.get("currency", "USD")
+
+        portfolios = [portfolio async for portfolio in Portfolio.objects.filter(userId=request.user)]
+        valuations = await aget_portfolio_valuations(portfolios, currency)
+
+        serializer = PortfolioListSerializer(
+            portfolios,
+            many=True,
+            context={
+                "currency": currency,
+                "valuations": {
+                    (portfolio_id, currency): valuation for portfolio_id, valuation in valuations.items()
+                },
+            }
+        )
+        return json_response({
+            "portfolios": serializer.data,
+            "currency": await sync_to_async(_currency_data)(currency),
+        })
+
+
+class AsyncPortfolioCardView(AsyncAPIView):
+    """
+    Async-вариант PortfolioCardView. Портфель с пакетами и его оценка читаются через async ORM;
+    цены бумаг в карточке считают движки цен, поэтому сериализация выполняется в потоке.
+    """
+
+    async def get(self, request, pk):
+        currency = request.GET.get("currency", "USD")
+        portfolio = await aget_object_or_404(Portfolio.objects.prefetch_related("packets__indexId__ccyId"), pk=pk)
+        valuations = await aget_portfolio_valuations([portfolio], currency, packets=portfolio.get_packets())
+
+        serializer = PortfolioCardSerializer(portfolio, context={
+            "currency": currency,
+            "valuations": {(portfolio.id, currency): valuations[portfolio.id]},
+        })
+        return json_response(await sync_to_async(lambda: serializer.data)())
+
+    async def delete(self, request, pk):
+        portfolio = await aget_object_or_404(Portfolio, pk=pk, userId=request.user)
+        await portfolio.adelete()
+        return json_response({"success": True})
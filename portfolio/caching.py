@@ -0,0 +1,178 @@
+import datetime
+import threading
+from decimal import Decimal
+
+from asgiref.sync import sync_to_async
+from django.db.models import F, Q
+
+from fixings.caching import aget_data_marker, get_data_marker, get_data_version
+from fixings.history import price_history
+from fixings.rates import rate_engine
+from fixings.registry import currency_registry
+from .models import IndexPacket, Portfolio, PortfolioValuationCache
+from .valuation import value_portfolios
+
+
+def _decimal(value):
+    # DjangoJSONEncoder сохраняет Decimal строкой, целые нули пустых портфелей — числом
+    return Decimal(value) if isinstance(value, str) else value
+
+
+class CachedValuation:
+    """Оценка портфеля из кэша с тем же интерфейсом, что у PortfolioValuation в сериализаторах"""
+
+    def __init__(self, currency, summary, packets):
+        self.currency = currency
+        self.initial_value = _decimal(summary["initialValue"])
+        self.current_value = _decimal(summary["currentValue"])
+        self.initial_converted_value = _decimal(summary["initialConvertedValue"])
+        self.current_converted_value = _decimal(summary["currentConvertedValue"])
+        self.dynamic = _decimal(summary["dynamic"])
+        self.converted_dynamic = _decimal(summary["convertedDynamic"])
+        self._packets = {
+            int(packet_id): {field: _decimal(value) for field, value in fields.items()}
+            for packet_id, fields in packets.items()
+        }
+
+    def __contains__(self, packet_id):
+        return packet_id in self._packets
+
+    def packet(self, packet_id):
+        return self._packets[packet_id]
+
+
+def get_portfolio_valuations(portfolios, currency, packets=None):
+    """
+    Оценки портфелей в валюте currency на сегодня: из кэша одним запросом, недостающие — одним
+    векторным расчётом с сохранением в кэш.
+
+    Оценка в кэше помечена valuationVersion портфеля, загруженного до его пакетов, и читается только
+    при совпадении с версией портфеля: оценка по пакетам, прочитанным до правки, записанная уже после
+    сброса кэша (invalidate_portfolios), не читается.
+
+    Оценки в кэше помечены отметкой рыночных данных и читаются только при совпадении с текущей, поэтому
+    оценку, посчитанную другим процессом по старым ценам, сменит первый же расчёт по новым. Когда отметка
+    меняется, движки цен обновляются до расчёта, не дожидаясь RATE_ENGINE_REFRESH_SECONDS. Оценка
+    не сохраняется, если во время расчёта сменилась версия рыночных данных.
+
+    Args:
+        portfolios: Портфели, загруженные до пакетов
+        currency: ISO код валюты оценки
+        packets: Пакеты этих портфелей, загруженные после них; None — загрузить для недостающих
+
+    Returns:
+        dict: {id портфеля: CachedValuation или PortfolioValuation}
+    """
+    today = datetime.date.today()
+    versions = _versions(portfolios)
+    valuations = {
+        row.portfolioId_id: CachedValuation(currency, row.summary, row.packets)
+        for row in _cached_rows(versions, currency, today, get_data_marker())
+        if row.portfolioVersion == versions[row.portfolioId_id]
+    }
+    missing = {portfolio_id: version for portfolio_id, version in versions.items() if portfolio_id not in valuations}
+    if missing:
+        valuations.update(_calculate(missing, currency, today, packets))
+    return valuations
+
+
+async def aget_portfolio_valuations(portfolios, currency, packets=None):
+    """get_portfolio_valuations для async-кода: кэш читается через async ORM, недостающие оценки считаются в потоке"""
+    today = datetime.date.today()
+    versions = _versions(portfolios)
+    valuations = {
+        row.portfolioId_id: CachedValuation(currency, row.summary, row.packets)
+        async for row in _cached_rows(versions, currency, today, await aget_data_marker())
+        if row.portfolioVersion == versions[row.portfolioId_id]
+    }
+    missing = {portfolio_id: version for portfolio_id, version in versions.items() if portfolio_id not in valuations}
+    if missing:
+        valuations.update(await sync_to_async(_calculate)(missing, currency, today, packets))
+    return valuations
+
+
+def _versions(portfolios):
+    return {portfolio.id: portfolio.valuationVersion for portfolio in portfolios}
+
+
+def _cached_rows(portfolio_ids, currency, today, marker):
+    return PortfolioValuationCache.objects.filter(portfolioId__in=list(portfolio_ids), currency=currency,
+                                                  asOfDate=today, dataMarker=marker)
+
+
+_engines_lock = threading.Lock()
+_engines_marker = None
+
+
+def _refresh_engines(marker):
+    """Обновляет движки цен при смене отметки данных, чтобы оценка с этой отметкой не была посчитана по старым ценам"""
+    global _engines_marker
+
+    with _engines_lock:
+        if marker != _engines_marker:
+            price_history.refresh()
+            rate_engine.refresh()
+            _engines_marker = marker
+
+
+def _calculate(missing, currency, today, packets):
+    """missing: {id портфеля: valuationVersion}"""
+    version = get_data_version()
+    marker = get_data_marker()
+    _refresh_engines(marker)
+    if packets is None:
+        packets = IndexPacket.objects.filter(portfolioId__in=list(missing)).select_related("indexId").order_by("id")
+    else:
+        missing_ids = set(missing)
+        packets = [packet for packet in packets if packet.portfolioId_id in missing_ids]
+    calculated = value_portfolios(list(missing), packets, currency=currency, date=today)
+
+    # Неизвестная валюта оценивается нулями — её не кэшируем
+    if currency_registry.find(currency) is not None and get_data_version() == version:
+        PortfolioValuationCache.objects.filter(portfolioId__in=list(missing), currency=currency,
+                                               asOfDate__lt=today).delete()
+        PortfolioValuationCache.objects.bulk_create(
+            [
+                PortfolioValuationCache(
+                    portfolioId_id=portfolio_id,
+                    currency=currency,
+                    asOfDate=today,
+                    summary=valuation.summary(),
+                    packets=valuation.packets(),
+                    dataMarker=marker,
+                    portfolioVersion=missing[portfolio_id],
+                )
+                for portfolio_id, valuation in calculated.items()
+            ],
+            update_conflicts=True,
+            unique_fields=["portfolioId", "currency", "asOfDate"],
+            update_fields=["summary", "packets", "dataMarker", "portfolioVersion", "calculatedAt"],
+        )
+    return calculated
+
+
+def invalidate_portfolios(portfolio_ids):
+    """
+    Сбрасывает кэш оценок портфелей после изменения их пакетов. Версия портфеля повышается до удаления:
+    оценку, которую параллельный расчёт по старым пакетам запишет позже, чтение не примет.
+    """
+    Portfolio.objects.filter(id__in=portfolio_ids).update(valuationVersion=F("valuationVersion") + 1)
+    PortfolioValuationCache.objects.filter(portfolioId__in=portfolio_ids).delete()
+
+
+def invalidate_holdings(index_ids=(), currency_ids=()):
+    """
+    Сбрасывает кэш оценок, на которые влияют новые фиксинги.
+
+    Фиксинги бумаги меняют портфели, где она есть; курсы валюты — портфели с бумагами в этой
+    валюте и все оценки в этой валюте.
+    """
+    index_ids, currency_ids = list(index_ids), list(currency_ids)
+    if not index_ids and not currency_ids:
+        return
+
+    holders = IndexPacket.objects.filter(
+        Q(indexId__in=index_ids) | Q(indexId__ccyId__in=currency_ids)
+    ).values("portfolioId")
+    codes = [code for code in map(currency_registry.code, currency_ids) if code]
+    PortfolioValuationCache.objects.filter(Q(portfolioId__in=holders) | Q(currency__in=codes)).delete()
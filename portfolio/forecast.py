@@ -0,0 +1,87 @@
+import numpy as np
+
+from .returns import get_returns_panel
+
+PERCENTILES = (5, 25, 50, 75, 95)
+
+DEFAULT_PATHS = 10000
+DEFAULT_LOOKBACK = 365
+MAX_PATHS = 100000
+MAX_LOOKBACK = 3650
+MAX_DAYS = 3650
+
+
+class PortfolioForecast:
+    """Распределение стоимости портфеля через days дней по paths смоделированным траекториям"""
+
+    def __init__(self, current_value, expected_value, percentiles, loss_probability, paths, lookback, days):
+        self.current_value = current_value
+        self.expected_value = expected_value
+        self.percentiles = percentiles
+        self.loss_probability = loss_probability
+        self.paths = paths
+        self.lookback = lookback
+        self.days = days
+
+
+def _factor(covariance):
+    """Матрица A с A @ A.T = covariance; через собственные числа, так что вырожденная ковариация допустима"""
+    eigenvalues, eigenvectors = np.linalg.eigh(covariance)
+    return eigenvectors * np.sqrt(np.clip(eigenvalues, 0.0, None))
+
+
+def simulate_portfolio(packets, currency="USD", days=30, paths=DEFAULT_PATHS, lookback=DEFAULT_LOOKBACK, date=None,
+                       percentiles=PERCENTILES, seed=None):
+    """
+    Прогноз стоимости портфеля методом Монте-Карло.
+
+    Снос и ковариация дневных лог-доходностей держимых бумаг оцениваются по панели доходностей
+    за lookback дней до даты оценки (см. portfolio.returns; цены протягиваются на выходные). Приращения
+    независимы и нормальны, поэтому сумма за days дней нормальна с параметрами days·μ и days·Σ:
+    коррелированные траектории разыгрываются сразу на горизонте одним умножением матриц
+    (paths × бумаги) без пошагового моделирования.
+
+    Args:
+        packets: Пакеты с загруженными indexId
+        currency: Валюта стоимости
+        days: Горизонт прогноза в днях
+        paths: Количество траекторий
+        lookback: Глубина истории для оценки параметров в днях
+        date: Дата оценки; None — сегодня
+        seed: Зерно генератора для воспроизводимого результата
+
+    Returns:
+        PortfolioForecast
+    """
+    packets = list(packets)
+    if not packets:
+        return PortfolioForecast(0.0, 0.0, {p: 0.0 for p in percentiles}, 0.0, paths, lookback, days)
+
+    index_ids, columns = np.unique([packet.indexId_id for packet in packets], return_inverse=True)
+    quantities = np.bincount(
+        columns, weights=np.array([packet.quantity for packet in packets], dtype=np.float64),
+        minlength=len(index_ids),
+    )
+
+    panel = get_returns_panel(index_ids, currency=currency, lookback=lookback, date=date)
+    positions = quantities * panel.prices[-1]
+    current_value = float(positions.sum())
+
+    returns = panel.returns
+    drift = returns.mean(axis=0)
+    covariance = np.atleast_2d(np.cov(returns, rowvar=False))
+
+    rng = np.random.default_rng(seed)
+    shocks = rng.standard_normal((paths, len(index_ids)))
+    horizon_returns = days * drift + np.sqrt(days) * (shocks @ _factor(covariance).T)
+    values = np.exp(horizon_returns) @ positions
+
+    return PortfolioForecast(
+        current_value=current_value,
+        expected_value=float(values.mean()),
+        percentiles=dict(zip(percentiles, np.percentile(values, percentiles).tolist())),
+        loss_probability=float((values < current_value).mean()),
+        paths=paths,
+        lookback=lookback,
+        days=days,
+    )
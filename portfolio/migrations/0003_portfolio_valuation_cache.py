@@ -0,0 +1,32 @@
+# Generated by Django 5.2 on 2026-10-18 10:23
+
+import django.core.serializers.json
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('portfolio', '0002_remove_indexpacket_initialprice'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PortfolioValuationCache',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('currency', models.CharField(max_length=50, verbose_name='Валюта оценки')),
+                ('asOfDate', models.DateField(verbose_name='Дата оценки')),
+                ('summary', models.JSONField(encoder=django.core.serializers.json.DjangoJSONEncoder, verbose_name='Стоимости и динамика портфеля')),
+                ('packets', models.JSONField(encoder=django.core.serializers.json.DjangoJSONEncoder, verbose_name='Цены и динамика пакетов')),
+                ('calculatedAt', models.DateTimeField(auto_now=True, verbose_name='Рассчитана')),
+                ('portfolioId', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='valuationCache', to='portfolio.portfolio', verbose_name='Портфель')),
+            ],
+            options={
+                'verbose_name': 'Оценка портфеля',
+                'verbose_name_plural': 'Оценки портфелей',
+                'constraints': [models.UniqueConstraint(fields=('portfolioId', 'currency', 'asOfDate'), name='unique_portfolio_valuation')],
+            },
+        ),
+    ]
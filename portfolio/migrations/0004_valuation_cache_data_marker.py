@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2026-10-18 11:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('portfolio', '0003_portfolio_valuation_cache'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='portfoliovaluationcache',
+            name='dataMarker',
+            field=models.BigIntegerField(default=0, verbose_name='Отметка рыночных данных'),
+        ),
+    ]
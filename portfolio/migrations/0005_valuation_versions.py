@@ -0,0 +1,23 @@
+# Generated by Django 5.2 on 2026-10-18 11:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('portfolio', '0004_valuation_cache_data_marker'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='portfolio',
+            name='valuationVersion',
+            field=models.PositiveBigIntegerField(default=0, editable=False, verbose_name='Версия пакетов для кэша оценок'),
+        ),
+        migrations.AddField(
+            model_name='portfoliovaluationcache',
+            name='portfolioVersion',
+            field=models.PositiveBigIntegerField(default=0, verbose_name='Версия пакетов портфеля'),
+        ),
+    ]
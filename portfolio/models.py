@@ -1,16 +1,21 @@
 import datetime
 
 from _decimal import Decimal
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db import models
 from django.utils import timezone
 
 from authentication.models import User
 from fixings.models import Index
+from .valuation import value_packets
 
 
 class Portfolio(models.Model):
     userId = models.ForeignKey(User, verbose_name="Владелец портфеля", on_delete=models.PROTECT)
     name = models.CharField(max_length=255, verbose_name="Название портфеля")
+    valuationVersion = models.PositiveBigIntegerField(
+        verbose_name="Версия пакетов для кэша оценок", default=0, editable=False
+    )
 
     class Meta:
         verbose_name = "Портфель акций"
@@ -19,35 +24,30 @@ class Portfolio(models.Model):
     def __str__(self):
         return f"{self.name} ({self.userId.username})"
 
+    def get_packets(self):
+        """Пакеты с бумагами и валютами; использует prefetch_related, если он был"""
+        if "packets" in getattr(self, "_prefetched_objects_cache", {}):
+            return self.packets.all()
+        return self.packets.select_related('indexId').order_by('id')
+
+    def get_valuation(self, currency=None, date=None, days=30):
+        """Оценка всех пакетов портфеля одним проходом, см. portfolio.valuation"""
+        return value_packets(self.get_packets(), currency=currency, date=date, days=days)
+
     def get_initial_value(self, currency=None):
-        return sum(
-            packet.get_initial_value(currency)
-            for packet in self.packets.select_related('indexId__ccyId').all()
-        )
+        return self.get_valuation(currency).initial_converted_value
 
     def get_current_value(self, currency=None):
-        return sum(
-            packet.get_value(currency=currency)
-            for packet in self.packets.select_related('indexId__ccyId').all()
-        )
+        return self.get_valuation(currency).current_converted_value
 
     def get_value(self, currency="USD", date=None):
         if date is None:
             date = datetime.date.today()
 
-        return sum(
-            packet.get_value(currency=currency, date=date)
-            for packet in self.packets.select_related('indexId__ccyId').all()
-        )
+        return self.get_valuation(currency, date=date).current_converted_value
 
     def get_dynamic_from_buy_date(self, currency=None):
-        initial = self.get_initial_value(currency=currency)
-        current = self.get_current_value(currency=currency)
-
-        if initial == 0:
-            return Decimal('0.0')
-
-        return ((current - initial) / initial) * 100
+        return self.get_valuation(currency).converted_dynamic
 
     def get_predicted_value(self, currency=None, days=30):
         """
@@ -61,10 +61,7 @@ class Portfolio(models.Model):
         Returns:
             Decimal: Предполагаемая стоимость портфеля
         """
-        return sum(
-            packet.get_predicted_value(currency=currency, days=days)
-            for packet in self.packets.select_related('indexId__ccyId').all()
-        )
+        return self.get_valuation(currency, days=days).predicted_value
 
 
 class IndexPacket(models.Model):
@@ -124,3 +121,35 @@ class IndexPacket(models.Model):
         # Рассчитываем предполагаемую стоимость на основе текущей динамики
         predicted_change = current_value * (dynamic / 100)
         return current_value + predicted_change
+
+
+class PortfolioValuationCache(models.Model):
+    """
+    Сохранённая оценка портфеля в валюте на дату, см. portfolio.caching.
+
+    Decimal хранятся в JSON строками, поэтому значения из кэша совпадают с рассчитанными до знака.
+    dataMarker — отметка рыночных данных (fixings.caching.get_data_marker), по которым посчитана оценка,
+    portfolioVersion — Portfolio.valuationVersion её пакетов: строки с другой отметкой или версией не читаются.
+    """
+    portfolioId = models.ForeignKey(
+        Portfolio, verbose_name="Портфель", related_name="valuationCache", on_delete=models.CASCADE
+    )
+    currency = models.CharField(verbose_name="Валюта оценки", max_length=50)
+    asOfDate = models.DateField(verbose_name="Дата оценки")
+    summary = models.JSONField(verbose_name="Стоимости и динамика портфеля", encoder=DjangoJSONEncoder)
+    packets = models.JSONField(verbose_name="Цены и динамика пакетов", encoder=DjangoJSONEncoder)
+    dataMarker = models.BigIntegerField(verbose_name="Отметка рыночных данных", default=0)
+    portfolioVersion = models.PositiveBigIntegerField(verbose_name="Версия пакетов портфеля", default=0)
+    calculatedAt = models.DateTimeField(verbose_name="Рассчитана", auto_now=True)
+
+    class Meta:
+        verbose_name = "Оценка портфеля"
+        verbose_name_plural = "Оценки портфелей"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["portfolioId", "currency", "asOfDate"], name="unique_portfolio_valuation"
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.portfolioId_id}_{self.currency}_{self.asOfDate}"
@@ -0,0 +1,70 @@
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from fixings.caching import get_data_version
+from fixings.panels import log_returns, price_matrix
+from fixings.rates import to_ordinal
+
+# Сколько последних панелей держать в памяти процесса
+CACHE_SIZE = 64
+
+_lock = threading.Lock()
+_panels = OrderedDict()
+
+
+class ReturnsPanel:
+    """
+    Цены бумаг в валюте на каждый календарный день и дневные лог-доходности между ними.
+
+    Столбцы идут в порядке возрастания index_ids; строка доходностей i — переход от дня i к дню i + 1.
+    Массивы общие для всех запросов и доступны только для чтения.
+    """
+
+    def __init__(self, index_ids, ordinals, prices):
+        self.index_ids = index_ids
+        self.ordinals = ordinals
+        self.prices = prices
+        self.returns = log_returns(prices)
+        for array in (self.index_ids, self.ordinals, self.prices, self.returns):
+            array.flags.writeable = False
+
+    def columns(self, index_ids):
+        """Позиции столбцов бумаг index_ids"""
+        return np.searchsorted(self.index_ids, index_ids)
+
+    def trading_days(self, columns):
+        """Строки доходностей, где у какой-либо из бумаг columns был новый фиксинг (без выходных и праздников)"""
+        return np.any(self.returns[:, columns] != 0, axis=1)
+
+
+def get_returns_panel(index_ids, currency="USD", lookback=365, date=None):
+    """
+    Панель цен и доходностей бумаг за lookback дней до даты date включительно.
+
+    Панели кэшируются в памяти процесса по (бумаги, валюта, глубина, дата, версия данных), поэтому
+    повторные расчёты рисков и прогнозов не читают историю цен заново; загрузка фиксингов меняет
+    версию данных, и старые панели больше не используются.
+
+    Returns:
+        ReturnsPanel
+    """
+    index_ids = np.unique(np.asarray(index_ids, dtype=np.int64))
+    end = to_ordinal(date)
+    key = (tuple(index_ids.tolist()), currency, lookback, end, get_data_version())
+
+    with _lock:
+        panel = _panels.get(key)
+        if panel is not None:
+            _panels.move_to_end(key)
+            return panel
+
+    ordinals = np.arange(end - lookback, end + 1, dtype=np.int64)
+    panel = ReturnsPanel(index_ids, ordinals, price_matrix(index_ids, ordinals, currency))
+
+    with _lock:
+        _panels[key] = panel
+        while len(_panels) > CACHE_SIZE:
+            _panels.popitem(last=False)
+    return panel
@@ -0,0 +1,161 @@
+from statistics import NormalDist
+
+import numpy as np
+
+from .returns import get_returns_panel
+
+# Торговых дней в году для годовой волатильности
+TRADING_DAYS = 252
+
+DEFAULT_CONFIDENCE = 0.95
+
+
+class HoldingRisk:
+    """Вклад бумаги в риск портфеля; доли и волатильности — в процентах"""
+
+    def __init__(self, index, value, weight, volatility, contribution, share):
+        self.index = index
+        self.value = value
+        self.weight = weight
+        self.volatility = volatility
+        self.contribution = contribution
+        self.share = share
+
+
+class PortfolioRisk:
+    """
+    Риск-метрики портфеля по дневным доходностям его текущего состава.
+
+    Волатильность годовая; VaR и CVaR — дневной убыток при уровне доверия confidence;
+    все величины, кроме beta и observations, — в процентах от текущей стоимости.
+    """
+
+    def __init__(self, current_value, observations, volatility, historical_var, historical_cvar, parametric_var,
+                 parametric_cvar, max_drawdown, beta, holdings):
+        self.current_value = current_value
+        self.observations = observations
+        self.volatility = volatility
+        self.historical_var = historical_var
+        self.historical_cvar = historical_cvar
+        self.parametric_var = parametric_var
+        self.parametric_cvar = parametric_cvar
+        self.max_drawdown = max_drawdown
+        self.beta = beta
+        self.holdings = holdings
+
+
+def _max_drawdown(values):
+    """Наибольшее падение стоимости от предыдущего максимума, доля"""
+    values = values[values > 0]
+    if not len(values):
+        return 0.0
+    return float(np.max(1 - values / np.maximum.accumulate(values)))
+
+
+def portfolio_risk(packets, currency="USD", lookback=365, confidence=DEFAULT_CONFIDENCE, benchmark=None, date=None):
+    """
+    Риск портфеля по панели доходностей держимых бумаг (см. portfolio.returns).
+
+    Состав портфеля считается постоянным: веса бумаг берутся по текущей стоимости, доходность
+    портфеля за день — взвешенная сумма простых доходностей бумаг. Дни без новых фиксингов
+    (выходные, праздники) пропускаются.
+
+    Args:
+        packets: Пакеты с загруженными indexId
+        currency: Валюта стоимости
+        lookback: Глубина истории в днях
+        confidence: Уровень доверия VaR и CVaR
+        benchmark: id бумаги для расчёта beta; None — без beta
+        date: Дата оценки; None — сегодня
+
+    Returns:
+        PortfolioRisk
+    """
+    packets = list(packets)
+    if not packets:
+        return PortfolioRisk(0.0, 0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, None, [])
+
+    indexes = {packet.indexId_id: packet.indexId for packet in packets}
+    index_ids, positions_of = np.unique([packet.indexId_id for packet in packets], return_inverse=True)
+    quantities = np.bincount(
+        positions_of, weights=np.array([packet.quantity for packet in packets], dtype=np.float64),
+        minlength=len(index_ids),
+    )
+
+    panel_ids = index_ids if benchmark is None else np.union1d(index_ids, [benchmark])
+    panel = get_returns_panel(panel_ids, currency=currency, lookback=lookback, date=date)
+    columns = panel.columns(index_ids)
+
+    prices = panel.prices[:, columns]
+    values = quantities * prices[-1]
+    current_value = float(values.sum())
+    weights = values / current_value if current_value else np.zeros(len(values))
+
+    rows = panel.trading_days(columns)
+    returns = np.expm1(panel.returns[rows][:, columns])
+    portfolio_returns = returns @ weights
+    observations = len(portfolio_returns)
+
+    max_drawdown = _max_drawdown(prices @ quantities) * 100
+    if observations < 2:
+        holdings = [
+            HoldingRisk(indexes[index_id], float(value), float(weight) * 100, 0.0, 0.0, 0.0)
+            for index_id, value, weight in zip(index_ids.tolist(), values, weights)
+        ]
+        return PortfolioRisk(current_value, observations, 0.0, 0.0, 0.0, 0.0, 0.0, max_drawdown, None, holdings)
+
+    mean = portfolio_returns.mean()
+    deviation = portfolio_returns.std(ddof=1)
+    annual = np.sqrt(TRADING_DAYS)
+
+    # Исторические VaR и CVaR — по квантилю фактических доходностей
+    quantile = np.quantile(portfolio_returns, 1 - confidence)
+    historical_var = -quantile
+    historical_cvar = -portfolio_returns[portfolio_returns <= quantile].mean()
+
+    # Параметрические — по нормальному распределению с выборочными средним и отклонением
+    z = NormalDist().inv_cdf(1 - confidence)
+    parametric_var = -(mean + z * deviation)
+    parametric_cvar = -(mean - deviation * NormalDist().pdf(z) / (1 - confidence))
+
+    # Вклад бумаги в волатильность: w_i·(Σw)_i / σ; вклады в сумме дают σ портфеля
+    covariance = np.atleast_2d(np.cov(returns, rowvar=False))
+    if deviation > 0:
+        contributions = weights * (covariance @ weights) / deviation
+    else:
+        contributions = np.zeros(len(weights))
+    shares = contributions / deviation if deviation > 0 else contributions
+
+    beta = None
+    if benchmark is not None:
+        benchmark_returns = np.expm1(panel.returns[rows, panel.columns([benchmark])[0]])
+        benchmark_variance = benchmark_returns.var(ddof=1)
+        if benchmark_variance > 0:
+            beta = float(np.cov(portfolio_returns, benchmark_returns)[0, 1] / benchmark_variance)
+
+    holdings = [
+        HoldingRisk(
+            index=indexes[index_id],
+            value=float(value),
+            weight=float(weight) * 100,
+            volatility=float(np.sqrt(variance) * annual) * 100,
+            contribution=float(contribution * annual) * 100,
+            share=float(share) * 100,
+        )
+        for index_id, value, weight, variance, contribution, share in zip(
+            index_ids.tolist(), values, weights, np.diag(covariance), contributions, shares
+        )
+    ]
+
+    return PortfolioRisk(
+        current_value=current_value,
+        observations=observations,
+        volatility=float(deviation * annual) * 100,
+        historical_var=float(historical_var) * 100,
+        historical_cvar=float(historical_cvar) * 100,
+        parametric_var=float(parametric_var) * 100,
+        parametric_cvar=float(parametric_cvar) * 100,
+        max_drawdown=max_drawdown,
+        beta=beta,
+        holdings=holdings,
+    )
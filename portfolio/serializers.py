@@ -2,9 +2,23 @@
 
 from rest_framework import serializers
 
-from fixings.models import Currency
+from fixings.registry import currency_registry
 from fixings.serializers import GetIndexesSerializer, CurrencySerializer
+from market_vision_backend.metrics import profiled_fields
+from .caching import get_portfolio_valuations
 from .models import Portfolio, IndexPacket
+from .valuation import value_packets
+
+
+def get_portfolio_valuation(serializer, portfolio):
+    """Оценка портфеля в валюте контекста из кэша оценок, полученная один раз на всю сериализацию"""
+    currency = serializer.context.get("currency", "USD")
+    valuations = serializer.context.setdefault("valuations", {})
+    key = (portfolio.id, currency)
+    if key not in valuations:
+        packets = portfolio.get_packets()
+        valuations[key] = get_portfolio_valuations([portfolio], currency, packets=packets)[portfolio.id]
+    return valuations[key]
 
 
 class PortfolioListSerializer(serializers.ModelSerializer):
@@ -16,14 +30,13 @@ class PortfolioListSerializer(serializers.ModelSerializer):
         fields = ["id", "name", "currentValue", "dynamic"]
 
     def get_currentValue(self, obj):
-        currency = self.context.get("currency", "USD")
-        return obj.get_current_value(currency=currency)
+        return get_portfolio_valuation(self, obj).current_converted_value
 
     def get_dynamic(self, obj):
-        currency = self.context.get("currency", "USD")
-        return obj.get_dynamic_from_buy_date(currency=currency)
+        return get_portfolio_valuation(self, obj).converted_dynamic
 
 
+@profiled_fields
 class IndexPacketDetailSerializer(serializers.ModelSerializer):
     index = GetIndexesSerializer(source="indexId")
     currency = serializers.SerializerMethodField()
@@ -43,30 +56,40 @@ class IndexPacketDetailSerializer(serializers.ModelSerializer):
         ]
 
     def get_currency(self, obj):
-        return CurrencySerializer(obj.indexId.ccyId).data
+        return CurrencySerializer(currency_registry.by_id(obj.indexId.ccyId_id)).data
+
+    def _get_valuation(self, obj):
+        currency = self.context.get("currency", "USD")
+        valuations = self.context.setdefault("valuations", {})
+        valuation = valuations.get((obj.portfolioId_id, currency))
+        if valuation is None or obj.id not in valuation:
+            # Пакет сериализуется без портфеля: оцениваем его отдельно
+            key = ("packet", obj.id, currency)
+            if key not in valuations:
+                valuations[key] = value_packets([obj], currency=currency)
+            valuation = valuations[key]
+        return valuation.packet(obj.id)
 
     def get_initialPrice(self, obj):
-        return obj.indexId.get_price(date=obj.buyDate)
+        return self._get_valuation(obj)["initialPrice"]
 
     def get_currentPrice(self, obj):
-        return obj.indexId.get_price()
+        return self._get_valuation(obj)["currentPrice"]
 
     def get_dynamicFromBuyDate(self, obj):
-        return obj.get_dynamic_from_buy_date()
+        return self._get_valuation(obj)["dynamicFromBuyDate"]
 
     def get_initialConvertedPrice(self, obj):
-        currency = self.context.get("currency", "USD")
-        return obj.get_value(currency=currency, date=obj.buyDate)
+        return self._get_valuation(obj)["initialConvertedPrice"]
 
     def get_currentConvertedPrice(self, obj):
-        currency = self.context.get("currency", "USD")
-        return obj.get_value(currency=currency)
+        return self._get_valuation(obj)["currentConvertedPrice"]
 
     def get_convertedDynamicFromBuyDate(self, obj):
-        currency = self.context.get("currency", "USD")
-        return obj.get_dynamic_from_buy_date(currency=currency)
+        return self._get_valuation(obj)["convertedDynamicFromBuyDate"]
 
 
+@profiled_fields
 class PortfolioCardSerializer(serializers.ModelSerializer):
     currentValue = serializers.SerializerMethodField()
     packets = IndexPacketDetailSerializer(many=True, source="packets.all")
@@ -80,15 +103,13 @@ class PortfolioCardSerializer(serializers.ModelSerializer):
                   "currency"]
 
     def get_currentValue(self, obj):
-        currency = self.context.get("currency", "USD")
-        return obj.get_current_value(currency=currency)
+        return get_portfolio_valuation(self, obj).current_converted_value
 
     def get_dynamicFromBuyDate(self, obj):
-        return obj.get_dynamic_from_buy_date()
+        return get_portfolio_valuation(self, obj).dynamic
 
     def get_convertedDynamicFromBuyDate(self, obj):
-        currency = self.context.get("currency", "USD")
-        return obj.get_dynamic_from_buy_date(currency=currency)
+        return get_portfolio_valuation(self, obj).converted_dynamic
 
     def get_currency(self, obj):
-        return CurrencySerializer(Currency.objects.get(currency=self.context.get("currency", "USD"))).data
+        return CurrencySerializer(currency_registry.get(self.context.get("currency", "USD"))).data
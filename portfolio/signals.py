@@ -0,0 +1,36 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from fixings.models import Currency, CurrencyUSDFixing, Fixing, Index
+from fixings.signals import fixings_loaded
+from .caching import invalidate_holdings, invalidate_portfolios
+from .models import IndexPacket, Portfolio
+
+
+@receiver([post_save, post_delete], sender=IndexPacket)
+def invalidate_packet_portfolio(sender, instance, origin=None, **kwargs):
+    """Добавление, изменение и удаление пакета сбрасывают оценки портфеля"""
+    if isinstance(origin, Portfolio):
+        # Удаление портфеля: его оценки удаляются каскадно, без запроса на каждый пакет
+        return
+    invalidate_portfolios([instance.portfolioId_id])
+
+
+@receiver([post_save, post_delete], sender=Fixing)
+@receiver([post_save, post_delete], sender=Index)
+def invalidate_index_holders(sender, instance, **kwargs):
+    """Правки фиксингов и бумаг сбрасывают оценки портфелей с этой бумагой"""
+    invalidate_holdings(index_ids=[instance.indexId_id if sender is Fixing else instance.id])
+
+
+@receiver([post_save, post_delete], sender=CurrencyUSDFixing)
+@receiver([post_save, post_delete], sender=Currency)
+def invalidate_currency_holders(sender, instance, **kwargs):
+    """Правки курсов и валют сбрасывают оценки с этой валютой"""
+    invalidate_holdings(currency_ids=[instance.currencyId_id if sender is CurrencyUSDFixing else instance.id])
+
+
+@receiver(fixings_loaded)
+def invalidate_loaded_holders(sender, index_ids, currency_ids, **kwargs):
+    """Пакетная загрузка фиксингов сбрасывает оценки затронутых портфелей"""
+    invalidate_holdings(index_ids=index_ids, currency_ids=currency_ids)
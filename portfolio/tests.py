@@ -1,3 +1,411 @@
-from django.test import TestCase
+import datetime
+import os
+import tempfile
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+
+from asgiref.sync import async_to_sync
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import F
+from django.test import AsyncClient, RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from authentication.models import User
+from market_vision_backend.benchmarks import generate_dataset, get_endpoints, load_baseline, run_benchmark
+from market_vision_backend.metrics import MetricsRegistry, RequestProfile, metrics, start_profile, stop_profile
+from fixings.history import price_history
+from fixings.ingestion import ingest_fixings
+from fixings.models import Currency, CurrencyUSDFixing, Fixing, Index, MarketDataState
+from fixings.providers import MarketDataProvider
+from fixings.rates import rate_engine
+from fixings.registry import currency_registry
+from fixings.state import STATE_ID, update_market_data_state
+from .async_views import AsyncPortfolioCardView, AsyncPortfolioListView
+from .caching import get_portfolio_valuations
+from .models import Portfolio, IndexPacket, PortfolioValuationCache
+from .valuation import MAX_HISTORY_POINTS, history_points, value_history
+
+
+class StubProvider(MarketDataProvider):
+    """Одна цена закрытия на end_date - 1 для каждого тикера"""
+
+    def fetch_closes(self, ticker, start_date, end_date):
+        date = np.datetime64(end_date - datetime.timedelta(days=1), "D")
+        return np.array([date]), np.array([500.0])
+
+
+class PortfolioTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        rate_engine.invalidate()
+        price_history.invalidate()
+        currency_registry.invalidate()
+
+        self.user = User.objects.create_user(email="list@example.com", password="password")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+        usd = Currency.objects.create(currency="USD", symbol="$", ticker="USDUSD=X")
+        eur = Currency.objects.create(currency="EUR", symbol="€", ticker="EURUSD=X")
+        self.start = datetime.date.today() - datetime.timedelta(days=60)
+
+        CurrencyUSDFixing.objects.bulk_create([
+            CurrencyUSDFixing(currencyId=currency, currencyFixingDate=self.start + datetime.timedelta(days=day),
+                              valueUSD=value + day / 100)
+            for currency, value in ((usd, 1), (eur, 1.08))
+            for day in range(61)
+        ])
+
+        self.indexes = [
+            Index.objects.create(indexName=f"Index {i}", ccyId=usd if i % 2 else eur, indexISIN=f"IDX{i}")
+            for i in range(4)
+        ]
+        Fixing.objects.bulk_create([
+            Fixing(indexId=index, currencyId=index.ccyId, fixingDate=self.start + datetime.timedelta(days=day),
+                   value=100 + 10 * i + day)
+            for i, index in enumerate(self.indexes)
+            for day in range(0, 60, 2)
+        ])
+
+    def _create_portfolios(self, portfolios, packets):
+        for p in range(portfolios):
+            portfolio = Portfolio.objects.create(userId=self.user, name=f"Portfolio {p}")
+            IndexPacket.objects.bulk_create([
+                IndexPacket(
+                    portfolioId=portfolio,
+                    indexId=self.indexes[(p + k) % len(self.indexes)],
+                    quantity=k + 1,
+                    buyDate=self.start + datetime.timedelta(days=(p * 7 + k * 3) % 60),
+                )
+                for k in range(packets)
+            ])
+
+    def _expected(self, portfolio_id, currency):
+        """Поштучный расчёт через методы пакетов"""
+        packets = IndexPacket.objects.filter(portfolioId=portfolio_id).order_by("id")
+        initial = sum(packet.get_initial_value(currency) for packet in packets)
+        current = sum(packet.get_value(currency=currency) for packet in packets)
+        dynamic = Decimal('0.0') if initial == 0 else ((current - initial) / initial) * 100
+        return current, dynamic
+
+    def _assert_values(self, response, currency):
+        for item in response.data["portfolios"]:
+            self.assertEqual((item["currentValue"], item["dynamic"]), self._expected(item["id"], currency))
+
+    def _get_list(self, currency):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get("/api/portfolio/list", {"currency": currency})
+        self.assertEqual(response.status_code, 200)
+        return response, len(queries)
+
+
+class PortfolioListViewTests(PortfolioTestCase):
+    def test_query_count_is_constant(self):
+        self._create_portfolios(portfolios=2, packets=3)
+        self._get_list("EUR")
+        _, small = self._get_list("EUR")
+
+        self._create_portfolios(portfolios=10, packets=12)
+        self._get_list("EUR")
+        response, large = self._get_list("EUR")
+
+        self.assertEqual(len(response.data["portfolios"]), 12)
+        self.assertEqual(small, large)
+
+    def test_values_match_portfolio_methods(self):
+        self._create_portfolios(portfolios=3, packets=5)
+        Portfolio.objects.create(userId=self.user, name="Empty")
+
+        for currency in ("USD", "EUR"):
+            # Первый запрос считает оценки, второй читает их из кэша
+            self._assert_values(self._get_list(currency)[0], currency)
+            self._assert_values(self._get_list(currency)[0], currency)
+
+
+class PortfolioValuationCacheTests(PortfolioTestCase):
+    def _cached_portfolios(self, currency="EUR"):
+        return set(PortfolioValuationCache.objects.filter(currency=currency).values_list("portfolioId", flat=True))
+
+    def test_packet_changes_invalidate_portfolio(self):
+        self._create_portfolios(portfolios=3, packets=4)
+        first, second, third = Portfolio.objects.order_by("id")
+        self._get_list("EUR")
+        self.assertEqual(self._cached_portfolios(), {first.id, second.id, third.id})
+
+        response = self.client.post("/api/portfolio/portfolio-card/add-packet", {
+            "portfolio_id": first.id, "index_id": self.indexes[3].id, "quantity": 7,
+            "buy_date": (self.start + datetime.timedelta(days=5)).isoformat(),
+        })
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(self._cached_portfolios(), {second.id, third.id})
+        self._assert_values(self._get_list("EUR")[0], "EUR")
+
+        packet = second.packets.order_by("id").first()
+        response = self.client.delete("/api/portfolio/portfolio-card/delete-packet", {"packet_id": packet.id})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self._cached_portfolios(), {first.id, third.id})
+        self._assert_values(self._get_list("EUR")[0], "EUR")
+
+        response = self.client.delete(f"/api/portfolio/portfolio-card/{third.id}")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self._cached_portfolios(), {first.id, second.id})
+
+    def test_loaded_fixings_invalidate_holders(self):
+        holder = Portfolio.objects.create(userId=self.user, name="Holder")
+        other = Portfolio.objects.create(userId=self.user, name="Other")
+        IndexPacket.objects.create(portfolioId=holder, indexId=self.indexes[0], quantity=3, buyDate=self.start)
+        IndexPacket.objects.create(portfolioId=other, indexId=self.indexes[2], quantity=5, buyDate=self.start)
+        before, _ = self._get_list("USD")
+
+        report = ingest_fixings(
+            tickers=[self.indexes[0].indexISIN], end_date=datetime.date.today(), provider=StubProvider()
+        )
+        self.assertEqual(report.count_indexes, 1)
+        self.assertEqual(self._cached_portfolios("USD"), {other.id})
+
+        after, _ = self._get_list("USD")
+        self._assert_values(after, "USD")
+        values = {item["id"]: item["currentValue"] for item in before.data["portfolios"]}
+        self.assertNotEqual({item["id"]: item["currentValue"] for item in after.data["portfolios"]}, values)
+
+
+    def test_valuation_of_old_packets_is_not_read_after_invalidation(self):
+        portfolio = Portfolio.objects.create(userId=self.user, name="Racing")
+        IndexPacket.objects.create(portfolioId=portfolio, indexId=self.indexes[1], quantity=3, buyDate=self.start)
+        # Параллельный расчёт прочитал портфель и пакеты до добавления пакета
+        loaded = Portfolio.objects.get(id=portfolio.id)
+        old_packets = list(loaded.get_packets())
+
+        IndexPacket.objects.create(portfolioId=portfolio, indexId=self.indexes[3], quantity=2, buyDate=self.start)
+        # ...и записал оценку уже после сброса кэша
+        stale = get_portfolio_valuations([loaded], "USD", packets=old_packets)[portfolio.id]
+        self.assertEqual(self._cached_portfolios("USD"), {portfolio.id})
+
+        response, _ = self._get_list("USD")
+        self._assert_values(response, "USD")
+        self.assertNotEqual(response.data["portfolios"][0]["currentValue"], stale.current_converted_value)
+
+    def test_stale_valuation_of_other_process_is_recalculated(self):
+        holder = Portfolio.objects.create(userId=self.user, name="Holder")
+        IndexPacket.objects.create(portfolioId=holder, indexId=self.indexes[1], quantity=3, buyDate=self.start)
+        update_market_data_state(ingested=True)
+
+        with self.settings(RATE_ENGINE_REFRESH_SECONDS=3600):
+            before, _ = self._get_list("USD")
+            # Загрузка в другом процессе: без сигналов этого процесса, меняется только состояние в базе
+            Fixing.objects.bulk_create([Fixing(indexId=self.indexes[1], currencyId=self.indexes[1].ccyId,
+                                               fixingDate=datetime.date.today(), value=500)])
+            MarketDataState.objects.filter(id=STATE_ID).update(fixingsCount=F("fixingsCount") + 1,
+                                                               updatedAt=F("updatedAt") + datetime.timedelta(seconds=1))
+            self.assertEqual(self._get_list("USD")[0].data, before.data)
+
+            # Отметка данных перечитана, а срок обновления движков цен ещё не вышел
+            with mock.patch("fixings.caching._marker_checked_at", 0.0):
+                after, _ = self._get_list("USD")
+            self.assertEqual(after.data["portfolios"][0]["currentValue"], Decimal(1500))
+            self._assert_values(after, "USD")
+            self.assertEqual(self._get_list("USD")[0].data, after.data)
+
+
+class PortfolioHistoryTests(PortfolioTestCase):
+    def test_history_span_is_limited(self):
+        self._create_portfolios(1, 2)
+        portfolio = Portfolio.objects.get(userId=self.user)
+        path = f"/api/portfolio/portfolio-card/{portfolio.id}/history"
+
+        response = self.client.get(path, {"start_date": "0001-01-01", "interval": "day"})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.client.get(path, {"end_date": "9999-12-31", "interval": "week"}).status_code, 400)
+
+        response = self.client.get(path, {"start_date": "2000-01-01", "interval": "month"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data["history"]), history_points(datetime.date(2000, 1, 1), datetime.date.today(), "month"))
+
+        # Без start_date дневной ряд начинается не раньше, чем позволяет лимит
+        IndexPacket.objects.filter(portfolioId=portfolio).update(buyDate=datetime.date(1990, 1, 1))
+        response = self.client.get(path)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data["history"]), MAX_HISTORY_POINTS)
+
+
+class PortfolioForecastTests(PortfolioTestCase):
+    def _forecast(self, portfolio, **params):
+        return self.client.get(f"/api/portfolio/portfolio-card/{portfolio.id}/prediction", {
+            "method": "montecarlo", "currency": "EUR", **params,
+        })
+
+    def test_montecarlo_percentiles(self):
+        self._create_portfolios(portfolios=1, packets=4)
+        portfolio = Portfolio.objects.get()
+
+        response = self._forecast(portfolio, paths=2000, lookback=60, seed=7)
+        self.assertEqual(response.status_code, 200)
+        values = [item["value"] for item in response.data["percentiles"]]
+        self.assertEqual(values, sorted(values))
+        self.assertAlmostEqual(response.data["current_value"], float(portfolio.get_current_value("EUR")))
+        self.assertEqual(response.data, self._forecast(portfolio, paths=2000, lookback=60, seed=7).data)
+
+    def test_montecarlo_rejects_invalid_parameters(self):
+        portfolio = Portfolio.objects.create(userId=self.user, name="Empty")
+        self.assertEqual(self._forecast(portfolio, paths=10).status_code, 400)
+        self.assertEqual(self._forecast(portfolio, lookback="year").status_code, 400)
+        self.assertEqual(self._forecast(portfolio).status_code, 200)
+
+
+class PortfolioRiskTests(PortfolioTestCase):
+    def test_risk_metrics(self):
+        self._create_portfolios(portfolios=1, packets=4)
+        portfolio = Portfolio.objects.get()
+
+        response = self.client.get(f"/api/portfolio/portfolio-card/{portfolio.id}/risk", {
+            "currency": "EUR", "lookback": 60, "benchmark": self.indexes[0].id,
+        })
+        self.assertEqual(response.status_code, 200)
+        data = response.data
+        self.assertGreater(data["observations"], 2)
+        self.assertGreaterEqual(data["historicalCVaR"], data["historicalVaR"])
+        self.assertGreaterEqual(data["parametricCVaR"], data["parametricVaR"])
+        self.assertIsNotNone(data["beta"])
+        self.assertAlmostEqual(sum(item["volatilityContribution"] for item in data["holdings"]), data["volatility"])
+        self.assertAlmostEqual(sum(item["weight"] for item in data["holdings"]), 100)
+
+        end = datetime.date.today()
+        _, values = value_history(portfolio.get_packets(), end - datetime.timedelta(days=60), end, currency="EUR")
+        values = values[values > 0]
+        self.assertAlmostEqual(data["maxDrawdown"], np.max(1 - values / np.maximum.accumulate(values)) * 100)
+
+
+@override_settings(SERVER_TIMING_ENABLED=True, METRICS_TOKEN="secret", METRICS_DIR=None)
+class RequestMetricsTests(PortfolioTestCase):
+    def test_server_timing_and_metrics(self):
+        self._create_portfolios(portfolios=1, packets=3)
+        portfolio = Portfolio.objects.get()
+        metrics.reset()
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(f"/api/portfolio/portfolio-card/{portfolio.id}", {"currency": "EUR"})
+        self.assertEqual(response.status_code, 200)
+        count = len(queries)
+        timing = response["Server-Timing"]
+        self.assertGreater(count, 0)
+        self.assertRegex(timing, rf'db;dur=[0-9.]+;desc="{count} queries, 0 duplicates"')
+        self.assertIn('PortfolioCardSerializer.currentValue;dur=', timing)
+        self.assertIn('IndexPacketDetailSerializer.initialPrice;dur=', timing)
+        self.assertIn('"3 calls"', timing)
+
+        body = self.client.get("/api/metrics", headers={"Authorization": "Bearer secret"}).content.decode()
+        route = "api/portfolio/portfolio-card/<int:pk>"
+        self.assertIn(f'http_requests_total{{route="{route}",method="GET",status="200"}} 1', body)
+        self.assertIn(f'http_request_db_queries_sum{{route="{route}",method="GET"}} {count}', body)
+        self.assertIn(f'serializer_method_field_calls_total{{route="{route}",'
+                      f'field="IndexPacketDetailSerializer.currentPrice"}} 3', body)
+
+    def test_metrics_require_token_or_staff(self):
+        self.assertEqual(self.client.get("/api/metrics").status_code, 401)
+        self.assertEqual(self.client.get("/api/metrics", headers={"Authorization": "Bearer wrong"}).status_code, 401)
+        with self.settings(METRICS_TOKEN=None):
+            self.assertEqual(self.client.get("/api/metrics", headers={"Authorization": "Bearer "}).status_code, 401)
+            staff = User.objects.create_user(email="staff@example.com", password="password", is_staff=True)
+            client = APIClient()
+            client.force_login(staff)
+            self.assertEqual(client.get("/api/metrics").status_code, 200)
+
+    @override_settings(SERVER_TIMING_ENABLED=False)
+    def test_server_timing_is_off_by_default(self):
+        response = APIClient().get("/api/health/")
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.has_header("Server-Timing"))
+
+    def test_metrics_of_workers_are_summed(self):
+        with tempfile.TemporaryDirectory() as directory, self.settings(METRICS_DIR=directory), \
+                mock.patch.object(MetricsRegistry, "_start_flusher"):
+            metrics.reset()
+            other = MetricsRegistry()
+            # Другой воркер: свой pid и свой файл в общем каталоге, записанный фоновым потоком
+            with mock.patch("os.getpid", return_value=os.getpid() + 1):
+                other.reset()
+                other.record("api/health/", "GET", 200, 0.01, RequestProfile())
+                other.flush()
+            for _ in range(2):
+                self.client.get("/api/health/")
+
+            # Запросы файлы не пишут: свои метрики процесс записывает в фоне или при сборе
+            self.assertEqual(len(os.listdir(directory)), 1)
+            body = self.client.get("/api/metrics", headers={"Authorization": "Bearer secret"}).content.decode()
+            self.assertEqual(len(os.listdir(directory)), 2)
+            self.assertIn('http_requests_total{route="api/health/",method="GET",status="200"} 3', body)
+            self.assertIn('http_request_duration_seconds_count{route="api/health/",method="GET"} 3', body)
+            metrics.reset()
+
+    def test_duplicate_queries(self):
+        portfolio = Portfolio.objects.create(userId=self.user, name="Empty")
+        profile, token = start_profile()
+        try:
+            for _ in range(3):
+                list(Portfolio.objects.filter(id=portfolio.id))
+            list(Portfolio.objects.filter(id=portfolio.id + 1))
+        finally:
+            stop_profile(token)
+        self.assertEqual((profile.query_count, profile.duplicate_count), (4, 2))
+
+
+class AsyncPortfolioViewsTests(PortfolioTestCase):
+    def _async(self, method, view, path, user=None, **kwargs):
+        token = AccessToken.for_user(user or self.user)
+        request = getattr(RequestFactory(), method)(path, {"currency": "EUR"}, HTTP_AUTHORIZATION=f"Bearer {token}")
+        return async_to_sync(view.as_view())(request, **kwargs)
+
+    def test_responses_match_sync_views(self):
+        self._create_portfolios(portfolios=3, packets=4)
+        portfolio = Portfolio.objects.order_by("id").first()
+        card = f"/api/portfolio/portfolio-card/{portfolio.id}"
+
+        # Первый запрос считает оценки и пишет их в кэш, второй читает из кэша
+        for _ in range(2):
+            response = self._async("get", AsyncPortfolioListView, "/api/portfolio/list")
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.content, self.client.get("/api/portfolio/list", {"currency": "EUR"}).content)
+
+        PortfolioValuationCache.objects.all().delete()
+        for _ in range(2):
+            response = self._async("get", AsyncPortfolioCardView, card, pk=portfolio.id)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.content, self.client.get(card, {"currency": "EUR"}).content)
+
+        self.assertEqual(self._async("get", AsyncPortfolioCardView, card, pk=0).status_code, 404)
+
+    def test_delete_portfolio(self):
+        self._create_portfolios(portfolios=1, packets=2)
+        portfolio = Portfolio.objects.get()
+        card = f"/api/portfolio/portfolio-card/{portfolio.id}"
+        stranger = User.objects.create_user(email="stranger@example.com", password="password")
+
+        self.assertEqual(self._async("delete", AsyncPortfolioCardView, card, user=stranger, pk=portfolio.id).status_code, 404)
+        self.assertEqual(self._async("delete", AsyncPortfolioCardView, card, pk=portfolio.id).status_code, 200)
+        self.assertFalse(Portfolio.objects.exists())
+
+    @override_settings(SERVER_TIMING_ENABLED=True)
+    def test_metrics_under_asgi(self):
+        self._create_portfolios(portfolios=1, packets=2)
+        token = AccessToken.for_user(self.user)
+        response = async_to_sync(AsyncClient().get)("/api/portfolio/list", headers={"Authorization": f"Bearer {token}"})
+        self.assertEqual(response.status_code, 200)
+        self.assertRegex(response["Server-Timing"], r'db;dur=[0-9.]+;desc="[1-9][0-9]* queries')
+
+
+class PortfolioEndpointsBenchmarkTests(TestCase):
+    def test_query_counts_match_baseline(self):
+        # См. fixings.tests.FixingsEndpointsBenchmarkTests
+        dataset = generate_dataset(currencies=4, indexes=8, years=1, users=1, portfolios=2, packets=4)
+        endpoints = [endpoint for endpoint in get_endpoints() if endpoint.name.startswith("portfolio:")]
+        baseline = load_baseline()["endpoints"]
+
+        for name, result in run_benchmark(dataset, endpoints, repeat=2).items():
+            with self.subTest(endpoint=name):
+                self.assertLess(result["status"], 400)
+                self.assertEqual(result["queries"], baseline[name]["queries"])
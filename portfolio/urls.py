@@ -1,13 +1,24 @@
+from django.conf import settings
 from django.urls import path
+from .async_views import AsyncPortfolioListView, AsyncPortfolioCardView
 from .views import PortfolioListView, PortfolioCardView, CreatePortfolioView, UpdatePortfolioNameView, \
-    AddPacketToPortfolioView, DeletePacketView, GetPortfolioPredictionView
+    AddPacketToPortfolioView, DeletePacketView, GetPortfolioPredictionView, GetPortfolioHistoryView, \
+    GetPortfolioRiskView
+
+# Под ASGI (см. market_vision_backend.asgi) список и карточку отдают async-представления
+if getattr(settings, "ASYNC_READ_VIEWS", False):
+    list_view, card_view = AsyncPortfolioListView.as_view(), AsyncPortfolioCardView.as_view()
+else:
+    list_view, card_view = PortfolioListView.as_view(), PortfolioCardView.as_view()
 
 urlpatterns = [
-    path('list', PortfolioListView.as_view(), name='portfolio-list'),
-    path("portfolio-card/<int:pk>", PortfolioCardView.as_view(), name="portfolio-card"),
+    path('list', list_view, name='portfolio-list'),
+    path("portfolio-card/<int:pk>", card_view, name="portfolio-card"),
     path("create-portfolio", CreatePortfolioView.as_view(), name="create-portfolio"),
     path("portfolio-card/update/<int:pk>", UpdatePortfolioNameView.as_view(), name="update-portfolio"),
     path("portfolio-card/add-packet", AddPacketToPortfolioView.as_view(), name="add-packet"),
     path("portfolio-card/delete-packet", DeletePacketView.as_view(), name="delete-packet"),
     path("portfolio-card/<int:pk>/prediction", GetPortfolioPredictionView.as_view(), name="portfolio-prediction"),
+    path("portfolio-card/<int:pk>/history", GetPortfolioHistoryView.as_view(), name="portfolio-history"),
+    path("portfolio-card/<int:pk>/risk", GetPortfolioRiskView.as_view(), name="portfolio-risk"),
 ]
@@ -0,0 +1,292 @@
+import datetime
+from decimal import Decimal
+
+import numpy as np
+
+from fixings.history import price_history
+from fixings.models import Fixing
+from fixings.panels import price_matrix
+from fixings.rates import to_ordinal, truthy
+from fixings.registry import currency_registry
+
+INTERVALS = ("day", "week", "month")
+# Не больше десяти лет дневных точек: ряд строит матрицу (точки × пакеты)
+MAX_HISTORY_POINTS = 3660
+
+
+def _dynamics(initial, current):
+    """Поэлементное изменение от initial к current в процентах; при нулевой базе — 0.0"""
+    result = np.full(len(initial), Decimal('0.0'), dtype=object)
+    ok = truthy(initial)
+    result[ok] = ((current[ok] - initial[ok]) / initial[ok]) * 100
+    return result
+
+
+def _total(values):
+    # sum() со стартом 0, как в прежних методах Portfolio
+    return sum(values.tolist())
+
+
+def _dynamic(initial, current):
+    if initial == 0:
+        return Decimal('0.0')
+    return ((current - initial) / initial) * 100
+
+
+class PortfolioValuation:
+    """
+    Оценка пакетов портфеля, рассчитанная одним проходом.
+
+    Массивы выровнены по packet_ids. Цены и стоимости «в собственной валюте» считаются в валюте
+    каждой бумаги, «converted» — в валюте currency (при currency=None совпадают с собственными).
+    Все значения — Decimal, как у методов IndexPacket и Portfolio.
+    """
+
+    def __init__(self, packet_ids, currency, initial_prices, current_prices, initial_values, current_values,
+                 initial_converted_values, current_converted_values, predicted_values):
+        self.packet_ids = packet_ids
+        self.currency = currency
+        self.initial_prices = initial_prices
+        self.current_prices = current_prices
+        self.initial_values = initial_values
+        self.current_values = current_values
+        self.initial_converted_values = initial_converted_values
+        self.current_converted_values = current_converted_values
+        self.predicted_values = predicted_values
+        self.dynamics = _dynamics(initial_values, current_values)
+        self.converted_dynamics = _dynamics(initial_converted_values, current_converted_values)
+        self._positions = {packet_id: position for position, packet_id in enumerate(packet_ids)}
+
+    def __contains__(self, packet_id):
+        return packet_id in self._positions
+
+    @property
+    def initial_value(self):
+        return _total(self.initial_values)
+
+    @property
+    def current_value(self):
+        return _total(self.current_values)
+
+    @property
+    def initial_converted_value(self):
+        return _total(self.initial_converted_values)
+
+    @property
+    def current_converted_value(self):
+        return _total(self.current_converted_values)
+
+    @property
+    def predicted_value(self):
+        return _total(self.predicted_values)
+
+    @property
+    def dynamic(self):
+        """Динамика с даты покупки по сумме стоимостей в собственных валютах бумаг"""
+        return _dynamic(self.initial_value, self.current_value)
+
+    @property
+    def converted_dynamic(self):
+        return _dynamic(self.initial_converted_value, self.current_converted_value)
+
+    def summary(self):
+        """Итоги портфеля для сохранения в кэше оценок"""
+        return {
+            "initialValue": self.initial_value,
+            "currentValue": self.current_value,
+            "initialConvertedValue": self.initial_converted_value,
+            "currentConvertedValue": self.current_converted_value,
+            "dynamic": self.dynamic,
+            "convertedDynamic": self.converted_dynamic,
+        }
+
+    def packets(self):
+        """Поля всех пакетов для сохранения в кэше оценок"""
+        return {packet_id: self.packet(packet_id) for packet_id in self.packet_ids}
+
+    def take(self, positions):
+        """Оценка подмножества пакетов по их позициям в массивах"""
+        positions = np.asarray(positions, dtype=np.int64)
+        return PortfolioValuation(
+            packet_ids=[self.packet_ids[position] for position in positions],
+            currency=self.currency,
+            initial_prices=self.initial_prices[positions],
+            current_prices=self.current_prices[positions],
+            initial_values=self.initial_values[positions],
+            current_values=self.current_values[positions],
+            initial_converted_values=self.initial_converted_values[positions],
+            current_converted_values=self.current_converted_values[positions],
+            predicted_values=self.predicted_values[positions],
+        )
+
+    def packet(self, packet_id):
+        """Поля одного пакета для IndexPacketDetailSerializer"""
+        position = self._positions[packet_id]
+        return {
+            "initialPrice": self.initial_prices[position],
+            "currentPrice": self.current_prices[position],
+            "dynamicFromBuyDate": self.dynamics[position],
+            "initialConvertedPrice": self.initial_converted_values[position],
+            "currentConvertedPrice": self.current_converted_values[position],
+            "convertedDynamicFromBuyDate": self.converted_dynamics[position],
+        }
+
+
+def value_packets(packets, currency=None, date=None, days=30):
+    """
+    Оценивает пакеты векторно: цены на даты покупки, на дату оценки и за days дней до неё ищутся
+    одним поиском по колоночной истории цен, пересчёт в валюты — одним проходом по матрице курсов.
+
+    Args:
+        packets: Пакеты с загруженными indexId
+        currency: Валюта пересчёта; None — собственная валюта каждой бумаги
+        date: Дата оценки; None — сегодня
+        days: Период динамики для прогноза стоимости
+
+    Returns:
+        PortfolioValuation
+    """
+    packets = list(packets)
+    count = len(packets)
+    today = to_ordinal(date)
+    past = to_ordinal(datetime.date.fromordinal(today) - datetime.timedelta(days=days))
+
+    packet_ids = [packet.id for packet in packets]
+    quantities = np.array([packet.quantity for packet in packets], dtype=object)
+    index_ids = np.array([packet.indexId_id for packet in packets], dtype=np.int64)
+    own = np.array([currency_registry.code(packet.indexId.ccyId_id) for packet in packets], dtype=object)
+    target = own if currency is None else np.full(count, currency, dtype=object)
+    buy = np.array([to_ordinal(packet.buyDate) for packet in packets], dtype=np.int64)
+
+    # Фиксинги бумаг: [дата покупки | дата оценки | дата оценки - days]
+    fixing_dates, values, value_currencies = price_history.as_of_arrays(
+        np.tile(index_ids, 3),
+        np.concatenate([buy, np.full(count, today), np.full(count, past)]),
+    )
+
+    if currency is None:
+        converted = Fixing.convert_values(values, value_currencies, fixing_dates, np.tile(own, 3))
+        own_prices = converted[:2 * count]
+        target_prices = converted
+    else:
+        converted = Fixing.convert_values(
+            np.concatenate([values[:2 * count], values]),
+            np.concatenate([value_currencies[:2 * count], value_currencies]),
+            np.concatenate([fixing_dates[:2 * count], fixing_dates]),
+            np.concatenate([np.tile(own, 2), np.tile(target, 3)]),
+        )
+        own_prices = converted[:2 * count]
+        target_prices = converted[2 * count:]
+
+    initial_prices, current_prices = own_prices[:count], own_prices[count:]
+    converted_initial, converted_current, converted_past = (
+        target_prices[:count], target_prices[count:2 * count], target_prices[2 * count:]
+    )
+
+    current_converted_values = quantities * converted_current
+    # Прогноз по динамике цены за days дней; без базовой цены стоимость считается неизменной
+    predicted_values = current_converted_values.copy()
+    ok = truthy(converted_past)
+    predicted_values[ok] = current_converted_values[ok] + current_converted_values[ok] * (
+        _dynamics(converted_past[ok], converted_current[ok]) / 100
+    )
+
+    return PortfolioValuation(
+        packet_ids=packet_ids,
+        currency=currency,
+        initial_prices=initial_prices,
+        current_prices=current_prices,
+        initial_values=quantities * initial_prices,
+        current_values=quantities * current_prices,
+        initial_converted_values=quantities * converted_initial,
+        current_converted_values=current_converted_values,
+        predicted_values=predicted_values,
+    )
+
+
+def value_portfolios(portfolio_ids, packets, currency=None, date=None, days=30):
+    """
+    Оценивает пакеты нескольких портфелей одним проходом и раскладывает результат по портфелям.
+
+    Args:
+        portfolio_ids: Портфели, для которых нужен результат (в том числе пустые)
+        packets: Пакеты всех этих портфелей
+
+    Returns:
+        dict: {id портфеля: PortfolioValuation}
+    """
+    packets = list(packets)
+    valuation = value_packets(packets, currency=currency, date=date, days=days)
+
+    positions = {portfolio_id: [] for portfolio_id in portfolio_ids}
+    for position, packet in enumerate(packets):
+        positions.setdefault(packet.portfolioId_id, []).append(position)
+    return {portfolio_id: valuation.take(items) for portfolio_id, items in positions.items()}
+
+
+def history_dates(start_date, end_date, interval="day"):
+    """
+    Даты точек ряда между start_date и end_date включительно: каждый день, либо последний день
+    каждой недели (считая от start_date) или календарного месяца; последняя точка — end_date.
+
+    Returns:
+        np.ndarray: порядковые номера дней
+    """
+    start, end = to_ordinal(start_date), to_ordinal(end_date)
+    if interval == "day":
+        return np.arange(start, end + 1, dtype=np.int64)
+
+    if interval == "week":
+        ends = np.arange(start + 6, end + 1, 7, dtype=np.int64)
+    elif interval == "month":
+        first = datetime.date.fromordinal(start)
+        months = np.arange(np.datetime64(first, "M"), np.datetime64(datetime.date.fromordinal(end), "M") + 1)
+        month_ends = (months + 1).astype("datetime64[D]") - np.timedelta64(1, "D")
+        ends = (month_ends - np.datetime64(first, "D")).astype(np.int64) + start
+        ends = ends[ends <= end]
+    else:
+        raise ValueError(f"Unknown interval {interval}")
+
+    if not len(ends) or ends[-1] != end:
+        ends = np.append(ends, end)
+    return ends
+
+
+def history_points(start_date, end_date, interval="day"):
+    """Количество точек history_dates без построения самого ряда"""
+    start, end = to_ordinal(start_date), to_ordinal(end_date)
+    if end < start:
+        return 0
+    if interval == "day":
+        return end - start + 1
+    if interval == "week":
+        return -(-(end - start + 1) // 7)
+    if interval == "month":
+        first, last = datetime.date.fromordinal(start), datetime.date.fromordinal(end)
+        return (last.year - first.year) * 12 + last.month - first.month + 1
+    raise ValueError(f"Unknown interval {interval}")
+
+
+def value_history(packets, start_date, end_date, currency="USD", interval="day"):
+    """
+    Стоимость портфеля в валюте currency на каждую точку ряда.
+
+    Цены держимых бумаг протягиваются вперёд до каждой даты и пересчитываются в currency по курсу
+    на дату фиксинга (как Index.get_price), после чего стоимость считается одним умножением матрицы
+    (даты × пакеты) на вектор количеств. Пакет входит в портфель с даты покупки.
+
+    Returns:
+        tuple: (порядковые номера дат, стоимости float64)
+    """
+    packets = list(packets)
+    ordinals = history_dates(start_date, end_date, interval)
+    if not packets:
+        return ordinals, np.zeros(len(ordinals))
+
+    index_ids, columns = np.unique([packet.indexId_id for packet in packets], return_inverse=True)
+    converted = price_matrix(index_ids, ordinals, currency)
+
+    buy = np.array([to_ordinal(packet.buyDate) for packet in packets], dtype=np.int64)
+    quantities = np.array([packet.quantity for packet in packets], dtype=np.float64)
+    held = converted[:, columns] * (ordinals[:, None] >= buy[None, :])
+    return ordinals, held @ quantities
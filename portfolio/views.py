@@ -8,9 +8,16 @@ from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 
 from fixings.models import Index, Currency
+from fixings.registry import currency_registry
 from fixings.serializers import CurrencySerializer
+from .caching import get_portfolio_valuations
+from .forecast import DEFAULT_LOOKBACK, DEFAULT_PATHS, MAX_DAYS, MAX_LOOKBACK, MAX_PATHS, simulate_portfolio
 from .models import Portfolio, IndexPacket
+from .risk import DEFAULT_CONFIDENCE, portfolio_risk
 from .serializers import PortfolioListSerializer, PortfolioCardSerializer
+from .valuation import INTERVALS, MAX_HISTORY_POINTS, history_points, value_history
+
+FORECAST_METHODS = ("linear", "montecarlo")
 
 
 class PortfolioListView(APIView):
@@ -19,17 +26,24 @@ class PortfolioListView(APIView):
     def get(self, request):
         currency = request.query_params.get("currency", "USD")
 
-        portfolios = Portfolio.objects.filter(userId=request.user).prefetch_related("packets__indexId")
+        portfolios = list(Portfolio.objects.filter(userId=request.user))
+        # Оценки всех портфелей одним чтением кэша; недостающие — одной векторной оценкой
+        valuations = get_portfolio_valuations(portfolios, currency)
 
         serializer = PortfolioListSerializer(
             portfolios,
             many=True,
-            context={"currency": currency}
+            context={
+                "currency": currency,
+                "valuations": {
+                    (portfolio_id, currency): valuation for portfolio_id, valuation in valuations.items()
+                },
+            }
         )
 
         response = {"portfolios": serializer.data}
 
-        currency_instance = Currency.objects.get(currency=currency)
+        currency_instance = currency_registry.get(currency)
         response["currency"] = CurrencySerializer(currency_instance).data
         return Response(response)
 
@@ -120,12 +134,20 @@ class GetPortfolioPredictionView(APIView):
             currency = request.query_params.get("currency", "USD")
             days = int(request.query_params.get("days", 30))
             
+            method = request.query_params.get("method", "linear")
+            if method not in FORECAST_METHODS:
+                return Response({"error": f"method must be one of {', '.join(FORECAST_METHODS)}"}, status=400)
+
             # Получаем портфель
             portfolio = get_object_or_404(Portfolio, pk=pk, userId=request.user)
-            
+
+            if method == "montecarlo":
+                return self.get_montecarlo(request, portfolio, currency, days)
+
             # Получаем текущую и прогнозируемую стоимость
-            current_value = portfolio.get_current_value(currency=currency)
-            predicted_value = portfolio.get_predicted_value(currency=currency, days=days)
+            valuation = portfolio.get_valuation(currency=currency, days=days)
+            current_value = valuation.current_converted_value
+            predicted_value = valuation.predicted_value
             
             # Рассчитываем процент изменения
             if current_value == 0:
@@ -134,7 +156,7 @@ class GetPortfolioPredictionView(APIView):
                 growth_percent = ((predicted_value - current_value) / current_value) * 100
             
             # Получаем информацию о валюте для отображения символа
-            currency_instance = Currency.objects.get(currency=currency)
+            currency_instance = currency_registry.get(currency)
             
             return Response({
                 "current_value": current_value,
@@ -154,3 +176,170 @@ class GetPortfolioPredictionView(APIView):
                 {"error": "Invalid currency"},
                 status=400
             )
+
+    def get_montecarlo(self, request, portfolio, currency, days):
+        """Прогноз по смоделированным траекториям: перцентили стоимости на горизонте days"""
+        try:
+            paths = int(request.query_params.get("paths", DEFAULT_PATHS))
+            lookback = int(request.query_params.get("lookback", DEFAULT_LOOKBACK))
+            seed = request.query_params.get("seed")
+            seed = None if seed is None else int(seed)
+        except ValueError:
+            return Response({"error": "Invalid paths, lookback or seed parameter"}, status=400)
+        if not 1 <= days <= MAX_DAYS:
+            return Response({"error": f"days must be between 1 and {MAX_DAYS}"}, status=400)
+        if not 100 <= paths <= MAX_PATHS:
+            return Response({"error": f"paths must be between 100 and {MAX_PATHS}"}, status=400)
+        if not 2 <= lookback <= MAX_LOOKBACK:
+            return Response({"error": f"lookback must be between 2 and {MAX_LOOKBACK}"}, status=400)
+
+        currency_instance = currency_registry.get(currency)
+        forecast = simulate_portfolio(
+            portfolio.get_packets(), currency=currency, days=days, paths=paths, lookback=lookback,
+            seed=seed,
+        )
+
+        if forecast.current_value == 0:
+            growth_percent = 0.0
+        else:
+            growth_percent = (forecast.expected_value - forecast.current_value) / forecast.current_value * 100
+
+        return Response({
+            "method": "montecarlo",
+            "current_value": forecast.current_value,
+            "predicted_value": forecast.expected_value,
+            "growth_percent": growth_percent,
+            "percentiles": [
+                {"percentile": percentile, "value": value} for percentile, value in forecast.percentiles.items()
+            ],
+            "loss_probability": forecast.loss_probability,
+            "paths": forecast.paths,
+            "lookback": forecast.lookback,
+            "currency": CurrencySerializer(currency_instance).data,
+            "days": days,
+        })
+
+
+class GetPortfolioHistoryView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, pk):
+        try:
+            currency = request.query_params.get("currency", "USD")
+            interval = request.query_params.get("interval", "day")
+            if interval not in INTERVALS:
+                return Response({"error": f"interval must be one of {', '.join(INTERVALS)}"}, status=400)
+
+            portfolio = get_object_or_404(Portfolio, pk=pk, userId=request.user)
+            packets = list(portfolio.get_packets())
+
+            # По умолчанию — с первой покупки (но не раньше, чем позволяет MAX_HISTORY_POINTS дневных точек)
+            # или за последний год по сегодня
+            end_date = request.query_params.get("end_date")
+            end_date = datetime.date.fromisoformat(end_date) if end_date else datetime.date.today()
+            start_date = request.query_params.get("start_date")
+            if start_date:
+                start_date = datetime.date.fromisoformat(start_date)
+            elif packets:
+                start_date = min(packet.buyDate for packet in packets)
+                if interval == "day":
+                    start_date = max(start_date, end_date - datetime.timedelta(days=MAX_HISTORY_POINTS - 1))
+            else:
+                start_date = end_date - datetime.timedelta(days=365)
+
+            if start_date > end_date:
+                return Response({"error": "start_date must not be later than end_date"}, status=400)
+            if history_points(start_date, end_date, interval) > MAX_HISTORY_POINTS:
+                return Response(
+                    {"error": f"History is limited to {MAX_HISTORY_POINTS} points, use a shorter period or longer interval"},
+                    status=400
+                )
+
+            currency_instance = currency_registry.get(currency)
+            dates, values = value_history(packets, start_date, end_date, currency=currency, interval=interval)
+
+            return Response({
+                "startDate": start_date,
+                "endDate": end_date,
+                "interval": interval,
+                "history": [
+                    {"date": datetime.date.fromordinal(int(date)), "value": float(value)}
+                    for date, value in zip(dates, values)
+                ],
+                "currency": CurrencySerializer(currency_instance).data,
+            })
+
+        except ValueError:
+            return Response(
+                {"error": "Invalid date parameter"},
+                status=400
+            )
+        except Currency.DoesNotExist:
+            return Response(
+                {"error": "Invalid currency"},
+                status=400
+            )
+
+
+class GetPortfolioRiskView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, pk):
+        try:
+            currency = request.query_params.get("currency", "USD")
+            lookback = int(request.query_params.get("lookback", DEFAULT_LOOKBACK))
+            confidence = float(request.query_params.get("confidence", DEFAULT_CONFIDENCE))
+            benchmark = request.query_params.get("benchmark")
+            if not 2 <= lookback <= MAX_LOOKBACK:
+                return Response({"error": f"lookback must be between 2 and {MAX_LOOKBACK}"}, status=400)
+            if not 0.5 <= confidence < 1:
+                return Response({"error": "confidence must be in [0.5, 1)"}, status=400)
+
+            portfolio = get_object_or_404(Portfolio, pk=pk, userId=request.user)
+            if benchmark is not None:
+                benchmark = get_object_or_404(Index, pk=int(benchmark)).id
+
+            currency_instance = currency_registry.get(currency)
+            risk = portfolio_risk(
+                portfolio.get_packets(), currency=currency, lookback=lookback, confidence=confidence,
+                benchmark=benchmark,
+            )
+
+            return Response({
+                "lookback": lookback,
+                "confidence": confidence,
+                "observations": risk.observations,
+                "currentValue": risk.current_value,
+                "volatility": risk.volatility,
+                "historicalVaR": risk.historical_var,
+                "historicalCVaR": risk.historical_cvar,
+                "parametricVaR": risk.parametric_var,
+                "parametricCVaR": risk.parametric_cvar,
+                "maxDrawdown": risk.max_drawdown,
+                "benchmark": benchmark,
+                "beta": risk.beta,
+                "holdings": [
+                    {
+                        "indexId": holding.index.id,
+                        "indexName": holding.index.indexName,
+                        "value": holding.value,
+                        "weight": holding.weight,
+                        "volatility": holding.volatility,
+                        "volatilityContribution": holding.contribution,
+                        "riskShare": holding.share,
+                    }
+                    for holding in risk.holdings
+                ],
+                "currency": CurrencySerializer(currency_instance).data,
+            })
+
+        except ValueError:
+            return Response(
+                {"error": "Invalid lookback, confidence or benchmark parameter"},
+                status=400
+            )
+        except Currency.DoesNotExist:
+            return Response(
+                {"error": "Invalid currency"},
+                status=400
+            )